@@ -39,6 +39,80 @@ class Settings(BaseSettings):
     openai_api_key: str
     openai_model: str = "gpt-4o-mini"
     embedding_model: str = "text-embedding-3-large"
+    embedding_dimensions: Optional[int] = None  # e.g. 256/512/1024 (Matryoshka truncation)
+    embedding_cache_size: int = 2048
+    embedding_cache_ttl_seconds: int = 86400
+    embedding_cache_path: Optional[str] = None  # SQLite file for a persistent cache tier
+    # Content-addressed store of chunk embeddings, so unchanged text is never re-embedded
+    embedding_store_path: Optional[str] = str(base_dir / "data" / "embedding_store.sqlite")
+    embedding_max_concurrency: int = 8
+    embedding_timeout_seconds: float = 10.0
+    embedding_max_retries: int = 4
+    embedding_max_connections: int = 20
+    embedding_batch_window_ms: float = 5.0  # 0 disables query micro-batching
+    embedding_batch_max_size: int = 64
+    # Per-request limits when embedding many texts (API max is 2048 inputs / 300k tokens)
+    embedding_request_max_inputs: int = 512
+    embedding_request_max_tokens: int = 100000
+    
+    # RAG
+    # Vector search backend: "atlas" ($vectorSearch, local index as fallback),
+    # "flat" (exact in-process index) or "ivf" (approximate in-process index)
+    vector_backend: str = "atlas"
+    vector_index_refresh_seconds: int = 60
+    vector_index_path: Optional[str] = None  # persist the ivf index here
+    # Memory-mapped embedding snapshot shared by workers on a host (flat backend)
+    vector_snapshot_path: Optional[str] = str(base_dir / "data" / "kb_snapshot")
+    ivf_nlist: int = 1024
+    ivf_nprobe: int = 16
+    kb_version_check_seconds: int = 10
+    # Embedding storage in kb_chunks: "array", "float32" (packed) or "int8" (quantized;
+    # local vector backends only, full-precision copies are used for rescoring)
+    embedding_storage: str = "array"
+    rescore_factor: int = 4
+    # Retrieval mode: "vector", "lexical" (BM25) or "hybrid" (reciprocal rank fusion).
+    # Opt in with RETRIEVAL_MODE=hybrid: identifier queries then skip the embedding call.
+    retrieval_mode: str = "vector"
+    hybrid_num_candidates: int = 20
+    rrf_k: int = 60
+    lexical_short_circuit: bool = True  # skip embeddings when identifiers match exactly
+    # Ingestion pipeline: parse in a process pool, embed concurrently, bulk-insert
+    ingest_workers: int = 0  # parser processes, 0 = one per CPU
+    ingest_embed_concurrency: int = 4  # documents being embedded at once
+    ingest_queue_size: int = 8  # documents buffered between stages
+    ingest_write_batch_size: int = 500  # chunks per insert_many
+    ingest_stream_threshold_mb: int = 20  # larger files are streamed instead of chunked whole
+    kb_raw_text_max_chars: int = 200000  # text kept on kb_docs.rawText (chunks hold the full text)
+    # Near-duplicate chunks (MinHash/LSH): "link" stores them without an embedding,
+    # pointing at the canonical chunk; "skip" drops them; "off" disables detection
+    dedup_mode: str = "link"
+    dedup_threshold: float = 0.9  # estimated Jaccard similarity of word 5-grams
+    dedup_num_perm: int = 128
+    dedup_shingle_size: int = 5
+    # Background ingestion jobs
+    ingest_job_poll_seconds: float = 2.0
+    ingest_job_heartbeat_seconds: float = 10.0
+    ingest_job_stale_seconds: float = 60.0  # running jobs without a heartbeat this long are resumed
+    
+    # Semantic answer cache (knowledge answers reused for near-identical questions)
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_size: int = 1000
+    semantic_cache_ttl_seconds: int = 3600
+    
+    # Exact-match LLM response cache for deterministic call sites (comma-separated; empty disables)
+    llm_cache_sites: str = "classify_intent,extract_ticket_fields,extract_ticket_id"
+    llm_cache_size: int = 2048
+    llm_cache_ttl_seconds: int = 3600
+    llm_cache_path: Optional[str] = None  # SQLite file for a persistent cache tier
+    
+    # Intent classification: "local" tries rules and embedding centroids before the LLM, "llm" always asks the LLM
+    intent_classifier: str = "local"
+    intent_centroid_min_similarity: float = 0.3
+    intent_centroid_min_margin: float = 0.05  # tune with: python -m packages.orchestrator.intent
+    speculative_retrieval: bool = True  # start knowledge retrieval while the intent is being classified
+    context_token_budget: int = 1500  # tokens of KB snippets in the answer synthesis prompt
+    context_min_snippet_tokens: int = 50  # don't add a trimmed snippet shorter than this
     
     # Azure AD
     azure_ad_client_id: Optional[str] = None
@@ -54,6 +128,14 @@ class Settings(BaseSettings):
     # n8n
     n8n_webhook_ticket_created: Optional[str] = None
     n8n_webhook_escalate: Optional[str] = None
+    # Webhooks are queued in the Mongo outbox and delivered by a background dispatcher
+    webhook_timeout_seconds: float = 5.0
+    webhook_max_connections: int = 10
+    webhook_batch_size: int = 20  # events claimed per round, each still POSTed separately
+    webhook_poll_seconds: float = 2.0
+    webhook_max_attempts: int = 8  # then the event is dead-lettered
+    webhook_backoff_seconds: float = 2.0  # doubled per attempt
+    webhook_max_backoff_seconds: float = 600.0
     
     # ServiceNow
     servicenow_instance_url: Optional[str] = None
@@ -78,6 +160,14 @@ class Settings(BaseSettings):
     # Feature Flags
     use_mock_integrations: bool = True
     enable_audit_logs: bool = True
+    # Audit events are queued and written in batches off the request path
+    audit_queue_size: int = 10000
+    audit_batch_size: int = 200
+    audit_flush_seconds: float = 1.0
+    audit_overflow_policy: str = "drop_oldest"  # drop_oldest, block or spill (when the queue is full)
+    # Each process adds hostname and PID to the name and adopts files of dead PIDs on its own host only.
+    # Containers sharing this directory need stable hostnames, or their leftover files are never adopted
+    audit_spill_path: Optional[str] = str(base_dir / "data" / "audit_spill.jsonl")
     rate_limit_requests_per_min: int = 20
     
     class Config:
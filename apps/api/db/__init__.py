@@ -7,6 +7,8 @@ from .models import (
     KBDoc,
     KBChunk,
     Ticket,
+    IngestJob,
+    OutboxEvent,
     AuditLog,
     Connector
 )
@@ -21,6 +23,8 @@ __all__ = [
     "KBDoc",
     "KBChunk",
     "Ticket",
+    "IngestJob",
+    "OutboxEvent",
     "AuditLog",
     "Connector"
 ]
@@ -52,14 +52,27 @@ async def create_indexes():
     await database.messages.create_index("sessionId")
     await database.messages.create_index([("sessionId", 1), ("createdAt", 1)])
     
+    # KB Docs (looked up by source during incremental sync)
+    await database.kb_docs.create_index("source")
+    
     # KB Chunks - Vector Search index (created via Atlas UI or CLI)
     await database.kb_chunks.create_index("docId")
     await database.kb_chunks.create_index([("docId", 1), ("chunkIndex", 1)])
+    await database.kb_chunks.create_index("duplicateOf", sparse=True)
     
     # Tickets
     await database.tickets.create_index([("system", 1), ("externalId", 1)], unique=True)
     await database.tickets.create_index("openedBy")
     
+    # Ingestion jobs
+    await database.ingest_jobs.create_index([("status", 1), ("createdAt", 1)])
+    await database.ingest_job_files.create_index([("jobId", 1), ("source", 1)], unique=True)
+    await database.ingest_job_files.create_index([("jobId", 1), ("updatedAt", -1)])
+    
+    # Webhook outbox (delivered events expire after a week; dead letters are kept)
+    await database.outbox.create_index([("status", 1), ("nextAttemptAt", 1)])
+    await database.outbox.create_index("deliveredAt", expireAfterSeconds=7 * 24 * 3600)
+    
     # Audit Logs
     await database.audit_logs.create_index("sessionId")
     await database.audit_logs.create_index("userId")
@@ -1,5 +1,5 @@
 """MongoDB document models/schemas."""
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
 from datetime import datetime
 from bson import ObjectId
 from pydantic import BaseModel, Field, EmailStr
@@ -85,7 +85,12 @@ class KBDoc(BaseModel):
     url: Optional[str] = None
     tags: List[str] = Field(default_factory=list)
     rawText: str
+    # Source fingerprint for incremental sync
+    contentHash: Optional[str] = None
+    mtime: Optional[float] = None
+    size: Optional[int] = None
     createdAt: datetime = Field(default_factory=datetime.utcnow)
+    updatedAt: Optional[datetime] = None
     
     class Config:
         populate_by_name = True
@@ -98,9 +103,13 @@ class KBChunk(BaseModel):
     docId: PyObjectId
     chunkIndex: int
     text: str
-    embedding: List[float] = Field(default_factory=list)
+    embedding: Union[List[float], bytes] = Field(default_factory=list)  # array or packed BSON vector
+    embeddingScale: Optional[float] = None  # int8 storage only
+    embeddingOffset: Optional[float] = None  # int8 storage only
     tokens: int = 0
     metadata: Dict[str, Any] = Field(default_factory=dict)
+    minhash: Optional[bytes] = None  # MinHash signature (canonical chunks)
+    duplicateOf: Optional[PyObjectId] = None  # canonical chunk of a linked near-duplicate
     
     class Config:
         populate_by_name = True
@@ -126,6 +135,48 @@ class Ticket(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+class IngestJob(BaseModel):
+    """Background KB ingestion job (per-file progress lives in ingest_job_files)."""
+    id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
+    directory: str
+    incremental: bool = True
+    status: str = "queued"  # queued, running, completed, failed, cancelled
+    createdBy: Optional[PyObjectId] = None
+    totalFiles: int = 0
+    summary: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cancelRequested: bool = False
+    attempts: int = 0
+    claimedBy: Optional[str] = None  # worker running the current attempt (host:pid)
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+    startedAt: Optional[datetime] = None
+    heartbeatAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
+    
+    class Config:
+        populate_by_name = True
+        json_encoders = {ObjectId: str}
+
+
+class OutboxEvent(BaseModel):
+    """Webhook notification waiting for (or done with) delivery by the outbox dispatcher."""
+    id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
+    event: str  # ticket_created, escalate
+    url: str
+    payload: Dict[str, Any] = Field(default_factory=dict)
+    status: str = "pending"  # pending, delivering, delivered, dead
+    attempts: int = 0
+    lastError: Optional[str] = None
+    nextAttemptAt: datetime = Field(default_factory=datetime.utcnow)
+    leaseUntil: Optional[datetime] = None
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+    deliveredAt: Optional[datetime] = None
+    
+    class Config:
+        populate_by_name = True
+        json_encoders = {ObjectId: str}
+
+
 class AuditLog(BaseModel):
     """Audit log model."""
     id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
@@ -1,11 +1,14 @@
 """FastAPI main application."""
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from bson import ObjectId
+import asyncio
+import json
+import time
 
 from config import settings
 from db import init_database, get_database, close_database
@@ -29,6 +32,7 @@ sys.path.insert(0, str(packages_path))
 sys.path.insert(0, str(project_root))
 
 from packages.orchestrator.graph import get_orchestrator, invoke_orchestrator
+from packages.orchestrator.latency import get_chat_latency
 from packages.clients import TicketSystemAdapter, MockTicketClient, ServiceNowClient
 try:
     from packages.clients import JiraClient
@@ -90,11 +94,38 @@ class TicketResponse(BaseModel):
 async def startup():
     """Initialize database on startup."""
     await init_database()
+    
+    # Build in-process retrieval indexes (BM25, local vector index) before serving
+    from packages.rag.retriever import warm_indexes
+    try:
+        await warm_indexes()
+    except Exception as e:
+        print(f"Error warming retrieval indexes: {e}")
+    
+    # Background ingestion worker (also resumes jobs interrupted by a restart)
+    from packages.rag.jobs import get_ingest_job_runner
+    await get_ingest_job_runner().start()
+    
+    # Audit events are written in batches by a background task
+    from packages.orchestrator.audit import get_audit_sink
+    await get_audit_sink().start()
+    
+    # n8n webhooks are delivered from the outbox by a background dispatcher
+    from packages.orchestrator.outbox import get_outbox
+    await get_outbox().start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
     """Close database on shutdown."""
+    from packages.rag.embedding_service import close_embedding_service
+    from packages.rag.jobs import get_ingest_job_runner
+    from packages.orchestrator.audit import get_audit_sink
+    from packages.orchestrator.outbox import get_outbox
+    await get_ingest_job_runner().stop()
+    await get_outbox().stop()
+    await get_audit_sink().stop()  # drains queued events while the database is still open
+    await close_embedding_service()
     await close_database()
 
 
@@ -170,12 +201,9 @@ async def get_me(current_user: User = Depends(get_current_user)):
     }
 
 
-# Chat endpoint
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):  # Removed auth requirement - anyone can chat
-    """Main chat endpoint - no authentication required."""
-    database = await get_database()
-    
+# Chat endpoints
+async def _start_chat_turn(database, request: ChatRequest):
+    """Resolve the guest user and session, and save the user message."""
     # Use guest user
     guest_email = "guest@user.com"
     current_user = await get_user_by_email(guest_email)
@@ -207,21 +235,19 @@ async def chat(request: ChatRequest):  # Removed auth requirement - anyone can c
     user_msg_dict = user_message.model_dump(by_alias=True, exclude={"id"})
     await database.messages.insert_one(user_msg_dict)
     
-    # Invoke orchestrator
-    try:
-        result = await invoke_orchestrator(
-            message=request.message,
-            user_email=current_user.email,
-            session_id=str(session_id)
-        )
-    except Exception as e:
-        print(f"Error in orchestrator: {e}")
-        result = {
-            "answer": "I encountered an error processing your request. Please try again or contact support.",
-            "intent": "handoff"
-        }
-    
-    # Save assistant message
+    return current_user, session_id
+
+
+def _error_result() -> Dict[str, Any]:
+    """Answer saved and shown when the orchestrator fails."""
+    return {
+        "answer": "I encountered an error processing your request. Please try again or contact support.",
+        "intent": "handoff"
+    }
+
+
+async def _save_assistant_message(database, session_id: ObjectId, result: Dict[str, Any]) -> ObjectId:
+    """Save the assistant's answer and touch the session. Returns the message id."""
     assistant_message = Message(
         sessionId=session_id,
         role="assistant",
@@ -233,13 +259,37 @@ async def chat(request: ChatRequest):  # Removed auth requirement - anyone can c
         }
     )
     assistant_msg_dict = assistant_message.model_dump(by_alias=True, exclude={"id"})
-    await database.messages.insert_one(assistant_msg_dict)
+    inserted = await database.messages.insert_one(assistant_msg_dict)
     
     # Update session
     await database.sessions.update_one(
         {"_id": session_id},
         {"$set": {"updatedAt": datetime.utcnow()}}
     )
+    return inserted.inserted_id
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):  # Removed auth requirement - anyone can chat
+    """Main chat endpoint - no authentication required."""
+    database = await get_database()
+    current_user, session_id = await _start_chat_turn(database, request)
+    started = time.perf_counter()
+    
+    # Invoke orchestrator
+    try:
+        result = await invoke_orchestrator(
+            message=request.message,
+            user_email=current_user.email,
+            session_id=str(session_id)
+        )
+    except Exception as e:
+        print(f"Error in orchestrator: {e}")
+        result = _error_result()
+    # Nothing reaches the user before the full answer
+    get_chat_latency().record("chat_total", time.perf_counter() - started)
+    
+    await _save_assistant_message(database, session_id, result)
     
     return ChatResponse(
         answer=result.get("answer", ""),
@@ -250,6 +300,79 @@ async def chat(request: ChatRequest):  # Removed auth requirement - anyone can c
     )
 
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Chat with the answer streamed as server-sent events.
+    
+    Events: ``intent``, then ``sources`` once retrieval is done, then ``token``
+    events with answer text, then ``done`` with the saved message id (or
+    ``error`` followed by ``done`` if generation failed midway). If the client
+    disconnects midway, the part of the answer it was sent is saved.
+    """
+    database = await get_database()
+    current_user, session_id = await _start_chat_turn(database, request)
+    orchestrator = await get_orchestrator()
+    started = time.perf_counter()
+    
+    async def events():
+        latency = get_chat_latency()
+        result = _error_result()  # replaced by the orchestrator's result event
+        finished = False
+        sent = {"answer": ""}  # what the client has been shown so far
+        first_token = False
+        try:
+            try:
+                async for event in orchestrator.stream(request.message, current_user.email, str(session_id)):
+                    if event["event"] == "result":
+                        result = event["data"]
+                        finished = True
+                        continue
+                    if event["event"] == "token":
+                        if not first_token:
+                            first_token = True
+                            latency.record("stream_ttft", time.perf_counter() - started)
+                        sent["answer"] += event["data"].get("text", "")
+                    elif event["event"] in ("intent", "sources"):
+                        sent.update(event["data"])
+                    yield _sse(event["event"], event["data"])
+                if not finished:
+                    print("Orchestrator stream ended without a result")
+            except Exception as e:
+                print(f"Error in orchestrator stream: {e}")
+                result = _error_result()
+                finished = True
+                yield _sse("error", {"message": result["answer"]})
+            latency.record("stream_total", time.perf_counter() - started)
+        finally:
+            if not finished and sent["answer"]:
+                # The client went away mid-answer: keep the part it was shown
+                result = {
+                    "answer": sent["answer"],
+                    "intent": sent.get("intent"),
+                    "sources": sent.get("sources", []),
+                    "tool_calls": sent.get("toolCalls", [])
+                }
+            # Shielded: a disconnect cancels this generator, but the turn is still saved
+            message_id = await asyncio.shield(_save_assistant_message(database, session_id, result))
+        yield _sse("done", {
+            "messageId": str(message_id),
+            "sessionId": str(session_id),
+            "intent": result.get("intent"),
+            "toolCalls": result.get("tool_calls", [])
+        })
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/sessions/{session_id}/messages")
 async def get_session_messages(session_id: str, current_user: User = Depends(get_current_user)):
     """Get messages for a session."""
@@ -308,23 +431,144 @@ async def get_ticket(external_id: str, current_user: User = Depends(get_current_
 @app.post("/admin/ingest")
 async def ingest_kb(
     directory: Optional[str] = None,
+    incremental: bool = True,
     current_user: User = Depends(get_current_user)
 ):
-    """Ingest knowledge base documents."""
+    """Queue a knowledge base ingestion job and return its id immediately.
+    
+    Incremental mode (default) only re-processes new or changed files and
+    removes documents whose files were deleted; ``incremental=false`` ingests
+    every file again as new documents. Poll ``GET /admin/ingest/{job_id}``
+    for progress.
+    """
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
     if not directory:
         # Default to seeds/kb
         directory = str(Path(__file__).parent.parent.parent / "seeds" / "kb")
+    if not Path(directory).is_dir():
+        raise HTTPException(status_code=400, detail=f"Directory not found: {directory}")
+    
+    from packages.rag.jobs import get_ingest_job_runner
+    
+    job_id = await get_ingest_job_runner().submit(directory, incremental=incremental, user_id=current_user.id)
+    return {"message": "Ingestion job queued", "jobId": job_id, "status": "queued"}
+
+
+@app.get("/admin/ingest")
+async def list_ingest_jobs(limit: int = 20, current_user: User = Depends(get_current_user)):
+    """List recent ingestion jobs."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    from packages.rag.ingestion import ingest_directory
+    from packages.rag.jobs import get_ingest_job_runner
+    
+    return {"jobs": await get_ingest_job_runner().recent(limit)}
+
+
+@app.get("/admin/ingest/{job_id}")
+async def get_ingest_job(job_id: str, files_limit: int = 100, current_user: User = Depends(get_current_user)):
+    """Ingestion job status with per-file progress, throughput and errors."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    
+    from packages.rag.jobs import get_ingest_job_runner
+    
+    job = await get_ingest_job_runner().get(job_id, files_limit=files_limit)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/admin/ingest/{job_id}/cancel")
+async def cancel_ingest_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Cancel a queued or running ingestion job."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    
+    from packages.rag.jobs import get_ingest_job_runner
+    
+    job = await get_ingest_job_runner().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] in ("completed", "failed"):
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return job
+
+
+@app.get("/admin/kb/duplicates")
+async def get_kb_duplicates(limit: int = 50, current_user: User = Depends(get_current_user)):
+    """Near-duplicate report: canonical chunks with the most linked copies."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    from packages.rag.dedup import duplicate_report
+    
+    database = await get_database()
+    return await duplicate_report(database, limit=limit)
+
+
+@app.get("/admin/outbox")
+async def get_outbox_status(current_user: User = Depends(get_current_user)):
+    """Webhook outbox: events by status, delivery metrics and recent dead letters."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    from packages.orchestrator.outbox import get_outbox
+    
+    return await get_outbox().stats()
+
+
+@app.post("/admin/outbox/{event_id}/retry")
+async def retry_outbox_event(event_id: str, current_user: User = Depends(get_current_user)):
+    """Requeue a dead-lettered webhook event."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    from packages.orchestrator.outbox import get_outbox
     
     try:
-        doc_ids = await ingest_directory(directory)
-        return {"message": f"Ingested {len(doc_ids)} documents", "doc_ids": doc_ids}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error ingesting: {str(e)}")
+        retried = await get_outbox().retry(event_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid event ID")
+    if not retried:
+        raise HTTPException(status_code=404, detail="Dead-lettered event not found")
+    return {"id": event_id, "status": "pending"}
+
+
+@app.get("/admin/metrics")
+async def get_metrics(current_user: User = Depends(get_current_user)):
+    """Cache and pipeline metrics."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    from packages.rag.embeddings import get_embedding_cache_stats
+    from packages.rag.embedding_service import get_embedding_service
+    from packages.rag.batching import get_query_batcher
+    from packages.rag.dedup import get_dedup_index
+    from packages.orchestrator.audit import get_audit_sink
+    from packages.rag.context import get_context_packer
+    
+    orchestrator = await get_orchestrator()
+    
+    return {
+        "embedding_cache": get_embedding_cache_stats(),
+        "embedding_service": get_embedding_service().stats(),
+        "query_batching": get_query_batcher().stats(),
+        "dedup": get_dedup_index().stats(),
+        "semantic_cache": orchestrator.semantic_cache.stats() if orchestrator.semantic_cache else None,
+        "llm_cache": orchestrator.llm.stats(),
+        "intent_classifier": orchestrator.intent_classifier.stats() if orchestrator.intent_classifier else None,
+        "speculative_retrieval": orchestrator.speculation_stats(),
+        "chat_latency": get_chat_latency().stats(),
+        "context_packing": get_context_packer().stats(),
+        "audit_sink": get_audit_sink().stats()
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,330 @@
+"""Buffered audit log writer that keeps MongoDB inserts off the request path.
+
+Events are queued in memory and written to ``audit_logs`` with
+``insert_many`` when a batch fills up or the flush interval passes. When the
+queue is full the overflow policy decides what happens to new events:
+
+    drop_oldest  discard the oldest queued event (requests never wait)
+    block        make the caller wait for room (no loss, adds latency)
+    spill        append the event to a local JSON-lines file, replayed into
+                 the queue once it has room again
+
+Each process spills to its own file (hostname and PID are added to the
+configured name); on start a sink takes over the files of processes on its
+host that are gone. Files written on other hosts sharing the directory are
+left alone, since their PIDs can't be checked from here.
+"""
+from typing import Dict, Any, List, Optional
+from collections import deque
+from pathlib import Path
+import asyncio
+import os
+import socket
+import sys
+import time
+
+# Add apps/api to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError
+from config import settings
+from db import get_database
+from packages.orchestrator.latency import LatencyTracker
+
+
+OVERFLOW_POLICIES = ("drop_oldest", "block", "spill")
+DUPLICATE_KEY = 11000
+
+
+class AuditSink:
+    """Queues audit documents and writes them in batches from a background task."""
+    
+    def __init__(
+        self,
+        max_queue: int = 10000,
+        batch_size: int = 200,
+        flush_seconds: float = 1.0,
+        overflow: str = "drop_oldest",
+        spill_path: Optional[str] = None
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown audit overflow policy: {overflow}")
+        if overflow == "spill" and not spill_path:
+            raise ValueError("The spill overflow policy needs a spill path")
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self._spill_file: Optional[str] = None
+        self._spill_tag = f"{socket.gethostname()}-{os.getpid()}"
+        if spill_path:
+            path = Path(spill_path)
+            self._spill_file = str(path.with_name(f"{path.stem}.{self._spill_tag}{path.suffix}"))
+        self._queue: deque = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self.latency = LatencyTracker()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.blocked = 0
+        self.flush_errors = 0
+        self.max_depth = 0
+    
+    async def start(self):
+        """Start the background writer (and replay events spilled by an earlier run)."""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Event()
+            try:
+                self._adopt_spills()
+                self._replay_spill()
+            except OSError as e:
+                print(f"Error replaying spilled audit events: {e}")
+            self._task = asyncio.create_task(self._loop())
+    
+    async def stop(self):
+        """Stop the writer and drain the queue; whatever can't be written is spilled or reported lost."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while self._queue:
+            if not await self._flush():
+                break
+        if self._queue:
+            if self.spill_path:
+                self._spill(list(self._queue))
+            else:
+                print(f"Audit sink lost {len(self._queue)} events on shutdown")
+                self.dropped += len(self._queue)
+            self._queue.clear()
+        if self._space is not None:
+            self._space.set()  # release blocked writers
+    
+    async def write(self, doc: Dict[str, Any]):
+        """Queue an audit document. Returns immediately unless the policy is ``block`` and the queue is full."""
+        # Assigned here so a retried batch can't insert an event twice
+        doc.setdefault("_id", ObjectId())
+        if self._task is None:
+            # Not started (scripts, CLI tools): write through
+            database = await get_database()
+            await database.audit_logs.insert_one(doc)
+            self.written += 1
+            return
+        
+        if len(self._queue) >= self.max_queue:
+            if self.overflow == "spill":
+                self._spill([doc])
+                return
+            if self.overflow == "drop_oldest":
+                self._queue.popleft()
+                self.dropped += 1
+            else:
+                self.blocked += 1
+                while len(self._queue) >= self.max_queue and self._task is not None:
+                    self._space.clear()
+                    await self._space.wait()
+                if self._task is None:
+                    return await self.write(doc)  # stopped while waiting
+        
+        self._queue.append(doc)
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, len(self._queue))
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+    
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while self._queue:
+                    if not await self._flush():
+                        break  # Mongo unavailable: retry on the next tick
+                if len(self._queue) < self.max_queue // 2 and self._spill_file and os.path.exists(self._spill_file):
+                    self._replay_spill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Audit sink error: {e}")
+    
+    async def _flush(self) -> bool:
+        """Write up to one batch. Returns False when the write failed and the batch was requeued."""
+        batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        if self._space is not None:
+            self._space.set()
+        started = time.perf_counter()
+        try:
+            database = await get_database()
+            await database.audit_logs.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Duplicates were written by an earlier attempt; retry the rest
+            failed = [err["index"] for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY]
+            self.written += len(batch) - len(failed)
+            if failed:
+                self._requeue([batch[i] for i in failed], e)
+                return False
+        except Exception as e:
+            self._requeue(batch, e)
+            return False
+        else:
+            self.written += len(batch)
+        self.latency.record("flush", time.perf_counter() - started)
+        return True
+    
+    def _requeue(self, batch: List[Dict[str, Any]], error: Exception):
+        self.flush_errors += 1
+        print(f"Error writing {len(batch)} audit events: {error}")
+        self._queue.extendleft(reversed(batch))
+    
+    def _spill(self, docs: List[Dict[str, Any]]):
+        """Append documents to this process's spill file."""
+        Path(self._spill_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(self._spill_file, "a", encoding="utf-8") as f:
+            for doc in docs:
+                f.write(json_util.dumps(doc) + "\n")
+        self.spilled += len(docs)
+    
+    def _orphaned(self, tag: str, claim: bool = False) -> bool:
+        """Whether the spill file tagged ``tag`` (host-PID, or a bare PID from older versions) has no live owner.
+        
+        Our own spill file is not an orphan, but a claim file with our tag is:
+        a previous run with the same PID (common in containers) left it behind.
+        """
+        if tag == self._spill_tag:
+            return claim
+        host, _, pid = tag.rpartition("-")
+        if host not in ("", socket.gethostname()) or not pid.isdigit():
+            return False
+        return int(pid) == os.getpid() or not _process_alive(int(pid))
+    
+    def _adopt_spills(self):
+        """Append the spill files of exited processes (and the legacy shared file) to ours."""
+        if not self.spill_path:
+            return
+        path = Path(self.spill_path)
+        prefix, suffix = len(path.stem) + 1, len(path.suffix)
+        orphans = [path] if path.exists() else []
+        for candidate in path.parent.glob(f"{path.stem}.*{path.suffix}"):
+            if self._orphaned(candidate.name[prefix:-suffix]):
+                orphans.append(candidate)
+        # Claim files of sinks that died while adopting: lines they had already
+        # copied are replayed twice, which beats losing the rest
+        for candidate in path.parent.glob(f"{path.stem}.*{path.suffix}.adopting"):
+            if self._orphaned(candidate.name[prefix:-suffix - len(".adopting")], claim=True):
+                orphans.append(candidate)
+        # A replay cut short leaves a partial copy; the spill file itself is intact
+        for candidate in path.parent.glob(f"{path.stem}.*{path.suffix}.remaining"):
+            if self._orphaned(candidate.name[prefix:-suffix - len(".remaining")], claim=True):
+                candidate.unlink(missing_ok=True)
+        
+        for orphan in orphans:
+            # Renaming claims the file: another worker adopting it at the same time gets FileNotFoundError
+            claimed = f"{self._spill_file}.adopting"
+            try:
+                os.replace(orphan, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, "r", encoding="utf-8") as src, open(self._spill_file, "a", encoding="utf-8") as dst:
+                for line in src:
+                    dst.write(line)
+            os.remove(claimed)
+            print(f"Adopted spilled audit events from {orphan.name}")
+    
+    def _replay_spill(self):
+        """Move spilled events back into the queue, as many as it has room for; the rest stay spilled."""
+        if not self._spill_file or not os.path.exists(self._spill_file):
+            return
+        room = self.max_queue - len(self._queue)
+        if room <= 0:
+            return
+        docs = []
+        remaining = f"{self._spill_file}.remaining"
+        kept = malformed = 0
+        with open(self._spill_file, "r", encoding="utf-8") as f, open(remaining, "w", encoding="utf-8") as rest:
+            for line in f:
+                if not line.strip():
+                    continue
+                if len(docs) < room:
+                    try:
+                        docs.append(json_util.loads(line))
+                    except ValueError:
+                        malformed += 1  # e.g. cut off when a process died mid-write
+                else:
+                    rest.write(line)
+                    kept += 1
+        if kept:
+            os.replace(remaining, self._spill_file)
+        else:
+            os.remove(remaining)
+            os.remove(self._spill_file)
+        self._queue.extend(docs)
+        self.replayed += len(docs)
+        self.max_depth = max(self.max_depth, len(self._queue))
+        if docs:
+            print(f"Replaying {len(docs)} spilled audit events ({kept} still spilled)")
+        if malformed:
+            print(f"Skipped {malformed} malformed spilled audit events")
+            self.dropped += malformed
+    
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, loss counters and flush latency."""
+        return {
+            "running": self._task is not None,
+            "overflow": self.overflow,
+            "queue_depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "blocked": self.blocked,
+            "flush_errors": self.flush_errors,
+            "flush_latency": self.latency.stats().get("flush")
+        }
+
+
+def _process_alive(pid: int) -> bool:
+    """Whether a local process is running (assumed so where that can't be checked)."""
+    if os.name == "nt":
+        return True  # os.kill would terminate it
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists but belongs to another user
+    return True
+
+
+# Global sink instance (one per process)
+_audit_sink: Optional[AuditSink] = None
+
+
+def get_audit_sink() -> AuditSink:
+    """Get the process-wide audit sink."""
+    global _audit_sink
+    if _audit_sink is None:
+        _audit_sink = AuditSink(
+            max_queue=settings.audit_queue_size,
+            batch_size=settings.audit_batch_size,
+            flush_seconds=settings.audit_flush_seconds,
+            overflow=settings.audit_overflow_policy,
+            spill_path=settings.audit_spill_path
+        )
+    return _audit_sink
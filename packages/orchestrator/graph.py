@@ -1,11 +1,13 @@
 """LangGraph orchestrator for IT Helpdesk Copilot."""
 import sys
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, AsyncIterator, Tuple
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
+import asyncio
 import json
+import time
 
 # Add parent directories to path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
@@ -13,7 +15,15 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
 from config import settings
 from db import get_database
 from db.models import AuditLog
-from packages.rag.retriever import retrieve_kb
+from packages.rag.retriever import retrieve_kb, retrieve_kb_exact
+from packages.rag.embeddings import embed_query
+from packages.rag.versioning import get_kb_version
+from packages.rag.context import get_context_packer, count_tokens
+from packages.orchestrator.semantic_cache import SemanticCache
+from packages.orchestrator.llm_cache import cached_llm
+from packages.orchestrator.audit import get_audit_sink
+from packages.orchestrator.outbox import get_outbox
+from packages.orchestrator.intent import INTENTS, IntentClassifier, match_rules
 from packages.clients import TicketSystemAdapter, MockTicketClient, ServiceNowClient, MockM365Client
 try:
     from packages.clients import M365Client
@@ -27,6 +37,8 @@ from packages.orchestrator.prompts import (
     SYSTEM_PROMPT,
     get_classifier_prompt,
     get_answer_synthesis_prompt,
+    get_general_knowledge_prompt,
+    get_movie_answer_prompt,
     get_tool_extraction_prompt
 )
 
@@ -39,11 +51,11 @@ class ITHelpdeskOrchestrator:
         ticket_client: Optional[TicketSystemAdapter] = None,
         m365_client: Optional[M365Client] = None
     ):
-        self.llm = ChatOpenAI(
+        self.llm = cached_llm(ChatOpenAI(
             model=settings.openai_model,
             temperature=0.2,
             api_key=settings.openai_api_key
-        )
+        ))
         
         # Initialize clients (mock or real)
         if settings.use_mock_integrations:
@@ -66,120 +78,160 @@ class ITHelpdeskOrchestrator:
                 self.m365_client = M365Client()
             else:
                 self.m365_client = MockM365Client()
+        
+        self.semantic_cache = SemanticCache(
+            threshold=settings.semantic_cache_threshold,
+            max_entries=settings.semantic_cache_size,
+            ttl_seconds=settings.semantic_cache_ttl_seconds
+        ) if settings.semantic_cache_enabled else None
+        
+        self.intent_classifier = IntentClassifier(
+            min_similarity=settings.intent_centroid_min_similarity,
+            min_margin=settings.intent_centroid_min_margin
+        ) if settings.intent_classifier == "local" else None
+        
+        # Knowledge retrieval started alongside intent classification
+        self.speculation = {"started": 0, "used": 0, "discarded": 0, "discarded_completed": 0, "wasted_seconds": 0.0, "saved_seconds": 0.0}
     
-    async def classify_intent(self, message: str, user_email: str) -> str:
-        """Classify user intent."""
+    async def llm_classify_intent(self, message: str) -> str:
+        """Classify user intent with the LLM."""
         prompt = get_classifier_prompt(message)
         
-        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+        response = await self.llm.ainvoke([HumanMessage(content=prompt)], site="classify_intent")
         
         intent = response.content.strip().lower()
         
         # Validate intent
-        valid_intents = ["knowledge", "create_ticket", "ticket_status", "password_reset", "handoff"]
-        if intent not in valid_intents:
+        if intent not in INTENTS:
             # Default to knowledge if unclear
             intent = "knowledge"
+        return intent
+    
+    async def classify_intent(self, message: str, user_email: str) -> str:
+        """Classify user intent, locally when confident and with the LLM otherwise."""
+        result = {"intent": None, "tier": "llm", "confidence": None}
+        if self.intent_classifier is not None:
+            result = await self.intent_classifier.classify(message)
+        intent, tier = result["intent"], result["tier"]
+        if intent is None:
+            intent, tier = await self.llm_classify_intent(message), "llm"
+        if self.intent_classifier is not None:
+            self.intent_classifier.record(tier)
         
         # Log classification
         if settings.enable_audit_logs:
             await self._log_audit("intent_classified", {
                 "message": message[:200],  # Truncate for privacy
                 "intent": intent,
+                "tier": tier,
+                "confidence": result["confidence"],
                 "user_email": user_email
             })
         
         return intent
     
-    async def handle_knowledge(self, query: str, user_email: str) -> Dict[str, Any]:
-        """Handle knowledge base queries."""
-        try:
-            # Check if query is about movies (sample_mflix database)
-            movie_keywords = ["movie", "film", "actor", "director", "genre", "rating", "imdb", "plot", "cast"]
-            is_movie_query = any(keyword in query.lower() for keyword in movie_keywords)
-            
-            if is_movie_query:
-                # Use sample_mflix database
-                try:
-                    # Import MflixRetriever - need to add path
-                    from pathlib import Path as PathLib
-                    api_path = PathLib(__file__).parent.parent.parent / "apps" / "api"
-                    if str(api_path) not in sys.path:
-                        sys.path.insert(0, str(api_path))
-                    
-                    from packages.rag.mflix_retriever import MflixRetriever
-                    
-                    retriever = MflixRetriever()
-                    movies = await retriever.search_movies(query, limit=6)
-                    
-                    if movies:
-                        # Format movies for response
-                        movies_text = "\n\n".join([
-                            f"**{m['title']}** ({m.get('year', 'N/A')})\n"
-                            f"Genres: {', '.join(m.get('genres', []))}\n"
-                            f"Plot: {m.get('plot', 'N/A')[:200]}..."
-                            for m in movies
-                        ])
-                        
-                        prompt = f"""Based on the following movies from our database, answer the user's question about movies:
-
-{movies_text}
-
-User question: {query}
-
-Provide a helpful answer about these movies."""
-                        
-                        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
-                        answer = response.content.strip()
-                        
-                        return {
-                            "answer": answer,
-                            "sources": [{"title": m["title"], "year": m.get("year")} for m in movies],
-                            "intent": "knowledge",
-                            "data_source": "sample_mflix"
-                        }
-                except Exception as e:
-                    print(f"Error retrieving from sample_mflix: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    # Fall through to KB retrieval or generic LLM
-        except Exception as e:
-            print(f"Error in handle_knowledge: {e}")
-            import traceback
-            traceback.print_exc()
-            # Fall through to generic LLM
+    async def retrieve_knowledge(self, query: str, search_movies: bool = True) -> Dict[str, Any]:
+        """Retrieval half of a knowledge request: movie search, semantic cache lookup, KB chunks.
+        
+        Makes no LLM calls, so ``invoke`` can start it speculatively while the
+        intent is still being classified.
+        """
+        retrieval = {"movies": None, "cached": None, "chunks": None, "query_embedding": None, "kb_version": None}
+        
+        # Check if query is about movies (sample_mflix database)
+        movie_keywords = ["movie", "film", "actor", "director", "genre", "rating", "imdb", "plot", "cast"]
+        if search_movies and any(keyword in query.lower() for keyword in movie_keywords):
+            # Use sample_mflix database
+            try:
+                # Import MflixRetriever - need to add path
+                from pathlib import Path as PathLib
+                api_path = PathLib(__file__).parent.parent.parent / "apps" / "api"
+                if str(api_path) not in sys.path:
+                    sys.path.insert(0, str(api_path))
+                
+                from packages.rag.mflix_retriever import MflixRetriever
+                
+                retriever = MflixRetriever()
+                movies = await retriever.search_movies(query, limit=6)
+                if movies:
+                    retrieval["movies"] = movies
+                    return retrieval
+            except Exception as e:
+                print(f"Error retrieving from sample_mflix: {e}")
+                import traceback
+                traceback.print_exc()
+                # Fall through to KB retrieval or generic LLM
+        
+        # Identifier lookups (error codes, ticket numbers) the lexical index settles
+        # need neither the query embedding nor the semantic cache
+        exact = await retrieve_kb_exact(query, k=6)
+        if exact:
+            retrieval["chunks"] = exact
+            return retrieval
+        
+        # Serve paraphrases of recently answered questions from the semantic cache
+        if self.semantic_cache is not None:
+            try:
+                retrieval["query_embedding"] = await embed_query(query)
+                retrieval["kb_version"] = await get_kb_version()
+                retrieval["cached"] = self.semantic_cache.lookup(retrieval["query_embedding"], retrieval["kb_version"])
+                if retrieval["cached"]:
+                    return retrieval
+            except Exception as e:
+                print(f"Error checking semantic cache: {e}")
         
         # Fallback to KB retrieval - wrap in try-catch to handle errors
-        chunks = []
         try:
-            chunks = await retrieve_kb(query, k=6)
+            retrieval["chunks"] = await retrieve_kb(query, k=6)
         except Exception as e:
             print(f"Error retrieving from KB: {e}")
-            chunks = []  # Empty chunks will trigger LLM fallback
+            retrieval["chunks"] = []  # Empty chunks will trigger LLM fallback
+        return retrieval
+    
+    async def handle_knowledge(self, query: str, user_email: str, retrieval: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Handle knowledge base queries (``retrieval`` from a speculative ``retrieve_knowledge`` run)."""
+        if retrieval is None:
+            retrieval = await self.retrieve_knowledge(query)
         
-        # Log retrieval
-        if settings.enable_audit_logs:
+        movies = retrieval["movies"]
+        if movies:
             try:
-                await self._log_audit("rag_retrieved", {
-                    "query": query[:200],
-                    "num_chunks": len(chunks),
-                    "chunk_ids": [c["id"] for c in chunks] if chunks else []
-                })
-            except:
-                pass  # Don't fail if audit logging fails
+                prompt = get_movie_answer_prompt(query, movies)
+                
+                response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+                answer = response.content.strip()
+                
+                return {
+                    "answer": answer,
+                    "sources": [{"title": m["title"], "year": m.get("year")} for m in movies],
+                    "intent": "knowledge",
+                    "data_source": "sample_mflix"
+                }
+            except Exception as e:
+                print(f"Error in handle_knowledge: {e}")
+                import traceback
+                traceback.print_exc()
+                # Fall through to KB retrieval or generic LLM
+                retrieval = await self.retrieve_knowledge(query, search_movies=False)
+        
+        cached = retrieval["cached"]
+        if cached:
+            return {
+                "answer": cached["answer"],
+                "sources": cached["sources"],
+                "intent": "knowledge",
+                "data_source": "semantic_cache"
+            }
+        query_embedding = retrieval["query_embedding"]
+        kb_version = retrieval["kb_version"]
+        chunks = retrieval["chunks"]
+        
+        await self._log_retrieval(query, chunks)
         
         # If KB is empty, use LLM with general IT helpdesk knowledge
         if not chunks:
             print(f"No KB chunks found for query: {query}. Using LLM general knowledge.")
-            prompt = f"""As an IT Helpdesk Assistant, answer the user's question about IT support. 
-Provide clear, step-by-step instructions based on IT best practices.
-
-User question: {query}
-
-If this is a common IT issue (like MFA setup, password reset, VPN issues), provide helpful instructions.
-If you're unsure or this requires specific company policies, acknowledge this and offer to create a support ticket.
-
-Provide a helpful answer:"""
+            prompt = get_general_knowledge_prompt(query)
             
             response = await self.llm.ainvoke([
                 SystemMessage(content=SYSTEM_PROMPT),
@@ -197,34 +249,27 @@ Provide a helpful answer:"""
         
         # Synthesize answer from KB chunks
         try:
-            prompt = get_answer_synthesis_prompt(query, chunks)
+            messages, sources, prompt_tokens = self._synthesis_messages(query, chunks)
             
-            response = await self.llm.ainvoke([
-                SystemMessage(content=SYSTEM_PROMPT),
-                HumanMessage(content=prompt)
-            ])
+            response = await self.llm.ainvoke(messages)
             
             answer = response.content.strip()
             
+            if self.semantic_cache is not None and query_embedding is not None:
+                self.semantic_cache.store(query, query_embedding, answer, sources, kb_version)
+            
             return {
                 "answer": answer,
-                "sources": [{"id": c["id"], "docId": c.get("docId"), "text": c["text"][:200]} for c in chunks],
-                "intent": "knowledge"
+                "sources": sources,
+                "intent": "knowledge",
+                "prompt_tokens": prompt_tokens
             }
         except Exception as e:
             print(f"Error synthesizing answer from KB: {e}")
             import traceback
             traceback.print_exc()
             # Fallback to generic LLM answer
-            prompt = f"""As an IT Helpdesk Assistant, answer the user's question about IT support. 
-Provide clear, step-by-step instructions based on IT best practices.
-
-User question: {query}
-
-If this is a common IT issue (like MFA setup, password reset, VPN issues), provide helpful instructions.
-If you're unsure or this requires specific company policies, acknowledge this and offer to create a support ticket.
-
-Provide a helpful answer:"""
+            prompt = get_general_knowledge_prompt(query)
             
             response = await self.llm.ainvoke([
                 SystemMessage(content=SYSTEM_PROMPT),
@@ -238,12 +283,106 @@ Provide a helpful answer:"""
                 "data_source": "llm_fallback"
             }
     
+    async def stream_knowledge(
+        self,
+        query: str,
+        user_email: str,
+        retrieval: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming ``handle_knowledge``: a ``sources`` event once retrieval is done, then ``token`` events.
+        
+        Ends with a ``result`` event holding the dict ``handle_knowledge`` would return.
+        """
+        if retrieval is None:
+            retrieval = await self.retrieve_knowledge(query)
+        
+        cached = retrieval["cached"]
+        if cached:
+            yield {"event": "sources", "data": {"sources": cached["sources"]}}
+            yield {"event": "token", "data": {"text": cached["answer"]}}
+            yield {"event": "result", "data": {
+                "answer": cached["answer"],
+                "sources": cached["sources"],
+                "intent": "knowledge",
+                "data_source": "semantic_cache"
+            }}
+            return
+        
+        movies = retrieval["movies"]
+        chunks = retrieval["chunks"]
+        if movies:
+            messages = [HumanMessage(content=get_movie_answer_prompt(query, movies))]
+            result = {"sources": [{"title": m["title"], "year": m.get("year")} for m in movies], "data_source": "sample_mflix"}
+        else:
+            await self._log_retrieval(query, chunks)
+            if chunks:
+                messages, sources, prompt_tokens = self._synthesis_messages(query, chunks)
+                result = {"sources": sources, "prompt_tokens": prompt_tokens}
+            else:
+                print(f"No KB chunks found for query: {query}. Using LLM general knowledge.")
+                messages = [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=get_general_knowledge_prompt(query))]
+                result = {"sources": [], "data_source": "llm_general_knowledge"}
+        result["intent"] = "knowledge"
+        yield {"event": "sources", "data": {"sources": result["sources"]}}
+        
+        parts: List[str] = []
+        try:
+            async for chunk in self.llm.astream(messages):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield {"event": "token", "data": {"text": chunk.content}}
+        except Exception as e:
+            if parts:
+                raise  # the client already has part of this answer
+            print(f"Error streaming knowledge answer: {e}")
+            # Fallback to generic LLM answer
+            result = {"sources": [], "intent": "knowledge", "data_source": "llm_fallback"}
+            messages = [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=get_general_knowledge_prompt(query))]
+            async for chunk in self.llm.astream(messages):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield {"event": "token", "data": {"text": chunk.content}}
+        
+        result["answer"] = "".join(parts).strip()
+        if chunks and "data_source" not in result and self.semantic_cache is not None and retrieval["query_embedding"] is not None:
+            self.semantic_cache.store(query, retrieval["query_embedding"], result["answer"], result["sources"], retrieval["kb_version"])
+        yield {"event": "result", "data": result}
+    
+    def _synthesis_messages(self, query: str, chunks: List[Dict[str, Any]]) -> Tuple[List, List[Dict[str, Any]], int]:
+        """Synthesis prompt over the chunks packed into the context budget.
+        
+        Returns the LLM messages, the sources actually in the context and the
+        prompt's token count.
+        """
+        packer = get_context_packer()
+        packed = packer.pack(chunks)
+        prompt = get_answer_synthesis_prompt(query, packed["snippets"])
+        prompt_tokens = count_tokens(SYSTEM_PROMPT) + count_tokens(prompt)
+        packer.record_prompt(prompt_tokens)
+        
+        included = {chunk_id for snippet in packed["snippets"] for chunk_id in snippet["ids"]}
+        sources = [{"id": c["id"], "docId": c.get("docId"), "text": c["text"][:200]} for c in chunks if c["id"] in included]
+        messages = [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=prompt)]
+        return messages, sources, prompt_tokens
+    
+    async def _log_retrieval(self, query: str, chunks: List[Dict[str, Any]]):
+        """Audit which KB chunks a knowledge answer was built from."""
+        if settings.enable_audit_logs:
+            try:
+                await self._log_audit("rag_retrieved", {
+                    "query": query[:200],
+                    "num_chunks": len(chunks),
+                    "chunk_ids": [c["id"] for c in chunks] if chunks else []
+                })
+            except:
+                pass  # Don't fail if audit logging fails
+    
     async def handle_create_ticket(self, message: str, user_email: str) -> Dict[str, Any]:
         """Handle ticket creation."""
         # Extract ticket fields using LLM
         extraction_prompt = get_tool_extraction_prompt(message)
         
-        response = await self.llm.ainvoke([HumanMessage(content=extraction_prompt)])
+        response = await self.llm.ainvoke([HumanMessage(content=extraction_prompt)], site="extract_ticket_fields")
         
         try:
             # Try to parse JSON response
@@ -326,7 +465,7 @@ Provide a helpful answer:"""
 Message: {message}
 Ticket ID:"""
             
-            response = await self.llm.ainvoke([HumanMessage(content=extraction_prompt)])
+            response = await self.llm.ainvoke([HumanMessage(content=extraction_prompt)], site="extract_ticket_id")
             ticket_id = response.content.strip()
         
         # Get ticket
@@ -417,19 +556,12 @@ Ticket ID:"""
         """Main orchestrator entry point."""
         try:
             # Classify intent
-            intent = await self.classify_intent(message, user_email)
+            intent, retrieval = await self._classify_and_retrieve(message, user_email)
             
             # Route to handler
             if intent == "knowledge":
-                return await self.handle_knowledge(message, user_email)
-            elif intent == "create_ticket":
-                return await self.handle_create_ticket(message, user_email)
-            elif intent == "ticket_status":
-                return await self.handle_ticket_status(message, user_email)
-            elif intent == "password_reset":
-                return await self.handle_password_reset(message, user_email)
-            else:
-                return await self.handle_handoff(message, user_email, session_id)
+                return await self.handle_knowledge(message, user_email, retrieval)
+            return await self._handle_action(intent, message, user_email, session_id)
         except Exception as e:
             print(f"Error in orchestrator.invoke: {e}")
             import traceback
@@ -461,20 +593,107 @@ Provide a helpful answer based on IT best practices. If you don't know the answe
                     "error": str(e)
                 }
     
-    async def _log_audit(self, event: str, payload: Dict):
-        """Log audit event."""
-        database = await get_database()
+    async def stream(self, message: str, user_email: str, session_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming ``invoke``: ``intent``, ``sources`` and ``token`` events, then a ``result`` event.
+        
+        Knowledge answers are streamed token by token; other intents are
+        handled as in ``invoke`` and sent as a single ``token`` event.
+        """
+        intent, retrieval = await self._classify_and_retrieve(message, user_email)
+        yield {"event": "intent", "data": {"intent": intent}}
+        if intent == "knowledge":
+            async for event in self.stream_knowledge(message, user_email, retrieval):
+                yield event
+            return
         
+        result = await self._handle_action(intent, message, user_email, session_id)
+        yield {"event": "sources", "data": {"sources": result.get("sources", []), "toolCalls": result.get("tool_calls", [])}}
+        yield {"event": "token", "data": {"text": result.get("answer", "")}}
+        yield {"event": "result", "data": result}
+    
+    async def _handle_action(self, intent: str, message: str, user_email: str, session_id: str) -> Dict[str, Any]:
+        """Route a non-knowledge intent to its handler."""
+        if intent == "create_ticket":
+            return await self.handle_create_ticket(message, user_email)
+        elif intent == "ticket_status":
+            return await self.handle_ticket_status(message, user_email)
+        elif intent == "password_reset":
+            return await self.handle_password_reset(message, user_email)
+        else:
+            return await self.handle_handoff(message, user_email, session_id)
+    
+    async def _classify_and_retrieve(self, message: str, user_email: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Classify the intent, retrieving knowledge speculatively meanwhile.
+        
+        Returns the intent and, for knowledge requests that speculated, the
+        ``retrieve_knowledge`` result.
+        """
+        speculative = None
+        started = time.perf_counter()
+        try:
+            # Most requests are knowledge questions: retrieve while the intent is classified
+            if self._should_speculate(message):
+                speculative = asyncio.create_task(self._speculate(message))
+                self.speculation["started"] += 1
+            
+            intent = await self.classify_intent(message, user_email)
+            classify_seconds = time.perf_counter() - started
+            if speculative is None or intent != "knowledge":
+                return intent, None
+            
+            retrieval, retrieval_seconds = await speculative
+            speculative = None
+            self.speculation["used"] += 1
+            # Retrieval time hidden behind classification
+            self.speculation["saved_seconds"] += min(retrieval_seconds, classify_seconds)
+            return intent, retrieval
+        finally:
+            if speculative is not None:
+                self._discard_speculation(speculative, started)
+    
+    def _should_speculate(self, message: str) -> bool:
+        """Speculate unless disabled or the local rules already route the message elsewhere."""
+        if not settings.speculative_retrieval:
+            return False
+        return self.intent_classifier is None or match_rules(message) in (None, "knowledge")
+    
+    async def _speculate(self, message: str):
+        """Speculative ``retrieve_knowledge``; returns (retrieval, seconds taken)."""
+        started = time.perf_counter()
+        retrieval = await self.retrieve_knowledge(message)
+        return retrieval, time.perf_counter() - started
+    
+    def _discard_speculation(self, task: asyncio.Task, started: float):
+        """Cancel speculative retrieval for a non-knowledge request and count the wasted work."""
+        self.speculation["discarded"] += 1
+        if task.done() and not task.cancelled() and task.exception() is None:
+            self.speculation["discarded_completed"] += 1
+            self.speculation["wasted_seconds"] += task.result()[1]
+        else:
+            task.cancel()
+            self.speculation["wasted_seconds"] += time.perf_counter() - started
+        # Don't leave an exception unretrieved
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    
+    def speculation_stats(self) -> Dict[str, Any]:
+        """How often speculative retrieval was used, and the work spent on discarded runs."""
+        stats = dict(self.speculation)
+        stats["enabled"] = settings.speculative_retrieval
+        stats["hit_rate"] = stats["used"] / stats["started"] if stats["started"] else 0.0
+        return stats
+    
+    async def _log_audit(self, event: str, payload: Dict):
+        """Log audit event (queued; written to Mongo in batches by the audit sink)."""
         audit_log = AuditLog(
             event=event,
             payload=payload
         )
         
         audit_dict = audit_log.model_dump(by_alias=True, exclude={"id", "sessionId", "userId"})
-        await database.audit_logs.insert_one(audit_dict)
+        await get_audit_sink().write(audit_dict)
     
     async def _notify_n8n(self, event: str, payload: Dict):
-        """Notify n8n webhook."""
+        """Notify n8n webhook (queued in the outbox)."""
         if not settings.n8n_webhook_ticket_created and not settings.n8n_webhook_escalate:
             return
         
@@ -487,10 +706,9 @@ Provide a helpful answer based on IT best practices. If you don't know the answe
         if not webhook_url:
             return
         
+        # Delivered (with retries) by the outbox dispatcher, not on the request path
         try:
-            import httpx
-            async with httpx.AsyncClient() as client:
-                await client.post(webhook_url, json={"event": event, "payload": payload}, timeout=3)
+            await get_outbox().enqueue(event, webhook_url, payload)
         except Exception as e:
             print(f"Error notifying n8n: {e}")
 
@@ -0,0 +1,210 @@
+"""Local intent classification: deterministic rules, then embedding centroids.
+
+Messages the local tiers can't label confidently are left to the LLM
+classifier in the orchestrator.
+"""
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
+from pathlib import Path
+import asyncio
+import json
+import re
+import sys
+import numpy as np
+
+# Add parent directories to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from config import settings
+from packages.rag.embeddings import embed_query, get_embeddings
+
+
+INTENTS = ["knowledge", "create_ticket", "ticket_status", "password_reset", "handoff"]
+
+# Labelled examples: {"text", "intent", "split": "train" | "test"}
+EXAMPLES_PATH = Path(__file__).parent / "intent_examples.jsonl"
+
+# ServiceNow / mock ids, and Jira keys (case-sensitive: "wi-fi-6" is not a ticket)
+TICKET_ID_RE = re.compile(r"\b(INC\d+|TICKET-\w*\d\w*)\b", re.IGNORECASE)
+JIRA_KEY_RE = re.compile(r"\b[A-Z][A-Z0-9]+-\d+\b")
+QUESTION_RE = re.compile(r"^\s*(how|what|why|where|when|which|can i|do i|is there)\b", re.IGNORECASE)
+
+# (intent, pattern, applies to how-to questions) in priority order
+INTENT_RULES: List[Tuple[str, re.Pattern, bool]] = [
+    ("handoff", re.compile(
+        r"\b(talk|speak|chat)\s+(to|with)\s+(a\s+|an\s+)?(human|real person|person|agent|someone|technician)\b"
+        r"|\b(real|live|human)\s+(person|agent)\b|\bescalate\b.*\b(human|person|technician)\b",
+        re.IGNORECASE), True),
+    ("ticket_status", re.compile(
+        r"\b(status|update|progress|news|eta)\b.{0,30}\b(ticket|incident|request)\b"
+        r"|\b(where|what)('s| is)\s+(my|the)\s+(ticket|incident)\b",
+        re.IGNORECASE), True),
+    ("create_ticket", re.compile(
+        r"\b(create|open|raise|log|file|submit)\s+(a\s+|an\s+|new\s+)?(p[1-5]\s+|high priority\s+|urgent\s+)?"
+        r"(ticket|incident|support request|case)\b",
+        re.IGNORECASE), False),
+    ("password_reset", re.compile(
+        r"\breset\s+my\s+(\w+\s+)?password\b|\bforg(ot|otten)\s+(my\s+)?(\w+\s+)?password\b"
+        r"|\bpassword\s+reset\s+(request|link)\b|\blocked\s+out\s+of\s+my\s+account\b|\bunlock\s+my\s+account\b",
+        re.IGNORECASE), False),
+]
+
+
+def load_examples(split: Optional[str] = None, path: Path = EXAMPLES_PATH) -> List[Dict[str, str]]:
+    """Labelled examples, optionally only one split."""
+    with open(path, "r", encoding="utf-8") as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+    return [e for e in examples if split is None or e["split"] == split]
+
+
+def match_rules(message: str) -> Optional[str]:
+    """Intent from the deterministic patterns, or None."""
+    is_question = bool(QUESTION_RE.match(message))
+    for intent, pattern, applies_to_questions in INTENT_RULES:
+        if is_question and not applies_to_questions:
+            continue  # "how do I reset my password?" is a knowledge question
+        if pattern.search(message):
+            return intent
+    # A bare ticket number with no create verb is a status check
+    if TICKET_ID_RE.search(message) or JIRA_KEY_RE.search(message):
+        return "ticket_status"
+    return None
+
+
+class IntentClassifier:
+    """Rules first, then nearest intent centroid of the labelled examples' embeddings.
+
+    A centroid label is accepted when the best cosine similarity is at least
+    ``min_similarity`` and beats the runner-up by ``min_margin``; otherwise
+    ``classify`` returns no intent and the caller asks the LLM. The query
+    embedding goes through the shared query cache, so knowledge retrieval
+    reuses it.
+    """
+    
+    def __init__(self, min_similarity: float = 0.3, min_margin: float = 0.05, examples_path: Path = EXAMPLES_PATH):
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.examples_path = examples_path
+        self._centroids: Optional[np.ndarray] = None  # (len(INTENTS), dim) unit rows
+        self._lock: Optional[asyncio.Lock] = None
+        self.served = {"rules": 0, "centroid": 0, "llm": 0}
+        self.last_evaluation: Optional[Dict[str, Any]] = None
+    
+    async def _get_centroids(self) -> np.ndarray:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._centroids is None:
+                examples = load_examples("train", self.examples_path)
+                # Served from the embedding store after the first start
+                vectors = np.asarray(await get_embeddings([e["text"] for e in examples]), dtype=np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                labels = np.array([INTENTS.index(e["intent"]) for e in examples])
+                centroids = np.stack([vectors[labels == i].mean(axis=0) for i in range(len(INTENTS))])
+                self._centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+                print(f"Intent centroids built from {len(examples)} examples")
+        return self._centroids
+    
+    async def classify_centroid(self, message: str) -> Tuple[str, float, float]:
+        """(intent, similarity, margin) of the nearest centroid."""
+        centroids = await self._get_centroids()
+        query = np.asarray(await embed_query(message), dtype=np.float32)
+        scores = centroids @ (query / (np.linalg.norm(query) or 1.0))
+        second, best = np.argsort(scores)[-2:]
+        return INTENTS[best], float(scores[best]), float(scores[best] - scores[second])
+    
+    async def classify(self, message: str) -> Dict[str, Any]:
+        """{"intent", "tier", "confidence"}; intent is None when the LLM should decide."""
+        intent = match_rules(message)
+        if intent is not None:
+            return {"intent": intent, "tier": "rules", "confidence": 1.0}
+        try:
+            intent, similarity, margin = await self.classify_centroid(message)
+        except Exception as e:
+            print(f"Error in centroid intent classification: {e}")
+            return {"intent": None, "tier": None, "confidence": 0.0}
+        if similarity >= self.min_similarity and margin >= self.min_margin:
+            return {"intent": intent, "tier": "centroid", "confidence": margin}
+        return {"intent": None, "tier": None, "confidence": margin}
+    
+    def record(self, tier: str):
+        """Count which tier served a request."""
+        self.served[tier] += 1
+    
+    async def evaluate(
+        self,
+        examples: Optional[List[Dict[str, str]]] = None,
+        llm_classify: Optional[Callable[[str], Awaitable[str]]] = None
+    ) -> Dict[str, Any]:
+        """Accuracy per tier on labelled examples (the test split by default).
+
+        With ``llm_classify`` the messages left to the LLM are classified too
+        and an end-to-end accuracy is reported.
+        """
+        examples = examples if examples is not None else load_examples("test", self.examples_path)
+        counts = {"rules": [0, 0], "centroid": [0, 0], "llm": [0, 0]}  # [served, correct]
+        errors = []
+        for example in examples:
+            result = await self.classify(example["text"])
+            tier, intent = result["tier"], result["intent"]
+            if intent is None:
+                if llm_classify is None:
+                    counts["llm"][0] += 1
+                    continue
+                tier, intent = "llm", await llm_classify(example["text"])
+            counts[tier][0] += 1
+            if intent == example["intent"]:
+                counts[tier][1] += 1
+            else:
+                errors.append({"text": example["text"], "expected": example["intent"], "predicted": intent, "tier": tier})
+        
+        local = counts["rules"][0] + counts["centroid"][0]
+        local_correct = counts["rules"][1] + counts["centroid"][1]
+        evaluation = {
+            "examples": len(examples),
+            "min_margin": self.min_margin,
+            "local_fraction": local / len(examples) if examples else 0.0,
+            "local_accuracy": local_correct / local if local else None,
+            "tiers": {
+                tier: {"served": served, "accuracy": correct / served if served and (tier != "llm" or llm_classify) else None}
+                for tier, (served, correct) in counts.items()
+            },
+            "accuracy": (local_correct + counts["llm"][1]) / len(examples) if llm_classify and examples else None,
+            "errors": errors
+        }
+        self.last_evaluation = {k: v for k, v in evaluation.items() if k != "errors"}
+        return evaluation
+    
+    def stats(self) -> Dict[str, Any]:
+        """Share of requests served without the LLM, plus the last evaluation."""
+        total = sum(self.served.values())
+        return {
+            "requests": total,
+            "served": dict(self.served),
+            "local_fraction": (self.served["rules"] + self.served["centroid"]) / total if total else 0.0,
+            "min_similarity": self.min_similarity,
+            "min_margin": self.min_margin,
+            "last_evaluation": self.last_evaluation
+        }
+
+
+async def _main(argv: List[str]):
+    """Evaluate the local tiers on the test split over a few margins (``--llm`` adds the fallback)."""
+    classifier = IntentClassifier(min_similarity=settings.intent_centroid_min_similarity)
+    llm_classify = None
+    if "--llm" in argv:
+        from packages.orchestrator.graph import get_orchestrator
+        orchestrator = await get_orchestrator()
+        llm_classify = orchestrator.llm_classify_intent
+    margins = [float(a) for a in argv if not a.startswith("--")] or [0.0, 0.02, settings.intent_centroid_min_margin, 0.1]
+    for margin in margins:
+        classifier.min_margin = margin
+        evaluation = await classifier.evaluate(llm_classify=llm_classify)
+        errors = evaluation.pop("errors")
+        print(json.dumps(evaluation))
+        for error in errors:
+            print(f"  {error['tier']:>8}: {error['text']!r} expected {error['expected']}, got {error['predicted']}")
+
+
+if __name__ == "__main__":
+    # Usage: python -m packages.orchestrator.intent [margin ...] [--llm]
+    asyncio.run(_main(sys.argv[1:]))
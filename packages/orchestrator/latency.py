@@ -0,0 +1,45 @@
+"""Rolling latency percentiles for chat responses."""
+from typing import Dict, Any, Optional
+from collections import deque
+import numpy as np
+
+
+class LatencyTracker:
+    """Keeps the most recent samples per metric and reports their percentiles in milliseconds."""
+    
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self.counts: Dict[str, int] = {}
+    
+    def record(self, metric: str, seconds: float):
+        """Add a sample (in seconds) to a metric."""
+        self._samples.setdefault(metric, deque(maxlen=self.window)).append(seconds)
+        self.counts[metric] = self.counts.get(metric, 0) + 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """count, mean and p50/p95/p99 (ms) per metric over the window."""
+        stats = {}
+        for metric, samples in self._samples.items():
+            values = 1000 * np.asarray(samples)
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            stats[metric] = {
+                "count": self.counts[metric],
+                "mean_ms": round(float(values.mean()), 1),
+                "p50_ms": round(float(p50), 1),
+                "p95_ms": round(float(p95), 1),
+                "p99_ms": round(float(p99), 1)
+            }
+        return stats
+
+
+# Global tracker instance (one per process)
+_chat_latency: Optional[LatencyTracker] = None
+
+
+def get_chat_latency() -> LatencyTracker:
+    """Get the process-wide chat latency tracker."""
+    global _chat_latency
+    if _chat_latency is None:
+        _chat_latency = LatencyTracker()
+    return _chat_latency
@@ -0,0 +1,140 @@
+"""Exact-match response cache for the orchestrator's chat model.
+
+Only call sites listed in ``sites`` are cached: their prompts are
+deterministic functions of the user message (intent classification, field
+extraction), so identical messages from any user can share a response.
+Keys hash the model, temperature and the full message list.
+"""
+from typing import Dict, Any, List, Optional, Iterable
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import sys
+
+# Add parent directories to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from langchain.schema import AIMessage
+from config import settings
+from packages.rag.cache import LRUCache, SQLiteCache
+
+
+class CachedLLM:
+    """Wraps a chat model; ``ainvoke(messages, site=...)`` is served from cache for opted-in sites.
+
+    Concurrent identical calls share one model request. Anything else
+    (other methods such as ``astream``, calls without an opted-in site)
+    goes straight to the wrapped model.
+    """
+    
+    def __init__(
+        self,
+        llm,
+        sites: Iterable[str] = (),
+        max_entries: int = 2048,
+        ttl_seconds: Optional[float] = 3600,
+        path: Optional[str] = None
+    ):
+        self.llm = llm
+        self.sites = set(sites)
+        self._memory = LRUCache(max_size=max_entries, ttl_seconds=ttl_seconds)
+        self._disk = SQLiteCache(path, table="llm_responses", ttl_seconds=ttl_seconds) if path else None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.site_stats: Dict[str, Dict[str, int]] = {}
+    
+    def __getattr__(self, name: str):
+        return getattr(self.llm, name)
+    
+    def cache_key(self, messages: List[Any]) -> str:
+        """Hash of (model, temperature, messages)."""
+        material = json.dumps({
+            "model": getattr(self.llm, "model_name", None),
+            "temperature": getattr(self.llm, "temperature", None),
+            "messages": [[message.type, message.content] for message in messages]
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+    
+    def _lookup(self, key: str) -> Optional[str]:
+        content = self._memory.get(key)
+        if content is None and self._disk is not None:
+            blob = self._disk.get(key)
+            if blob is not None:
+                content = blob.decode("utf-8")
+                self._memory.set(key, content)
+        return content
+    
+    def _store(self, key: str, content: str):
+        self._memory.set(key, content)
+        if self._disk is not None:
+            self._disk.set(key, content.encode("utf-8"))
+    
+    async def ainvoke(self, messages: List[Any], site: Optional[str] = None, **kwargs) -> Any:
+        """``llm.ainvoke``, cached when ``site`` is opted in."""
+        if site is None or site not in self.sites:
+            return await self.llm.ainvoke(messages, **kwargs)
+        
+        stats = self.site_stats.setdefault(site, {"hits": 0, "misses": 0, "coalesced": 0})
+        key = self.cache_key(messages)
+        content = self._lookup(key)
+        if content is not None:
+            stats["hits"] += 1
+            return AIMessage(content=content)
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # Identical request already waiting on the model
+            try:
+                content = await asyncio.shield(inflight)
+                stats["coalesced"] += 1
+                return AIMessage(content=content)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise  # this caller was cancelled
+                # The request it was waiting on was cancelled: make its own
+        
+        stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            response = await self.llm.ainvoke(messages, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't warn when there are none
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        self._store(key, response.content)
+        future.set_result(response.content)
+        return response
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit rates per call site plus the cache tiers' counters."""
+        sites = {}
+        for site, counts in self.site_stats.items():
+            requests = counts["hits"] + counts["misses"] + counts["coalesced"]
+            sites[site] = {
+                **counts,
+                "requests": requests,
+                "hit_rate": (counts["hits"] + counts["coalesced"]) / requests if requests else 0.0
+            }
+        stats = {"enabled_sites": sorted(self.sites), "sites": sites, "memory": self._memory.stats()}
+        if self._disk is not None:
+            stats["disk"] = self._disk.stats()
+        return stats
+
+
+def cached_llm(llm) -> CachedLLM:
+    """Wrap the orchestrator's model with the configured response cache."""
+    sites = [site.strip() for site in settings.llm_cache_sites.split(",") if site.strip()]
+    return CachedLLM(
+        llm,
+        sites=sites,
+        max_entries=settings.llm_cache_size,
+        ttl_seconds=settings.llm_cache_ttl_seconds,
+        path=settings.llm_cache_path
+    )
@@ -0,0 +1,245 @@
+"""Durable webhook outbox for n8n notifications.
+
+Handlers record notifications in the ``outbox`` collection and return; a
+background dispatcher in any API process claims due events in batches,
+POSTs them over one pooled HTTP client, and retries failures with
+exponential backoff until ``max_attempts``, after which the event is
+dead-lettered (status ``dead``) for inspection and manual retry. Claims are
+leases: events whose dispatcher died mid-delivery become due again.
+
+``batch_size`` is a claim size, not a request size: each event is still
+POSTed on its own (n8n takes one event per call). It caps how many events
+one dispatcher leases and sends concurrently per round, with
+``max_connections`` limiting the requests actually in flight.
+"""
+from typing import Dict, Any, Optional, List
+from datetime import datetime, timedelta
+from pathlib import Path
+import asyncio
+import random
+import sys
+import time
+
+# Add apps/api to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+import httpx
+from bson import ObjectId
+from pymongo import ReturnDocument
+from config import settings
+from db import get_database
+from db.models import OutboxEvent
+from packages.orchestrator.latency import LatencyTracker
+
+
+class OutboxDispatcher:
+    """Queues webhook events in MongoDB and delivers them from a background task."""
+    
+    def __init__(
+        self,
+        batch_size: int = 20,
+        poll_seconds: float = 2.0,
+        timeout: float = 5.0,
+        max_connections: int = 10,
+        max_attempts: int = 8,
+        backoff_seconds: float = 2.0,
+        max_backoff_seconds: float = 600.0
+    ):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        # A claim outlives the slowest possible POST, so live deliveries aren't taken over
+        self.lease_seconds = 2 * timeout + 10
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.latency = LatencyTracker()
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed_attempts = 0
+        self.dead_lettered = 0
+    
+    async def start(self):
+        """Open the shared HTTP client and start the dispatcher."""
+        if self._task is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            )
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+    
+    async def stop(self):
+        """Stop the dispatcher. Undelivered events stay in the outbox for the next start."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def enqueue(self, event: str, url: str, payload: Dict[str, Any]) -> str:
+        """Record a webhook event for delivery. Returns its id."""
+        database = await get_database()
+        outbox_event = OutboxEvent(event=event, url=url, payload=payload)
+        result = await database.outbox.insert_one(outbox_event.model_dump(by_alias=True, exclude={"id"}))
+        self.enqueued += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return str(result.inserted_id)
+    
+    async def retry(self, event_id: str) -> bool:
+        """Put a dead-lettered event back in the queue with a fresh attempt budget."""
+        database = await get_database()
+        result = await database.outbox.update_one(
+            {"_id": ObjectId(event_id), "status": "dead"},
+            {"$set": {"status": "pending", "attempts": 0, "nextAttemptAt": datetime.utcnow()}}
+        )
+        if result.modified_count and self._wakeup is not None:
+            self._wakeup.set()
+        return bool(result.modified_count)
+    
+    async def _loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                batch = await self._claim_batch()
+                if batch:
+                    await self._deliver_batch(batch)
+                    if len(batch) == self.batch_size:
+                        continue  # more may be due
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Outbox dispatcher error: {e}")
+            
+            # Nothing due: sleep until an event is enqueued or the next poll
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _claim_batch(self) -> List[Dict[str, Any]]:
+        """Atomically lease up to ``batch_size`` due events (including ones whose lease expired)."""
+        database = await get_database()
+        now = datetime.utcnow()
+        batch = []
+        for _ in range(self.batch_size):
+            event = await database.outbox.find_one_and_update(
+                {"$or": [
+                    {"status": "pending", "nextAttemptAt": {"$lte": now}},
+                    {"status": "delivering", "leaseUntil": {"$lt": now}}
+                ]},
+                {
+                    "$set": {"status": "delivering", "leaseUntil": now + timedelta(seconds=self.lease_seconds)},
+                    "$inc": {"attempts": 1}
+                },
+                sort=[("nextAttemptAt", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if event is None:
+                break
+            batch.append(event)
+        return batch
+    
+    async def _deliver_batch(self, batch: List[Dict[str, Any]]):
+        """POST a batch of events concurrently, then record the outcomes."""
+        errors = await asyncio.gather(*(self._post(event) for event in batch))
+        database = await get_database()
+        now = datetime.utcnow()
+        delivered = [event for event, error in zip(batch, errors) if error is None]
+        if delivered:
+            await database.outbox.update_many(
+                {"_id": {"$in": [event["_id"] for event in delivered]}},
+                {"$set": {"status": "delivered", "deliveredAt": now, "leaseUntil": None}}
+            )
+            self.delivered += len(delivered)
+            for event in delivered:
+                self.latency.record("end_to_end", (now - event["createdAt"]).total_seconds())
+        
+        for event, error in zip(batch, errors):
+            if error is None:
+                continue
+            self.failed_attempts += 1
+            if event["attempts"] >= self.max_attempts:
+                self.dead_lettered += 1
+                print(f"Dead-lettering {event['event']} webhook {event['_id']} after {event['attempts']} attempts: {error}")
+                update = {"status": "dead", "lastError": error, "leaseUntil": None}
+            else:
+                # Exponential backoff with jitter
+                delay = min(self.backoff_seconds * 2 ** (event["attempts"] - 1), self.max_backoff_seconds)
+                delay *= random.uniform(0.8, 1.2)
+                update = {
+                    "status": "pending",
+                    "lastError": error,
+                    "leaseUntil": None,
+                    "nextAttemptAt": now + timedelta(seconds=delay)
+                }
+            await database.outbox.update_one({"_id": event["_id"]}, {"$set": update})
+    
+    async def _post(self, event: Dict[str, Any]) -> Optional[str]:
+        """Deliver one event. Returns the error, or None on a 2xx response."""
+        started = time.perf_counter()
+        try:
+            response = await self._client.post(event["url"], json={"event": event["event"], "payload": event["payload"]})
+            response.raise_for_status()
+        except Exception as e:
+            return f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+        self.latency.record("post", time.perf_counter() - started)
+        return None
+    
+    async def stats(self, dead_limit: int = 20) -> Dict[str, Any]:
+        """Outbox depth by status, delivery counters and latency, and recent dead letters."""
+        database = await get_database()
+        by_status = {
+            row["_id"]: row["count"]
+            async for row in database.outbox.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+        }
+        dead = [
+            {
+                "id": str(doc["_id"]),
+                "event": doc["event"],
+                "attempts": doc["attempts"],
+                "lastError": doc.get("lastError"),
+                "createdAt": doc["createdAt"].isoformat()
+            }
+            async for doc in database.outbox.find({"status": "dead"}).sort("createdAt", -1).limit(dead_limit)
+        ]
+        return {
+            "running": self._task is not None,
+            "by_status": by_status,
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "failed_attempts": self.failed_attempts,
+            "dead_lettered": self.dead_lettered,
+            "latency": self.latency.stats(),
+            "dead_letters": dead
+        }
+
+
+# Global dispatcher instance (one per process)
+_outbox: Optional[OutboxDispatcher] = None
+
+
+def get_outbox() -> OutboxDispatcher:
+    """Get the process-wide webhook outbox."""
+    global _outbox
+    if _outbox is None:
+        _outbox = OutboxDispatcher(
+            batch_size=settings.webhook_batch_size,
+            poll_seconds=settings.webhook_poll_seconds,
+            timeout=settings.webhook_timeout_seconds,
+            max_connections=settings.webhook_max_connections,
+            max_attempts=settings.webhook_max_attempts,
+            backoff_seconds=settings.webhook_backoff_seconds,
+            max_backoff_seconds=settings.webhook_max_backoff_seconds
+        )
+    return _outbox
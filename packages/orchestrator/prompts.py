@@ -55,6 +55,26 @@ User question: {query}
 Answer:"""
 
 
+GENERAL_KNOWLEDGE_PROMPT = """As an IT Helpdesk Assistant, answer the user's question about IT support. 
+Provide clear, step-by-step instructions based on IT best practices.
+
+User question: {query}
+
+If this is a common IT issue (like MFA setup, password reset, VPN issues), provide helpful instructions.
+If you're unsure or this requires specific company policies, acknowledge this and offer to create a support ticket.
+
+Provide a helpful answer:"""
+
+
+MOVIE_ANSWER_PROMPT = """Based on the following movies from our database, answer the user's question about movies:
+
+{movies}
+
+User question: {query}
+
+Provide a helpful answer about these movies."""
+
+
 TOOL_EXTRACTION_PROMPT = """Extract relevant information from the user's message to create a ticket.
 
 Extract:
@@ -82,6 +102,22 @@ def get_answer_synthesis_prompt(query: str, snippets: List[Dict]) -> str:
     return ANSWER_SYNTHESIS_PROMPT.format(query=query, snippets=snippets_text)
 
 
+def get_general_knowledge_prompt(query: str) -> str:
+    """Get prompt for answering without KB snippets."""
+    return GENERAL_KNOWLEDGE_PROMPT.format(query=query)
+
+
+def get_movie_answer_prompt(query: str, movies: List[Dict]) -> str:
+    """Get answer prompt for sample_mflix results."""
+    movies_text = "\n\n".join([
+        f"**{m['title']}** ({m.get('year', 'N/A')})\n"
+        f"Genres: {', '.join(m.get('genres', []))}\n"
+        f"Plot: {m.get('plot', 'N/A')[:200]}..."
+        for m in movies
+    ])
+    return MOVIE_ANSWER_PROMPT.format(movies=movies_text, query=query)
+
+
 def get_tool_extraction_prompt(message: str) -> str:
     """Get tool extraction prompt."""
     return TOOL_EXTRACTION_PROMPT.format(message=message)
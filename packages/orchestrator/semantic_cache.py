@@ -0,0 +1,110 @@
+"""Semantic answer cache for knowledge questions."""
+from typing import List, Dict, Any, Optional
+import time
+import numpy as np
+
+
+class SemanticCache:
+    """Caches synthesized answers keyed by query embedding.
+
+    A lookup returns the stored answer of the most similar cached query if its
+    cosine similarity is at least ``threshold`` and it was produced against the
+    current KB version. A newer version drops every entry, as does a
+    change in embedding size (EMBEDDING_DIMENSIONS), since vectors of
+    different sizes can't be compared. Calls carrying an older version
+    (a request that started before the bump) are ignored instead.
+    """
+    
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl_seconds: Optional[float] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.kb_version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # stores dropped because their KB version was superseded
+        self.clear()
+    
+    def clear(self):
+        """Drop all entries."""
+        self._matrix: Optional[np.ndarray] = None  # (max_entries, dim) unit rows
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * self.max_entries
+        self._next = 0  # ring buffer position: oldest entry is overwritten first
+    
+    def _check_version(self, kb_version: int) -> bool:
+        """Clear on a newer KB version. Returns False for a superseded one."""
+        if self.kb_version is not None and kb_version < self.kb_version:
+            return False
+        if kb_version != self.kb_version:
+            if self.kb_version is not None:
+                print(f"KB version changed ({self.kb_version} -> {kb_version}), clearing semantic cache")
+            self.clear()
+            self.kb_version = kb_version
+        return True
+    
+    def _check_dims(self, dims: int):
+        if self._matrix is not None and self._matrix.shape[1] != dims:
+            print(f"Embedding size changed ({self._matrix.shape[1]} -> {dims}), clearing semantic cache")
+            self.clear()
+    
+    def lookup(self, embedding: List[float], kb_version: int) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for a similar enough query, if any."""
+        query = np.asarray(embedding, dtype=np.float32)
+        if not self._check_version(kb_version):
+            self.misses += 1
+            return None
+        self._check_dims(query.shape[0])
+        if self._matrix is None:
+            self.misses += 1
+            return None
+        
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self._matrix @ query
+        
+        now = time.monotonic()
+        for row in np.argsort(-scores):
+            entry = self._entries[row]
+            if scores[row] < self.threshold or entry is None:
+                break
+            if self.ttl_seconds and now - entry["created_at"] > self.ttl_seconds:
+                continue
+            self.hits += 1
+            return {**entry, "similarity": float(scores[row])}
+        
+        self.misses += 1
+        return None
+    
+    def store(self, query: str, embedding: List[float], answer: str, sources: List[Dict[str, Any]], kb_version: int):
+        """Cache an answer produced against ``kb_version`` (dropped if that version is superseded)."""
+        if not self._check_version(kb_version):
+            self.stale += 1
+            return
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        self._check_dims(vector.shape[0])
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        
+        row = self._next
+        self._matrix[row] = vector
+        self._entries[row] = {
+            "query": query,
+            "answer": answer,
+            "sources": sources,
+            "kb_version": kb_version,
+            "created_at": time.monotonic()
+        }
+        self._next = (row + 1) % self.max_entries
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": sum(1 for e in self._entries if e is not None),
+            "kb_version": self.kb_version,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_stores": self.stale,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -1,6 +1,6 @@
 """RAG utilities for knowledge base retrieval."""
-from .embeddings import get_embeddings, embed_query
+from .embeddings import get_embeddings, embed_query, get_embedding_cache_stats
 from .retriever import VectorRetriever, retrieve_kb
 
-__all__ = ["get_embeddings", "embed_query", "VectorRetriever", "retrieve_kb"]
+__all__ = ["get_embeddings", "embed_query", "get_embedding_cache_stats", "VectorRetriever", "retrieve_kb"]
 
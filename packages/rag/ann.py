@@ -0,0 +1,432 @@
+"""Approximate nearest-neighbour (IVF-flat) index for self-hosted deployments.
+
+Persisted as a versioned pair plus a manifest naming the current one:
+
+    <name>-v<version>-<pid>-<ns>.npz   vectors (grouped by list), list sizes, centroids
+    <name>-v<version>-<pid>-<ns>.json  side table: ids and metadata
+    <name>.manifest.json               swapped atomically after the pair is written
+"""
+from typing import List, Dict, Any, Optional, Iterable, Tuple, Callable
+from pathlib import Path
+import asyncio
+import json
+import os
+import time
+import numpy as np
+
+from .vector_index import VectorIndex, normalize_rows, top_k
+
+
+class IVFFlatIndex(VectorIndex):
+    """Inverted-file index: vectors are bucketed by their nearest k-means centroid.
+
+    A query scores the ``nlist`` centroids, then scans only the ``nprobe`` best
+    lists, so query cost grows with ``N * nprobe / nlist`` instead of ``N``.
+    Until ``train_threshold`` vectors have been added the index keeps a single
+    list and behaves like an exact flat scan.
+    
+    Inside an event loop, k-means runs in a worker thread: searches keep
+    using the current lists until the trained ones are swapped in.
+    """
+    
+    def __init__(
+        self,
+        nlist: int = 1024,
+        nprobe: int = 16,
+        train_threshold: Optional[int] = None,
+        kmeans_iterations: int = 20,
+        train_sample_size: int = 100_000,
+        retrain_growth: float = 4.0,
+        path: Optional[str] = None,
+        seed: int = 0
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        # k-means needs a few dozen points per centroid to be meaningful
+        self.train_threshold = train_threshold or nlist * 39
+        self.kmeans_iterations = kmeans_iterations
+        self.train_sample_size = train_sample_size
+        self.retrain_growth = retrain_growth
+        self.seed = seed
+        self._training: Optional[asyncio.Task] = None
+        self._generation = 0  # bumped on reset: a training run started before it is discarded
+        super().__init__(path)
+    
+    def _reset(self):
+        self.dim: Optional[int] = None
+        self.size = 0
+        self.trained_size = 0
+        self.centroids: Optional[np.ndarray] = None  # (nlist, dim), unit rows
+        self._vectors: List[np.ndarray] = []  # per-list (capacity, dim) float32
+        self._list_ids: List[List[str]] = []
+        self._location: Dict[str, Tuple[int, int]] = {}  # chunk id -> (list, position)
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        self._changed: set = set()  # ids added or removed while training in the background
+        self._generation += 1
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._location
+    
+    def ids(self) -> List[str]:
+        return list(self._location)
+    
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+    
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Nearest centroid for each (unit) vector."""
+        if self.centroids is None:
+            return np.zeros(len(vectors), dtype=np.int64)
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+    
+    def _append(self, list_no: int, chunk_ids: List[str], vectors: np.ndarray):
+        """Append vectors to one inverted list, growing its buffer geometrically."""
+        while len(self._vectors) <= list_no:
+            self._vectors.append(np.zeros((0, self.dim), dtype=np.float32))
+            self._list_ids.append([])
+        ids = self._list_ids[list_no]
+        buffer = self._vectors[list_no]
+        start = len(ids)
+        needed = start + len(chunk_ids)
+        if needed > buffer.shape[0]:
+            grown = np.zeros((max(needed, 2 * buffer.shape[0], 16), self.dim), dtype=np.float32)
+            grown[:start] = buffer[:start]
+            self._vectors[list_no] = buffer = grown
+        buffer[start:needed] = vectors
+        for offset, chunk_id in enumerate(chunk_ids):
+            ids.append(chunk_id)
+            self._location[chunk_id] = (list_no, start + offset)
+    
+    def add(self, ids: List[str], vectors: np.ndarray, metadata: Optional[List[Dict[str, Any]]] = None):
+        if not ids:
+            return
+        vectors = normalize_rows(np.array(vectors, dtype=np.float32, ndmin=2))
+        metadata = metadata or [{} for _ in ids]
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+        
+        # Re-adding an id replaces it (it may belong to a different list now)
+        self.remove([chunk_id for chunk_id in ids if chunk_id in self._location])
+        if self._training is not None:
+            self._changed.update(ids)
+        
+        assignments = self._assign(vectors)
+        for list_no in np.unique(assignments):
+            rows = np.nonzero(assignments == list_no)[0]
+            self._append(int(list_no), [ids[i] for i in rows], vectors[rows])
+        for chunk_id, meta in zip(ids, metadata):
+            self._meta[chunk_id] = meta
+        self.size += len(ids)
+        self._schedule_training()
+    
+    def _needs_training(self) -> bool:
+        if self.size < max(self.nlist, self.train_threshold):
+            return False
+        # Centroids learned on a much smaller KB no longer balance the lists
+        return not self.is_trained or self.size >= self.trained_size * self.retrain_growth
+    
+    def _schedule_training(self):
+        """Start training in the background when due (inline when there is no event loop)."""
+        if self._training is not None or not self._needs_training():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.train()
+            return
+        self._training = loop.create_task(self.train_async())
+    
+    def remove(self, ids: Iterable[str]) -> int:
+        removed = 0
+        for chunk_id in ids:
+            if self._training is not None:
+                self._changed.add(chunk_id)
+            location = self._location.pop(chunk_id, None)
+            if location is None:
+                continue
+            list_no, pos = location
+            list_ids = self._list_ids[list_no]
+            buffer = self._vectors[list_no]
+            last = len(list_ids) - 1
+            if pos != last:
+                buffer[pos] = buffer[last]
+                list_ids[pos] = list_ids[last]
+                self._location[list_ids[pos]] = (list_no, pos)
+            list_ids.pop()
+            self._meta.pop(chunk_id, None)
+            self.size -= 1
+            removed += 1
+        return removed
+    
+    def _all_vectors(self) -> Tuple[List[str], np.ndarray]:
+        """Concatenate every list into one (ids, matrix) pair."""
+        ids = [chunk_id for list_ids in self._list_ids for chunk_id in list_ids]
+        if not ids:
+            return ids, np.zeros((0, self.dim or 0), dtype=np.float32)
+        matrix = np.concatenate([
+            buffer[:len(list_ids)] for buffer, list_ids in zip(self._vectors, self._list_ids)
+        ])
+        return ids, matrix
+    
+    def _kmeans(self, matrix: np.ndarray) -> np.ndarray:
+        """Spherical k-means centroids (``nlist`` unit rows) for a set of unit vectors."""
+        rng = np.random.default_rng(self.seed)
+        sample = matrix
+        if len(matrix) > self.train_sample_size:
+            sample = matrix[rng.choice(len(matrix), self.train_sample_size, replace=False)]
+        
+        centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=self.nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty clusters from random points
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+            centroids = normalize_rows(sums)
+        return centroids.astype(np.float32)
+    
+    def _build_lists(self, ids: List[str], matrix: np.ndarray) -> Tuple[np.ndarray, List[np.ndarray], List[List[str]]]:
+        """Train centroids and group a copy of the vectors into their lists (safe to run in a thread)."""
+        centroids = self._kmeans(matrix)
+        assignments = np.argmax(matrix @ centroids.T, axis=1)
+        vectors, list_ids = [], []
+        for list_no in range(self.nlist):
+            rows = np.nonzero(assignments == list_no)[0]
+            vectors.append(matrix[rows])
+            list_ids.append([ids[i] for i in rows])
+        return centroids, vectors, list_ids
+    
+    def _install(self, centroids: np.ndarray, vectors: List[np.ndarray], list_ids: List[List[str]]):
+        """Replace the centroids and inverted lists with trained ones."""
+        self.centroids = centroids
+        self._vectors, self._list_ids = vectors, list_ids
+        self._location = {
+            chunk_id: (list_no, pos)
+            for list_no, chunk_ids in enumerate(list_ids)
+            for pos, chunk_id in enumerate(chunk_ids)
+        }
+        self.size = self.trained_size = len(self._location)
+    
+    def train(self):
+        """Learn centroids with spherical k-means and redistribute all vectors."""
+        ids, matrix = self._all_vectors()
+        if len(ids) < self.nlist:
+            return
+        started = time.perf_counter()
+        self._install(*self._build_lists(ids, matrix))
+        print(f"Trained IVF index: {len(ids)} vectors, {self.nlist} lists in {time.perf_counter() - started:.1f}s")
+    
+    async def train_async(self):
+        """Train on a copy of the vectors in a worker thread, then swap the result in.
+        
+        Vectors added or removed meanwhile are replayed onto the trained lists.
+        """
+        try:
+            await self._train_in_background()
+        except Exception as e:
+            print(f"Error training IVF index: {e}")
+            return
+        finally:
+            self._training = None
+            self._changed = set()
+        # Grew past the retrain point (or was reloaded) while training
+        self._schedule_training()
+    
+    async def _train_in_background(self):
+        generation = self._generation
+        ids, matrix = self._all_vectors()
+        self._changed = set()
+        if len(ids) < self.nlist:
+            return
+        started = time.perf_counter()
+        trained = await asyncio.to_thread(self._build_lists, ids, matrix)
+        if generation != self._generation:
+            return  # cleared or reloaded while training
+        
+        changed = [chunk_id for chunk_id in self._changed if chunk_id in self._location]
+        current = [self._vectors[l][p] for l, p in (self._location[i] for i in changed)]
+        meta = [self._meta[i] for i in changed]
+        self._install(*trained)
+        self.remove(list(self._changed))
+        if changed:
+            self.add(changed, np.stack(current), meta)
+        print(f"Trained IVF index: {len(ids)} vectors, {self.nlist} lists in {time.perf_counter() - started:.1f}s")
+        await self.persist()
+    
+    def search(self, query_vector: List[float], k: int, allowed_ids: Optional[Iterable[str]] = None, nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        if self.size == 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+        
+        if allowed_ids is not None:
+            # Filtered queries: exact scan over the (usually small) allowed subset
+            candidates = [self._location[i] for i in allowed_ids if i in self._location]
+            if not candidates:
+                return []
+            matrix = np.stack([self._vectors[l][p] for l, p in candidates])
+            ids = [self._list_ids[l][p] for l, p in candidates]
+            scores = matrix @ query
+            best = top_k(scores, k)
+            return self._results(ids, scores, best)
+        
+        if self.is_trained:
+            probe = top_k(self.centroids @ query, min(nprobe or self.nprobe, self.nlist))
+        else:
+            probe = np.arange(len(self._list_ids))
+        
+        ids, score_parts = [], []
+        for list_no in probe:
+            list_ids = self._list_ids[list_no]
+            if not list_ids:
+                continue
+            score_parts.append(self._vectors[list_no][:len(list_ids)] @ query)
+            ids.extend(list_ids)
+        if not ids:
+            return []
+        scores = np.concatenate(score_parts)
+        return self._results(ids, scores, top_k(scores, k))
+    
+    def _results(self, ids: List[str], scores: np.ndarray, positions: np.ndarray) -> List[Dict[str, Any]]:
+        return [
+            {"id": ids[pos], **self._meta[ids[pos]], "score": float(scores[pos])}
+            for pos in positions
+        ]
+    
+    def _manifest_path(self, path: Path) -> Path:
+        return path.parent / f"{path.name}.manifest.json"
+    
+    def _prepare_save(self) -> Optional[Callable[[str], None]]:
+        ids, matrix = self._all_vectors()
+        arrays = {
+            "vectors": matrix,
+            "list_sizes": np.array([len(list_ids) for list_ids in self._list_ids], dtype=np.int64)
+        }
+        if self.centroids is not None:
+            arrays["centroids"] = self.centroids
+        side = {
+            "version": self.kb_version,
+            "dim": self.dim,
+            "nlist": self.nlist,
+            "trained_size": self.trained_size,
+            "ids": ids,
+            "meta": [self._meta[i] for i in ids]
+        }
+        return lambda path: self._write(Path(path), arrays, side)
+    
+    def _write(self, path: Path, arrays: Dict[str, np.ndarray], side: Dict[str, Any]):
+        """Write a new versioned pair, then point the manifest at it."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        version = side["version"] or 0
+        stem = f"{path.name}-v{version}-{os.getpid()}-{time.time_ns()}"
+        
+        # Write to temp files first so a crash never leaves a half-written pair
+        tmp_npz = path.parent / f"{stem}.npz.tmp"
+        tmp_json = path.parent / f"{stem}.json.tmp"
+        with open(tmp_npz, "wb") as f:
+            np.savez(f, **arrays)
+        with open(tmp_json, "w", encoding="utf-8") as f:
+            json.dump(side, f)
+        tmp_npz.replace(path.parent / f"{stem}.npz")
+        tmp_json.replace(path.parent / f"{stem}.json")
+        
+        manifest_path = self._manifest_path(path)
+        tmp_manifest = path.parent / f"{manifest_path.name}.{os.getpid()}.tmp"
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump({"version": version, "vectors": f"{stem}.npz", "sidecar": f"{stem}.json"}, f)
+        tmp_manifest.replace(manifest_path)
+        
+        # Drop older pairs: lower versions, and this process's earlier saves of this one
+        # (a reader that already opened a file keeps its handle)
+        for old in path.parent.glob(f"{path.name}-v*"):
+            try:
+                old_version, old_pid = old.name[len(path.name) + 2:].split("-")[:2]
+                if old.name.split(".")[0] == stem:
+                    continue
+                if int(old_version) < version or (int(old_version) == version and int(old_pid) == os.getpid()):
+                    old.unlink()
+            except (ValueError, OSError):
+                pass
+    
+    def read(self, path: str) -> bool:
+        path = Path(path)
+        with open(self._manifest_path(path), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(path.parent / manifest["sidecar"], "r", encoding="utf-8") as f:
+            side = json.load(f)
+        if side["nlist"] != self.nlist:
+            raise ValueError(f"Persisted index has nlist={side['nlist']}, expected {self.nlist}")
+        
+        arrays = np.load(path.parent / manifest["vectors"])
+        self._reset()
+        self.dim = side["dim"]
+        self.trained_size = side["trained_size"]
+        self.centroids = arrays["centroids"] if "centroids" in arrays else None
+        matrix = arrays["vectors"]
+        start = 0
+        for list_no, count in enumerate(arrays["list_sizes"]):
+            count = int(count)
+            self._append(list_no, side["ids"][start:start + count], matrix[start:start + count])
+            start += count
+        self._meta = dict(zip(side["ids"], side["meta"]))
+        self.size = len(side["ids"])
+        self.kb_version = side["version"]
+        return True
+    
+    def exists(self) -> bool:
+        return bool(self.path) and self._manifest_path(Path(self.path)).exists()
+
+
+def measure_recall(index: IVFFlatIndex, queries: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> Dict[str, float]:
+    """Compare IVF results against an exact scan of the same vectors."""
+    ids, matrix = index._all_vectors()
+    queries = normalize_rows(np.array(queries, dtype=np.float32, ndmin=2))
+    hits = 0
+    ann_seconds = exact_seconds = 0.0
+    for query in queries:
+        started = time.perf_counter()
+        exact = {ids[i] for i in top_k(matrix @ query, k)}
+        exact_seconds += time.perf_counter() - started
+        
+        started = time.perf_counter()
+        approx = {r["id"] for r in index.search(query, k, nprobe=nprobe)}
+        ann_seconds += time.perf_counter() - started
+        hits += len(exact & approx)
+    
+    return {
+        f"recall@{k}": hits / (len(queries) * k),
+        "ann_ms": 1000 * ann_seconds / len(queries),
+        "exact_ms": 1000 * exact_seconds / len(queries)
+    }
+
+
+if __name__ == "__main__":
+    # Synthetic recall/latency check: python -m packages.rag.ann [num_vectors] [dim]
+    import sys
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    rng = np.random.default_rng(42)
+    
+    # Clustered data resembles real embeddings far better than uniform noise
+    centers = rng.normal(size=(200, dim)).astype(np.float32)
+    data = centers[rng.integers(0, 200, n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    index = IVFFlatIndex(nlist=max(16, int(np.sqrt(n))))
+    index.add([str(i) for i in range(n)], data)
+    if not index.is_trained:
+        index.train()
+    
+    queries = data[rng.choice(n, 100, replace=False)] + 0.1 * rng.normal(size=(100, dim)).astype(np.float32)
+    for nprobe in (1, 4, 8, 16, 32, 64):
+        print(f"nprobe={nprobe}: {measure_recall(index, queries, k=10, nprobe=nprobe)}")
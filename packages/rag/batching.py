@@ -0,0 +1,118 @@
+"""Micro-batching of concurrent query embedding requests."""
+from typing import List, Dict, Any, Optional, Tuple
+import asyncio
+import time
+import sys
+from pathlib import Path
+
+# Add apps/api to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from config import settings
+from .embedding_service import get_embedding_service
+
+
+class QueryEmbeddingBatcher:
+    """Coalesces concurrent single-query embedding calls into batched requests.
+
+    The first request opens a batch; requests arriving within ``window_ms``
+    (or until ``max_batch_size`` is reached) join it and are sent as one
+    embeddings call. Identical texts in flight share a single slot.
+    """
+    
+    def __init__(self, window_ms: float = 5.0, max_batch_size: int = 64):
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        # (model, options) -> {text: (future, enqueued_at)}
+        self._pending: Dict[Tuple, Dict[str, Tuple[asyncio.Future, float]]] = {}
+        self._timers: Dict[Tuple, asyncio.TimerHandle] = {}
+        self._tasks: set = set()  # keep references to in-flight sends
+        self.batches = 0
+        self.requests = 0
+        self.coalesced = 0
+        self.max_batch = 0
+        self.total_batch_size = 0
+        self.total_queue_delay = 0.0
+        self.max_queue_delay = 0.0
+    
+    async def embed(self, text: str, model: str, **options) -> List[float]:
+        """Embed one text as part of the next batch."""
+        loop = asyncio.get_running_loop()
+        key = (model, tuple(sorted(options.items())))
+        batch = self._pending.setdefault(key, {})
+        self.requests += 1
+        
+        if text in batch:
+            # Same text already waiting: share its result
+            self.coalesced += 1
+            return await asyncio.shield(batch[text][0])
+        
+        future = loop.create_future()
+        batch[text] = (future, time.perf_counter())
+        if len(batch) >= self.max_batch_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await asyncio.shield(future)
+    
+    def _flush(self, key: Tuple):
+        """Send everything pending for ``key`` as one request."""
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if batch:
+            task = asyncio.ensure_future(self._send(key, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _send(self, key: Tuple, batch: Dict[str, Tuple[asyncio.Future, float]]):
+        model, options = key
+        texts = list(batch)
+        now = time.perf_counter()
+        delays = [now - enqueued_at for _, enqueued_at in batch.values()]
+        
+        self.batches += 1
+        self.total_batch_size += len(texts)
+        self.max_batch = max(self.max_batch, len(texts))
+        self.total_queue_delay += sum(delays)
+        self.max_queue_delay = max(self.max_queue_delay, max(delays))
+        
+        try:
+            vectors = await get_embedding_service().embed(texts, model, **dict(options))
+        except Exception as e:
+            for future, _ in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (future, _), vector in zip(batch.values(), vectors):
+            if not future.done():
+                future.set_result(vector)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Batch size and queueing delay metrics."""
+        queued = self.total_batch_size
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "coalesced_duplicates": self.coalesced,
+            "avg_batch_size": queued / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch,
+            "avg_queue_delay_ms": 1000 * self.total_queue_delay / queued if queued else 0.0,
+            "max_queue_delay_ms": 1000 * self.max_queue_delay
+        }
+
+
+# Global batcher instance (one per process)
+_query_batcher: Optional[QueryEmbeddingBatcher] = None
+
+
+def get_query_batcher() -> QueryEmbeddingBatcher:
+    """Get the process-wide query embedding batcher."""
+    global _query_batcher
+    if _query_batcher is None:
+        _query_batcher = QueryEmbeddingBatcher(
+            window_ms=settings.embedding_batch_window_ms,
+            max_batch_size=settings.embedding_batch_max_size
+        )
+    return _query_batcher
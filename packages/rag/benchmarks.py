@@ -0,0 +1,440 @@
+"""Offline benchmarks for the RAG pipeline.
+
+Usage:
+    python -m packages.rag.benchmarks dims [256 512 1024 ...]
+    python -m packages.rag.benchmarks memory [100 400 ...]
+    python -m packages.rag.benchmarks memcheck [max_growth_mb]
+    python -m packages.rag.benchmarks chunking [synthetic_mb]
+    python -m packages.rag.benchmarks dedup [threshold ...]
+    python -m packages.rag.benchmarks warmstart [snapshot_dir]
+"""
+from typing import List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import asyncio
+import itertools
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import PyPDF2
+
+# Add parent directories to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from .loaders import load_file, open_document, iter_pdf_pages
+from .chunkers import chunk_text, chunk_stream
+from .embeddings import get_embeddings, truncate_embedding
+from .vector_index import normalize_rows, top_k
+from config import settings
+from .dedup import MinHashLSH, shingle_hashes
+
+
+SEEDS_DIR = Path(__file__).parent.parent.parent / "seeds" / "kb"
+
+# Typical helpdesk questions covering the seeds/kb articles
+SAMPLE_QUERIES = [
+    "How do I set up MFA on my phone?",
+    "I lost my phone and can't get my authenticator codes",
+    "VPN keeps disconnecting",
+    "VPN authentication failed",
+    "How do I reset my password?",
+    "My account is locked out",
+    "How do I set up email on my iPhone?",
+    "Outlook is not syncing",
+    "How do I join a Teams meeting?",
+    "Teams microphone not working",
+    "Setting up a new laptop",
+    "How do I install company software on my laptop?",
+]
+
+
+async def load_corpus_chunks(directory: Path = SEEDS_DIR, chunk_size: int = 120, chunk_overlap: int = 20) -> List[str]:
+    """Chunk every seed article (small chunks so the corpus has enough candidates)."""
+    texts = []
+    for path in sorted(directory.glob("*.md")):
+        doc = await load_file(str(path))
+        texts.extend(c["text"] for c in chunk_text(doc["rawText"], chunk_size=chunk_size, chunk_overlap=chunk_overlap))
+    return texts
+
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray, queries_ref: np.ndarray, queries_cand: np.ndarray, k: int) -> float:
+    """Fraction of the reference top-k found in the candidate top-k, averaged over queries."""
+    hits = 0
+    for q_ref, q_cand in zip(queries_ref, queries_cand):
+        expected = set(top_k(reference @ q_ref, k).tolist())
+        found = set(top_k(candidate @ q_cand, k).tolist())
+        hits += len(expected & found)
+    return hits / (len(queries_ref) * k)
+
+
+async def benchmark_dimensions(dims: List[int], ks: List[int] = (1, 3, 5)) -> List[Dict[str, Any]]:
+    """Recall@k of truncated (Matryoshka) embeddings against full-dimension search."""
+    texts = await load_corpus_chunks()
+    print(f"Embedding {len(texts)} chunks and {len(SAMPLE_QUERIES)} queries at full dimension...")
+    
+    # Full-dimension reference embeddings (dimensions=0 ignores EMBEDDING_DIMENSIONS)
+    chunk_vectors = await get_embeddings(texts, dimensions=0)
+    query_vectors = await get_embeddings(SAMPLE_QUERIES, dimensions=0)
+    reference = normalize_rows(np.asarray(chunk_vectors, dtype=np.float32))
+    reference_queries = normalize_rows(np.asarray(query_vectors, dtype=np.float32))
+    
+    rows = []
+    for d in dims:
+        truncated = np.asarray([truncate_embedding(v, d) for v in chunk_vectors], dtype=np.float32)
+        truncated_queries = np.asarray([truncate_embedding(v, d) for v in query_vectors], dtype=np.float32)
+        
+        started = time.perf_counter()
+        for q in truncated_queries:
+            truncated @ q
+        search_us = 1e6 * (time.perf_counter() - started) / len(truncated_queries)
+        
+        row = {
+            "dims": d,
+            "bytes_per_vector": d * 4,
+            "search_us": round(search_us, 1),
+            **{f"recall@{k}": round(recall_at_k(reference, truncated, reference_queries, truncated_queries, k), 3) for k in ks}
+        }
+        rows.append(row)
+        print(row)
+    return rows
+
+
+def write_synthetic_pdf(path: str, pages: int, lines_per_page: int = 60, seed: int = 0):
+    """Write a plain-text PDF of ``pages`` pages of pseudo-random helpdesk prose."""
+    rng = random.Random(seed)
+    words = " ".join(SAMPLE_QUERIES).lower().replace("?", "").split()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page ids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for _ in range(pages):
+        lines = [" ".join(rng.choice(words) for _ in range(12)) for _ in range(lines_per_page)]
+        content = "BT /F1 9 Tf 11 TL 36 806 Td " + " ".join(f"({line}) Tj T*" for line in lines) + " ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content.encode("latin-1") + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (len(objects))
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()
+    
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def _load_pdf_whole(path: str) -> List[Dict[str, Any]]:
+    """The original loader: concatenate every page, then chunk the whole text."""
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        text = ""
+        for page in reader.pages:
+            text += page.extract_text() + "\n"
+    return chunk_text(text)
+
+
+def _load_pdf_streaming(path: str) -> int:
+    """Streaming loader feeding the chunker; chunks are consumed, not kept."""
+    return sum(1 for _ in chunk_stream(iter_pdf_pages(path)))
+
+
+def benchmark_memory(page_counts: List[int]) -> List[Dict[str, Any]]:
+    """Peak Python heap while loading and chunking synthetic PDFs of increasing length.
+    
+    The streaming loader's peak should stay flat as the page count grows; the
+    whole-document loader's grows with it.
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in page_counts:
+            path = str(Path(tmp) / f"synthetic_{pages}.pdf")
+            write_synthetic_pdf(path, pages)
+            row = {"pages": pages, "file_mb": round(Path(path).stat().st_size / 1e6, 2)}
+            for name, load in (("whole", _load_pdf_whole), ("streaming", _load_pdf_streaming)):
+                tracemalloc.start()
+                started = time.perf_counter()
+                load(path)
+                row[f"{name}_s"] = round(time.perf_counter() - started, 2)
+                row[f"{name}_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+                tracemalloc.stop()
+            rows.append(row)
+            print(row)
+    return rows
+
+
+def write_synthetic_html(path: str, megabytes: float, paragraphs_per_section: int = 20, seed: int = 0):
+    """Write an HTML page of about ``megabytes`` MB of helpdesk prose under <h2> sections (generated as it is written)."""
+    rng = random.Random(seed)
+    words = " ".join(SAMPLE_QUERIES).lower().replace("?", "").split()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<html><head><title>Synthetic helpdesk handbook</title></head><body>\n")
+        number = 0
+        while f.tell() < megabytes * 1e6:
+            if number % paragraphs_per_section == 0:
+                f.write(f"<h2>Section {number // paragraphs_per_section + 1}</h2>\n")
+            f.write(f"<p>{_synthetic_paragraph(rng, words)}</p>\n")
+            number += 1
+        f.write("</body></html>\n")
+
+
+def _current_rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:")) / 1024
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process (VmHWM on Linux, ru_maxrss elsewhere)."""
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+    except (OSError, StopIteration):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def _reset_peak_rss() -> float:
+    """Restart peak RSS tracking where the kernel allows it. Returns the baseline to measure growth from."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _current_rss_mb()
+    except OSError:
+        # The peak can't be reset: growth is measured from the peak so far
+        return _peak_rss_mb()
+
+
+def _ingest_peak_rss(path: str, warmup_path: str, window: int) -> Dict[str, Any]:
+    """Load and chunk a file window by window as ingest_document does, minus embedding and
+    writes (runs in a fresh worker process). Returns chunk count and RSS growth in MB."""
+    def ingest(file_path: str) -> int:
+        chunks = chunk_stream(open_document(file_path)["sections"])
+        count = 0
+        while batch := list(itertools.islice(chunks, window)):
+            count += len(batch)
+        return count
+    
+    # Import and warm up parsers on a small file first, so only document-dependent growth is measured
+    ingest(warmup_path)
+    baseline = _reset_peak_rss()
+    started = time.perf_counter()
+    chunks = ingest(path)
+    return {
+        "chunks": chunks,
+        "seconds": round(time.perf_counter() - started, 2),
+        "baseline_rss_mb": round(baseline, 1),
+        "rss_growth_mb": round(max(0.0, _peak_rss_mb() - baseline), 1)
+    }
+
+
+def check_memory_ceiling(
+    max_growth_mb: float = 32.0,
+    pdf_pages: List[int] = (100, 800),
+    html_mb: List[float] = (5, 50)
+) -> List[Dict[str, Any]]:
+    """Peak RSS growth while ingesting generated PDFs and HTML files of increasing size.
+    
+    Each file is loaded and chunked in a fresh process; a row is ``ok`` when
+    the growth over the warmed-up baseline stays within ``max_growth_mb``.
+    Growth should not follow the file size.
+    """
+    window = settings.ingest_write_batch_size
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        warmup = {"pdf": str(Path(tmp) / "warmup.pdf"), "html": str(Path(tmp) / "warmup.html")}
+        write_synthetic_pdf(warmup["pdf"], 2)
+        write_synthetic_html(warmup["html"], 0.05)
+        cases = [("pdf", f"{pages} pages", pages) for pages in pdf_pages]
+        cases += [("html", f"{mb:g} MB", mb) for mb in html_mb]
+        for kind, label, size in cases:
+            path = str(Path(tmp) / f"synthetic_{size}.{kind}")
+            if kind == "pdf":
+                write_synthetic_pdf(path, size)
+            else:
+                write_synthetic_html(path, size)
+            # A fresh process per file: peak RSS can't go back down within one
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                result = pool.submit(_ingest_peak_rss, path, warmup[kind], window).result()
+            row = {"file": f"{kind} {label}", "file_mb": round(os.path.getsize(path) / 1e6, 2), **result}
+            row["ok"] = row["rss_growth_mb"] <= max_growth_mb
+            os.remove(path)
+            rows.append(row)
+            print(row)
+    return rows
+
+
+def synthetic_document(megabytes: float, seed: int = 0) -> str:
+    """Pseudo-random helpdesk prose in paragraphs of a few sentences."""
+    rng = random.Random(seed)
+    words = " ".join(SAMPLE_QUERIES).lower().replace("?", "").split()
+    paragraphs, size = [], 0
+    while size < megabytes * 1e6:
+        paragraph = _synthetic_paragraph(rng, words)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def _synthetic_paragraph(rng: random.Random, words: List[str]) -> str:
+    sentences = [" ".join(rng.choice(words) for _ in range(rng.randint(6, 20))).capitalize() + "." for _ in range(rng.randint(2, 8))]
+    return " ".join(sentences)
+
+
+async def benchmark_chunking(synthetic_mb: float = 2.0, chunk_size: int = 500, chunk_overlap: int = 50) -> List[Dict[str, Any]]:
+    """Throughput of the chunker on seeds/kb and a large synthetic doc."""
+    seeds = [(await load_file(str(path)))["rawText"] for path in sorted(SEEDS_DIR.glob("*.md"))]
+    corpora = {
+        "seeds/kb": seeds,
+        f"synthetic {synthetic_mb:g}MB": [synthetic_document(synthetic_mb)],
+    }
+    rows = []
+    for corpus, texts in corpora.items():
+        size_mb = sum(len(t) for t in texts) / 1e6
+        # Repeat small corpora so timings are measurable
+        repeats = max(1, int(1 / size_mb)) if size_mb < 1 else 1
+        chunk_text(texts[0][:1000], chunk_size, chunk_overlap)  # warm up the encoder
+        started = time.perf_counter()
+        for _ in range(repeats):
+            chunks = [c for text in texts for c in chunk_text(text, chunk_size, chunk_overlap)]
+        elapsed = (time.perf_counter() - started) / repeats
+        row = {
+            "corpus": corpus,
+            "chunks": len(chunks),
+            "avg_tokens": round(sum(c["tokens"] for c in chunks) / len(chunks), 1) if chunks else 0,
+            "max_tokens": max((c["tokens"] for c in chunks), default=0),
+            "ms": round(1000 * elapsed, 1),
+            "mb_per_s": round(size_mb / elapsed, 2)
+        }
+        rows.append(row)
+        print(row)
+    return rows
+
+
+def _variant(text: str, edit_rate: float, rng: random.Random) -> str:
+    """A lightly edited copy of an article (a per-region or copied variant)."""
+    words = text.split(" ")
+    for i in range(len(words)):
+        if rng.random() < edit_rate:
+            words[i] = rng.choice(["EU", "APAC", "US", "regional", "corporate", "office"])
+    return " ".join(words)
+
+
+async def benchmark_dedup(thresholds: List[float], edit_rate: float = 0.01, copies: int = 2, seed: int = 0) -> List[Dict[str, Any]]:
+    """MinHash/LSH detection against exact shingle Jaccard on seeds/kb plus edited copies."""
+    rng = random.Random(seed)
+    seeds = [(await load_file(str(path)))["rawText"] for path in sorted(SEEDS_DIR.glob("*.md"))]
+    documents = seeds + [_variant(text, edit_rate, rng) for text in seeds for _ in range(copies)]
+    chunks = [c["text"] for text in documents for c in chunk_text(text, 500, 50)]
+    shingles = [set(shingle_hashes(text).tolist()) for text in chunks]
+    
+    def jaccard(a: set, b: set) -> float:
+        return len(a & b) / len(a | b) if a | b else 0.0
+    
+    rows = []
+    for threshold in thresholds:
+        # Ground truth: chunks with an earlier chunk at or above the threshold
+        truth = [
+            any(jaccard(shingles[i], shingles[j]) >= threshold for j in range(i))
+            for i in range(len(chunks))
+        ]
+        index = MinHashLSH(threshold=threshold)
+        started = time.perf_counter()
+        signatures = [index.signature(text) for text in chunks]
+        signing = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        detected = []
+        for i, signature in enumerate(signatures):
+            match = index.query(signature) if signature is not None else None
+            detected.append(match is not None)
+            if match is None and signature is not None:
+                index.add(str(i), "", signature)
+        querying = time.perf_counter() - started
+        
+        true_positives = sum(d and t for d, t in zip(detected, truth))
+        row = {
+            "threshold": threshold,
+            "bands_x_rows": f"{index.bands}x{index.rows}",
+            "chunks": len(chunks),
+            "true_duplicates": sum(truth),
+            "detected": sum(detected),
+            "recall": round(true_positives / sum(truth), 3) if sum(truth) else None,
+            "precision": round(true_positives / sum(detected), 3) if sum(detected) else None,
+            "index_reduction": round(sum(detected) / len(chunks), 3),
+            "sign_ms_per_chunk": round(1000 * signing / len(chunks), 3),
+            "query_ms_per_chunk": round(1000 * querying / len(chunks), 3)
+        }
+        rows.append(row)
+        print(row)
+    return rows
+
+
+async def benchmark_warm_start(snapshot_dir: str = None) -> List[Dict[str, Any]]:
+    """Vector index cold start: streaming kb_chunks from MongoDB vs mapping a snapshot."""
+    from db import get_database
+    from .vector_index import FlatVectorIndex
+    from .snapshot import write_snapshot
+    
+    database = await get_database()
+    snapshot_dir = snapshot_dir or tempfile.mkdtemp()
+    await write_snapshot(database.kb_chunks, snapshot_dir)
+    
+    rows = []
+    for source in ("mongodb", "snapshot"):
+        settings.vector_snapshot_path = snapshot_dir if source == "snapshot" else None
+        index = FlatVectorIndex()
+        tracemalloc.start()
+        started = time.perf_counter()
+        await index.load(database.kb_chunks)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        row = {
+            "source": source,
+            "chunks": len(index),
+            "dim": index.dim,
+            "load_ms": round(1000 * elapsed, 1),
+            # Mapped pages are shared page cache, not private heap
+            "private_peak_mb": round(peak / 1e6, 2)
+        }
+        rows.append(row)
+        print(row)
+    return rows
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "dims":
+        dims = [int(d) for d in sys.argv[2:]] or [256, 512, 1024, 1536]
+        asyncio.run(benchmark_dimensions(dims))
+    elif len(sys.argv) >= 2 and sys.argv[1] == "memory":
+        benchmark_memory([int(p) for p in sys.argv[2:]] or [50, 200, 800])
+    elif len(sys.argv) >= 2 and sys.argv[1] == "memcheck":
+        rows = check_memory_ceiling(float(sys.argv[2]) if len(sys.argv) > 2 else 32.0)
+        if not all(row["ok"] for row in rows):
+            print("Peak RSS growth above the ceiling")
+            sys.exit(1)
+    elif len(sys.argv) >= 2 and sys.argv[1] == "chunking":
+        asyncio.run(benchmark_chunking(float(sys.argv[2]) if len(sys.argv) > 2 else 2.0))
+    elif len(sys.argv) >= 2 and sys.argv[1] == "dedup":
+        asyncio.run(benchmark_dedup([float(t) for t in sys.argv[2:]] or [0.8, 0.9]))
+    elif len(sys.argv) >= 2 and sys.argv[1] == "warmstart":
+        asyncio.run(benchmark_warm_start(sys.argv[2] if len(sys.argv) > 2 else None))
+    else:
+        print(__doc__)
+        sys.exit(1)
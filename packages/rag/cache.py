@@ -0,0 +1,138 @@
+"""Small caching primitives shared by the RAG and orchestrator layers."""
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from pathlib import Path
+import sqlite3
+import time
+
+
+class LRUCache:
+    """Bounded in-memory LRU cache with an optional per-entry TTL."""
+    
+    def __init__(self, max_size: int = 1024, ttl_seconds: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None on a miss or expired entry."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key: str, value: Any):
+        """Store a value, evicting the least recently used entry when full."""
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+    
+    def clear(self):
+        """Drop all entries (counters are kept)."""
+        self._data.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class SQLiteCache:
+    """Persistent key/blob store backed by a local SQLite file.
+
+    Used as a second tier behind LRUCache so cached values survive restarts.
+    Lookups are single-row primary-key reads, cheap enough to run inline.
+    """
+    
+    def __init__(self, path: str, table: str = "cache", ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+    
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the stored blob, or None on a miss or expired entry."""
+        row = self._conn.execute(f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.ttl_seconds and row[1] + self.ttl_seconds < time.time()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+    
+    def set(self, key: str, value: bytes):
+        """Store (or overwrite) a blob."""
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, created_at) VALUES (?, ?, ?)",
+            (key, value, time.time())
+        )
+    
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """Return the stored blobs for ``keys`` (missing or expired keys are omitted)."""
+        found: Dict[str, bytes] = {}
+        cutoff = time.time() - self.ttl_seconds if self.ttl_seconds else None
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, value, created_at FROM {self.table} WHERE key IN ({placeholders})", batch
+            )
+            for key, value, created_at in rows:
+                if cutoff is None or created_at >= cutoff:
+                    found[key] = value
+        self.hits += len(found)
+        self.misses += len(set(keys)) - len(found)
+        return found
+    
+    def set_many(self, items: Dict[str, bytes]):
+        """Store several blobs in one transaction."""
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at) VALUES (?, ?, ?)",
+                [(key, value, now) for key, value in items.items()]
+            )
+    
+    def purge_expired(self) -> int:
+        """Delete expired rows. Returns the number deleted."""
+        if not self.ttl_seconds:
+            return 0
+        cursor = self._conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        return cursor.rowcount
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring."""
+        return {"path": self.path, "hits": self.hits, "misses": self.misses}
@@ -1,73 +1,124 @@
 """Text chunking utilities."""
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Optional
+from functools import lru_cache
+import bisect
+import re
+import numpy as np
 import tiktoken
 
 
+# Chunk boundaries, best first: paragraph breaks, then sentence ends (matched on UTF-8 bytes)
+PARAGRAPH_BREAK = re.compile(rb"\n[ \t]*\n\s*")
+SENTENCE_END = re.compile(rb"[.!?][)\"']?\s+")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = "cl100k_base") -> tiktoken.Encoding:
+    """Cached tiktoken encoding (loading one is expensive)."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+@lru_cache(maxsize=None)
+def _token_byte_lengths(encoding_name: str) -> np.ndarray:
+    """Byte length of every token id in the vocabulary (0 for unused ids)."""
+    encoding = get_encoding(encoding_name)
+    lengths = np.zeros(encoding.n_vocab, dtype=np.int64)
+    for token in range(encoding.n_vocab):
+        try:
+            lengths[token] = len(encoding.decode_single_token_bytes(token))
+        except KeyError:
+            pass
+    return lengths
+
+
+def _token_bounds(pattern: re.Pattern, data: bytes, offsets: np.ndarray) -> List[int]:
+    """Token indices at which a ``pattern`` match ends (where a new paragraph/sentence starts)."""
+    ends = [match.end() for match in pattern.finditer(data)]
+    if not ends:
+        return []
+    bounds = np.unique(np.searchsorted(offsets, ends))
+    return bounds[(bounds > 0) & (bounds < len(offsets) - 1)].tolist()
+
+
+def _best_bound(bounds: List[int], low: int, high: int) -> Optional[int]:
+    """Largest bound in (low, high], or None."""
+    i = bisect.bisect_right(bounds, high)
+    if i and bounds[i - 1] > low:
+        return bounds[i - 1]
+    return None
+
+
 def chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 50, encoding_name: str = "cl100k_base") -> List[Dict[str, str]]:
-    """Chunk text into smaller pieces with overlap."""
-    encoding = tiktoken.get_encoding(encoding_name)
+    """Chunk text into smaller pieces with overlap.
     
-    # Split by paragraphs first
-    paragraphs = text.split("\n\n")
+    The text is encoded once and chunks are cut by token offset: each chunk
+    holds at most ``chunk_size`` tokens, ending at the last paragraph break
+    (or failing that, sentence end) in its second half, and the next chunk
+    starts ``chunk_overlap`` tokens before the previous one ended.
+    """
+    encoding = get_encoding(encoding_name)
+    tokens = encoding.encode(text, disallowed_special=())
+    if not tokens:
+        return []
     
-    chunks = []
-    current_chunk = ""
-    current_tokens = 0
+    # Byte offset of every token boundary; offsets[i] is where token i starts
+    data = encoding.decode_bytes(tokens)
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(_token_byte_lengths(encoding_name)[tokens], out=offsets[1:])
+    paragraph_bounds = _token_bounds(PARAGRAPH_BREAK, data, offsets)
+    sentence_bounds = _token_bounds(SENTENCE_END, data, offsets)
+    total = len(tokens)
+    overlap = min(chunk_overlap, chunk_size // 2)
     
-    for para in paragraphs:
-        para_tokens = len(encoding.encode(para))
+    chunks = []
+    start = 0
+    while start < total:
+        end = min(start + chunk_size, total)
+        if end < total:
+            # Prefer a natural break, but never cut the chunk below half size
+            floor = start + chunk_size // 2
+            end = _best_bound(paragraph_bounds, floor, end) or _best_bound(sentence_bounds, floor, end) or end
         
-        # If paragraph alone is too large, split it
-        if para_tokens > chunk_size:
-            # Save current chunk if exists
-            if current_chunk:
-                chunks.append({
-                    "text": current_chunk.strip(),
-                    "tokens": current_tokens
-                })
-                current_chunk = ""
-                current_tokens = 0
-            
-            # Split large paragraph by sentences
-            sentences = para.split(". ")
-            for sent in sentences:
-                sent_tokens = len(encoding.encode(sent))
-                if current_tokens + sent_tokens > chunk_size:
-                    if current_chunk:
-                        chunks.append({
-                            "text": current_chunk.strip(),
-                            "tokens": current_tokens
-                        })
-                    current_chunk = sent + ". "
-                    current_tokens = sent_tokens
-                else:
-                    current_chunk += sent + ". "
-                    current_tokens += sent_tokens
-        else:
-            # Check if adding this paragraph exceeds chunk size
-            if current_tokens + para_tokens > chunk_size and current_chunk:
-                chunks.append({
-                    "text": current_chunk.strip(),
-                    "tokens": current_tokens
-                })
-                # Start new chunk with overlap
-                overlap_text = get_overlap_text(current_chunk, chunk_overlap)
-                current_chunk = overlap_text + "\n\n" + para
-                current_tokens = len(encoding.encode(current_chunk))
-            else:
-                current_chunk += "\n\n" + para if current_chunk else para
-                current_tokens += para_tokens
-    
-    # Add final chunk
-    if current_chunk:
-        chunks.append({
-            "text": current_chunk.strip(),
-            "tokens": current_tokens
-        })
+        # A cut inside a multi-byte character drops the partial character
+        chunk = data[offsets[start]:offsets[end]].decode("utf-8", errors="ignore").strip()
+        if chunk:
+            chunks.append({
+                "text": chunk,
+                "tokens": end - start
+            })
+        if end >= total:
+            break
+        start = max(end - overlap, start + 1)
     
     return chunks
 
 
+def chunk_stream(sections: Iterable[Dict], chunk_size: int = 500, chunk_overlap: int = 50, encoding_name: str = "cl100k_base") -> Iterator[Dict[str, str]]:
+    """Chunk a stream of page/section records lazily.
+    
+    Sections are buffered until roughly ``window_chunks`` chunks' worth of
+    text has arrived; every chunk except the last is then emitted and the
+    last one is carried over, so chunks still span page boundaries while
+    memory stays bounded by the window rather than the document.
+    """
+    window_chunks = 8
+    window_chars = chunk_size * 4 * window_chunks  # ~4 characters per token
+    buffer = ""
+    
+    for section in sections:
+        text = section["text"].strip()
+        if not text:
+            continue
+        buffer = buffer + "\n\n" + text if buffer else text
+        if len(buffer) >= window_chars:
+            chunks = chunk_text(buffer, chunk_size=chunk_size, chunk_overlap=chunk_overlap, encoding_name=encoding_name)
+            yield from chunks[:-1]
+            buffer = chunks[-1]["text"] if chunks else ""
+    
+    if buffer:
+        yield from chunk_text(buffer, chunk_size=chunk_size, chunk_overlap=chunk_overlap, encoding_name=encoding_name)
+
+
 def chunk_by_headers(text: str, headers: List[str] = None) -> List[Dict[str, str]]:
     """Chunk text by markdown headers."""
     if headers is None:
@@ -103,11 +154,3 @@ def chunk_by_headers(text: str, headers: List[str] = None) -> List[Dict[str, str
     
     return chunks
 
-
-def get_overlap_text(text: str, overlap_size: int) -> str:
-    """Get overlap text from end of chunk."""
-    words = text.split()
-    if len(words) <= overlap_size:
-        return text
-    return " ".join(words[-overlap_size:])
-
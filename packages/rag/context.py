@@ -0,0 +1,185 @@
+"""Token-budgeted packing of retrieved chunks into answer synthesis context."""
+from typing import List, Dict, Any, Optional
+from collections import deque
+from pathlib import Path
+import re
+import sys
+import numpy as np
+
+# Add apps/api to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from config import settings
+from .chunkers import get_encoding
+
+
+# "[Snippet n]" header and blank-line separator around each snippet in the prompt
+SNIPPET_OVERHEAD_TOKENS = 8
+SENTENCE_END = re.compile(r"[.!?][)\"']?\s|\n")
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    """Number of tokens in a text."""
+    return len(get_encoding(encoding_name).encode(text, disallowed_special=()))
+
+
+def text_overlap(previous: str, following: str, min_chars: int = 16, max_chars: int = 4000) -> int:
+    """Length of the longest suffix of ``previous`` that ``following`` starts with."""
+    if len(following) < min_chars:
+        return 0
+    tail = previous[-max_chars:]
+    probe = following[:min_chars]
+    # Earliest match in the tail is the longest overlap
+    start = tail.find(probe)
+    while start != -1:
+        if following.startswith(tail[start:]):
+            return len(tail) - start
+        start = tail.find(probe, start + 1)
+    return 0
+
+
+def merge_adjacent(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Join retrieved chunks that are consecutive in the same document, dropping their overlap.
+
+    Passages are returned best first (by the rank of their best chunk) and
+    carry ``ids``, ``docId``, ``chunkIndex`` (of their first chunk),
+    ``text`` and ``saved_chars`` (overlap removed).
+    """
+    ranked = [dict(chunk, rank=rank) for rank, chunk in enumerate(chunks)]
+    ordered = sorted(ranked, key=lambda c: (str(c.get("docId")), c.get("chunkIndex", 0)))
+    
+    passages = []
+    for chunk in ordered:
+        last = passages[-1] if passages else None
+        if (
+            last is not None
+            and chunk.get("docId") is not None
+            and str(chunk.get("docId")) == str(last["docId"])
+            and chunk.get("chunkIndex", 0) == last["lastIndex"] + 1
+        ):
+            overlap = text_overlap(last["text"], chunk["text"])
+            separator = "" if overlap else "\n"
+            last["text"] += separator + chunk["text"][overlap:]
+            last["ids"].append(chunk["id"])
+            last["lastIndex"] = chunk.get("chunkIndex", 0)
+            last["rank"] = min(last["rank"], chunk["rank"])
+            last["saved_chars"] += overlap
+        else:
+            passages.append({
+                "ids": [chunk["id"]],
+                "docId": chunk.get("docId"),
+                "chunkIndex": chunk.get("chunkIndex", 0),
+                "lastIndex": chunk.get("chunkIndex", 0),
+                "text": chunk["text"],
+                "rank": chunk["rank"],
+                "saved_chars": 0
+            })
+    
+    passages.sort(key=lambda p: p["rank"])
+    for passage in passages:
+        del passage["lastIndex"]
+    return passages
+
+
+def trim_to_tokens(text: str, max_tokens: int, encoding_name: str = "cl100k_base") -> str:
+    """First ``max_tokens`` tokens of a text, cut back to a sentence end when one is in the second half."""
+    encoding = get_encoding(encoding_name)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    trimmed = encoding.decode(tokens[:max_tokens])
+    ends = [m.end() for m in SENTENCE_END.finditer(trimmed)]
+    if ends and ends[-1] > len(trimmed) // 2:
+        trimmed = trimmed[:ends[-1]]
+    return trimmed.strip()
+
+
+class ContextPacker:
+    """Fits retrieved chunks into a token budget for the synthesis prompt.
+
+    Adjacent chunks of a document are merged without their overlap, passages
+    are taken best first, and the first passage that doesn't fit is trimmed
+    (when at least ``min_snippet_tokens`` remain); the rest are dropped.
+    """
+    
+    def __init__(self, budget_tokens: int = 1500, min_snippet_tokens: int = 50, encoding_name: str = "cl100k_base", window: int = 1000):
+        self.budget_tokens = budget_tokens
+        self.min_snippet_tokens = min_snippet_tokens
+        self.encoding_name = encoding_name
+        self.requests = 0
+        self.merged_chunks = 0
+        self.overlap_chars = 0
+        self.trimmed = 0
+        self.dropped = 0
+        self._context_tokens: deque = deque(maxlen=window)
+        self._prompt_tokens: deque = deque(maxlen=window)
+    
+    def pack(self, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Snippets for the prompt (each with ``text`` and the chunk ``ids`` it covers) and their token count."""
+        passages = merge_adjacent(chunks)
+        snippets = []
+        used = 0
+        dropped = 0
+        for passage in passages:
+            remaining = self.budget_tokens - used - SNIPPET_OVERHEAD_TOKENS
+            if remaining < self.min_snippet_tokens:
+                dropped += 1
+                continue
+            tokens = count_tokens(passage["text"], self.encoding_name)
+            if tokens > remaining:
+                passage["text"] = trim_to_tokens(passage["text"], remaining, self.encoding_name)
+                passage["trimmed"] = True
+                tokens = count_tokens(passage["text"], self.encoding_name)
+                self.trimmed += 1
+            snippets.append(passage)
+            used += tokens + SNIPPET_OVERHEAD_TOKENS
+        
+        self.requests += 1
+        self.merged_chunks += len(chunks) - len(passages)
+        self.overlap_chars += sum(p["saved_chars"] for p in passages)
+        self.dropped += dropped
+        self._context_tokens.append(used)
+        return {"snippets": snippets, "tokens": used, "dropped": dropped}
+    
+    def record_prompt(self, prompt_tokens: int):
+        """Track the full prompt size of a synthesis request."""
+        self._prompt_tokens.append(prompt_tokens)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Budget, merge/trim/drop counters and context/prompt token percentiles."""
+        def summary(samples: deque) -> Optional[Dict[str, float]]:
+            if not samples:
+                return None
+            values = np.asarray(samples)
+            return {
+                "mean": round(float(values.mean()), 1),
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+                "max": int(values.max())
+            }
+        
+        return {
+            "budget_tokens": self.budget_tokens,
+            "requests": self.requests,
+            "merged_chunks": self.merged_chunks,
+            "overlap_chars_removed": self.overlap_chars,
+            "trimmed": self.trimmed,
+            "dropped": self.dropped,
+            "context_tokens": summary(self._context_tokens),
+            "prompt_tokens": summary(self._prompt_tokens)
+        }
+
+
+# Global packer instance (one per process)
+_context_packer: Optional[ContextPacker] = None
+
+
+def get_context_packer() -> ContextPacker:
+    """Get the process-wide context packer."""
+    global _context_packer
+    if _context_packer is None:
+        _context_packer = ContextPacker(
+            budget_tokens=settings.context_token_budget,
+            min_snippet_tokens=settings.context_min_snippet_tokens
+        )
+    return _context_packer
@@ -0,0 +1,331 @@
+"""Near-duplicate chunk detection with MinHash and locality-sensitive hashing."""
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from collections import deque
+import asyncio
+import hashlib
+import re
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+# Add apps/api to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from bson import ObjectId
+from config import settings
+from .versioning import get_kb_version
+
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+WORD_RE = re.compile(r"\w+")
+
+# Chunks linked to a canonical chunk carry this field (and no embedding)
+CANONICAL_FILTER = {"duplicateOf": {"$exists": False}}
+
+
+def shingle_hashes(text: str, size: int = 5) -> np.ndarray:
+    """32-bit hashes of the word ``size``-grams of a text (case and punctuation ignored)."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) < size:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    # blake2b rather than hash(): signatures are persisted, so hashes must be stable across processes
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=4).digest(), "little") for gram in grams),
+        dtype=np.uint64
+    )
+
+
+def lsh_params(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """(bands, rows) minimising the false positive + false negative area around ``threshold``.
+
+    A pair with Jaccard similarity s becomes a candidate with probability
+    1 - (1 - s^rows)^bands.
+    """
+    s = np.linspace(0.0, 1.0, 201)
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        probability = 1 - (1 - s ** rows) ** bands
+        # Uniform grid over [0, 1]: the mean approximates the area
+        false_positive = np.where(s < threshold, probability, 0.0).mean()
+        false_negative = np.where(s >= threshold, 1 - probability, 0.0).mean()
+        if false_positive + false_negative < best_error:
+            best, best_error = (bands, rows), false_positive + false_negative
+    return best
+
+
+class MinHashLSH:
+    """MinHash signatures in banded LSH buckets, for finding near-duplicate chunks.
+
+    Candidates sharing a band bucket are confirmed by their estimated Jaccard
+    similarity (the fraction of equal signature slots), so only pairs at or
+    above ``threshold`` are reported.
+    """
+    
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = lsh_params(num_perm, threshold)
+        # Fixed seed: stored signatures stay comparable across restarts
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.loaded = False
+        self.last_refresh = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.clear()
+        self.checked = 0
+        self.duplicates = 0
+        self.recent: deque = deque(maxlen=50)
+    
+    def clear(self):
+        self._buckets: List[Dict[bytes, set]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._docs: Dict[str, str] = {}
+        self._pending: set = set()  # registered during ingestion, not written yet
+        self._unsigned: set = set()  # canonical chunks without words to sign (never registered)
+        self.kb_version: Optional[int] = None  # KB version the contents are synced to
+    
+    def __len__(self) -> int:
+        return len(self._signatures)
+    
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._signatures
+    
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature (``num_perm`` uint32 values) of a text.
+        
+        None when the text has no words: such chunks (e.g. a lone table rule)
+        would all share one signature and be reported as duplicates of each other.
+        """
+        hashes = shingle_hashes(text, self.shingle_size)
+        if not len(hashes):
+            return None
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=1).astype(np.uint32)
+    
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+    
+    def add(self, chunk_id: str, doc_id: str, signature: np.ndarray, pending: bool = False):
+        """Register a canonical chunk (``pending`` until ``confirm`` once it is written)."""
+        if chunk_id in self._signatures:
+            self.remove([chunk_id])
+        self._signatures[chunk_id] = signature
+        self._docs[chunk_id] = doc_id
+        if pending:
+            self._pending.add(chunk_id)
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            buckets.setdefault(key, set()).add(chunk_id)
+    
+    def remove(self, ids: Iterable[str]) -> int:
+        """Forget chunks. Returns how many were registered."""
+        removed = 0
+        for chunk_id in ids:
+            signature = self._signatures.pop(chunk_id, None)
+            if signature is None:
+                continue
+            self._docs.pop(chunk_id, None)
+            self._pending.discard(chunk_id)
+            for buckets, key in zip(self._buckets, self._band_keys(signature)):
+                bucket = buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(chunk_id)
+                    if not bucket:
+                        del buckets[key]
+            removed += 1
+        return removed
+    
+    def confirm(self, ids: Iterable[str]):
+        """Mark pending chunks as written."""
+        self._pending.difference_update(ids)
+    
+    def query(self, signature: np.ndarray, exclude: Iterable[str] = (), pending_ok: Iterable[str] = ()) -> Optional[Tuple[str, float]]:
+        """Most similar registered chunk at or above the threshold, as (chunk_id, similarity).
+        
+        Pending chunks only match when listed in ``pending_ok`` (the caller's
+        own): another ingest's pending chunk may never be written.
+        """
+        candidates = set()
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(buckets.get(key, ()))
+        candidates.difference_update(exclude)
+        pending_ok = pending_ok if isinstance(pending_ok, (set, frozenset)) else set(pending_ok)
+        best = None
+        for chunk_id in candidates:
+            if chunk_id in self._pending and chunk_id not in pending_ok:
+                continue
+            similarity = float(np.mean(self._signatures[chunk_id] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (chunk_id, similarity)
+        return best
+    
+    def record(self, chunk: Dict[str, Any], canonical_id: str, similarity: float):
+        """Count a detected duplicate and keep it in the recent-matches report."""
+        self.duplicates += 1
+        self.recent.append({
+            "chunkId": str(chunk["_id"]),
+            "docId": str(chunk["docId"]),
+            "chunkIndex": chunk["chunkIndex"],
+            "canonicalId": canonical_id,
+            "canonicalDocId": self._docs.get(canonical_id),
+            "similarity": round(similarity, 3)
+        })
+    
+    def _stored_signature(self, doc: Dict[str, Any]) -> Optional[np.ndarray]:
+        if isinstance(doc.get("minhash"), bytes):
+            signature = np.frombuffer(doc["minhash"], dtype=np.uint32)
+            if len(signature) == self.num_perm:
+                return signature
+        return None
+    
+    async def _add_docs(self, docs: List[Dict[str, Any]]):
+        """Register chunk documents by their stored signatures.
+        
+        Chunks ingested before deduplication (or with other settings) are
+        signed from their text in a worker thread, off the event loop.
+        """
+        signatures = [self._stored_signature(doc) for doc in docs]
+        unsigned = [doc.get("text", "") for doc, signature in zip(docs, signatures) if signature is None]
+        if unsigned:
+            computed = iter(await asyncio.to_thread(lambda: [self.signature(text) for text in unsigned]))
+            signatures = [signature if signature is not None else next(computed) for signature in signatures]
+        for doc, signature in zip(docs, signatures):
+            if signature is None:
+                self._unsigned.add(str(doc["_id"]))
+            else:
+                self.add(str(doc["_id"]), str(doc["docId"]), signature)
+    
+    async def load(self, collection, batch_size: int = 1000):
+        """Build the index from every canonical chunk in a collection."""
+        self.clear()
+        self.kb_version = await get_kb_version()
+        batch = []
+        async for doc in collection.find(CANONICAL_FILTER, {"_id": 1, "docId": 1, "minhash": 1, "text": 1}).batch_size(batch_size):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                await self._add_docs(batch)
+                batch = []
+        await self._add_docs(batch)
+        self.loaded = True
+        self.last_refresh = time.monotonic()
+        print(f"Loaded {len(self)} chunk signatures into dedup index")
+    
+    async def refresh(self, collection):
+        """Sync with chunks written or deleted by other processes."""
+        if not self.loaded:
+            return await self.load(collection)
+        
+        version = await get_kb_version()
+        if version == self.kb_version:
+            # Every KB write bumps the version: nothing changed since the last sync
+            self.last_refresh = time.monotonic()
+            return
+        
+        current = set()
+        async for doc in collection.find(CANONICAL_FILTER, {"_id": 1}):
+            current.add(str(doc["_id"]))
+        
+        # Chunks still being ingested by this process aren't in the collection yet
+        removed = self.remove([
+            chunk_id for chunk_id in list(self._signatures)
+            if chunk_id not in current and chunk_id not in self._pending
+        ])
+        self._unsigned &= current
+        missing = [ObjectId(chunk_id) for chunk_id in current if chunk_id not in self._signatures and chunk_id not in self._unsigned]
+        if missing:
+            await self._add_docs([
+                doc async for doc in collection.find({"_id": {"$in": missing}}, {"_id": 1, "docId": 1, "minhash": 1, "text": 1})
+            ])
+        
+        self.kb_version = version
+        self.last_refresh = time.monotonic()
+        if missing or removed:
+            print(f"Dedup index refreshed: +{len(missing)} -{removed} ({len(self)} chunks)")
+    
+    async def ensure_fresh(self, collection, max_age: float):
+        """Load on first use, then refresh when older than ``max_age`` seconds."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.loaded or time.monotonic() - self.last_refresh > max_age:
+                await self.refresh(collection)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Detection counters and the most recent matches."""
+        return {
+            "mode": settings.dedup_mode,
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "rows": self.rows,
+            "chunks": len(self),
+            "pending": len(self._pending),
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "duplicate_rate": self.duplicates / self.checked if self.checked else 0.0,
+            "recent": list(self.recent)
+        }
+
+
+async def duplicate_report(database, limit: int = 50) -> Dict[str, Any]:
+    """Canonical chunks with the most linked duplicates, with their sources."""
+    groups = [
+        group async for group in database.kb_chunks.aggregate([
+            {"$match": {"duplicateOf": {"$exists": True}}},
+            {"$group": {"_id": "$duplicateOf", "count": {"$sum": 1}, "duplicates": {"$push": {"docId": "$docId", "chunkIndex": "$chunkIndex"}}}},
+            {"$sort": {"count": -1}},
+            {"$limit": limit}
+        ])
+    ]
+    linked = await database.kb_chunks.count_documents({"duplicateOf": {"$exists": True}})
+    total = await database.kb_chunks.count_documents({})
+    
+    canonical = {
+        doc["_id"]: doc
+        async for doc in database.kb_chunks.find({"_id": {"$in": [g["_id"] for g in groups]}}, {"docId": 1, "chunkIndex": 1, "text": 1})
+    }
+    doc_ids = {d["docId"] for g in groups for d in g["duplicates"]} | {c["docId"] for c in canonical.values()}
+    sources = {
+        doc["_id"]: doc.get("source")
+        async for doc in database.kb_docs.find({"_id": {"$in": list(doc_ids)}}, {"source": 1})
+    }
+    
+    def describe(chunk):
+        return {"docId": str(chunk["docId"]), "source": sources.get(chunk["docId"]), "chunkIndex": chunk["chunkIndex"]}
+    
+    return {
+        "chunks": total,
+        "linked": linked,
+        "linked_fraction": linked / total if total else 0.0,
+        "groups": [
+            {
+                "canonicalId": str(group["_id"]),
+                "canonical": describe(canonical[group["_id"]]) if group["_id"] in canonical else None,
+                "preview": canonical[group["_id"]].get("text", "")[:200] if group["_id"] in canonical else None,
+                "count": group["count"],
+                "duplicates": [describe(d) for d in group["duplicates"]]
+            }
+            for group in groups
+        ]
+    }
+
+
+# Global index instance (one per process)
+_dedup_index: Optional[MinHashLSH] = None
+
+
+def get_dedup_index() -> MinHashLSH:
+    """Get the process-wide near-duplicate index."""
+    global _dedup_index
+    if _dedup_index is None:
+        _dedup_index = MinHashLSH(
+            threshold=settings.dedup_threshold,
+            num_perm=settings.dedup_num_perm,
+            shingle_size=settings.dedup_shingle_size
+        )
+    return _dedup_index
@@ -0,0 +1,153 @@
+"""Shared async OpenAI embeddings client."""
+from typing import List, Dict, Any, Optional
+import asyncio
+import random
+import time
+import sys
+from pathlib import Path
+import httpx
+import openai
+
+# Add apps/api to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from config import settings
+
+
+# Errors worth retrying: throttling, server errors, timeouts and dropped connections
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,  # includes APITimeoutError
+)
+
+
+class EmbeddingService:
+    """One long-lived AsyncOpenAI client for every embeddings call in the process.
+
+    Requests share a keep-alive connection pool, are capped at
+    ``max_concurrency`` in flight, time out after ``timeout`` seconds and are
+    retried on 429/5xx/connection errors with full-jitter exponential backoff.
+    """
+    
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        timeout: float = 10.0,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        max_connections: int = 20
+    ):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_connections = max_connections
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.requests = 0
+        self.inputs = 0
+        self.retries = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.total_latency = 0.0
+    
+    def _get_client(self) -> openai.AsyncOpenAI:
+        # Created lazily so the pool binds to the running event loop
+        if self._client is None:
+            self._client = openai.AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                max_retries=0,  # retries are handled here, outside the concurrency slot
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections
+                    ),
+                    timeout=self.timeout
+                )
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+    
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Seconds to wait before the next attempt (honours Retry-After on 429)."""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+    
+    async def embed(self, texts: List[str], model: str, **options) -> List[List[float]]:
+        """Embed a batch of texts, retrying transient failures."""
+        client = self._get_client()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    self.in_flight += 1
+                    started = time.perf_counter()
+                    try:
+                        response = await client.embeddings.create(
+                            model=model,
+                            input=texts,
+                            timeout=self.timeout,
+                            **options
+                        )
+                    finally:
+                        self.in_flight -= 1
+                self.requests += 1
+                self.inputs += len(texts)
+                self.total_latency += time.perf_counter() - started
+                return [item.embedding for item in response.data]
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    self.failures += 1
+                    raise
+                self.retries += 1
+                delay = self._backoff(attempt, e)
+                print(f"Embedding request failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+    
+    async def close(self):
+        """Close the connection pool."""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """Request counters for monitoring."""
+        return {
+            "requests": self.requests,
+            "inputs": self.inputs,
+            "retries": self.retries,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "avg_latency_ms": 1000 * self.total_latency / self.requests if self.requests else 0.0
+        }
+
+
+# Global service instance (one per process)
+_embedding_service: Optional[EmbeddingService] = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Get the process-wide embedding service."""
+    global _embedding_service
+    if _embedding_service is None:
+        _embedding_service = EmbeddingService(
+            max_concurrency=settings.embedding_max_concurrency,
+            timeout=settings.embedding_timeout_seconds,
+            max_retries=settings.embedding_max_retries,
+            max_connections=settings.embedding_max_connections
+        )
+    return _embedding_service
+
+
+async def close_embedding_service():
+    """Close the shared client (call on shutdown)."""
+    if _embedding_service is not None:
+        await _embedding_service.close()
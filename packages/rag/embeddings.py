@@ -1,7 +1,9 @@
 """Embedding utilities using OpenAI."""
-from typing import List
-import openai
+from typing import List, Dict, Any, Optional, Tuple
 import sys
+import asyncio
+import hashlib
+import numpy as np
 from pathlib import Path
 
 # Add apps/api to path
@@ -9,34 +11,160 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
 
 from config import settings
 
-openai.api_key = settings.openai_api_key
+from .cache import LRUCache, SQLiteCache
+from .embedding_service import get_embedding_service
+from .batching import get_query_batcher
+from .chunkers import get_encoding
+
+# Query embedding cache: helpdesk questions repeat a lot, so most lookups hit
+_query_cache = LRUCache(
+    max_size=settings.embedding_cache_size,
+    ttl_seconds=settings.embedding_cache_ttl_seconds
+)
+_query_disk_cache: Optional[SQLiteCache] = None
+if settings.embedding_cache_path:
+    _query_disk_cache = SQLiteCache(
+        settings.embedding_cache_path,
+        table="query_embeddings",
+        ttl_seconds=settings.embedding_cache_ttl_seconds
+    )
+
+# Content-addressed embedding store: identical chunk text is only ever embedded once
+_embedding_store: Optional[SQLiteCache] = None
+if settings.embedding_store_path:
+    _embedding_store = SQLiteCache(settings.embedding_store_path, table="embeddings")
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text for cache lookups (case and whitespace insensitive)."""
+    return " ".join(query.lower().split())
+
+
+def query_cache_key(query: str, model: str, dimensions: Optional[int] = None) -> str:
+    """Cache key for a query embedding."""
+    return hashlib.sha256(f"{model}\x00{dimensions or ''}\x00{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+
+def content_key(text: str, model: str, dimensions: Optional[int] = None) -> str:
+    """Embedding store key: hash of the exact text, model and dimensions."""
+    return hashlib.sha256(f"{model}\x00{dimensions or ''}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def count_tokens(text: str) -> int:
+    """Token count of a text for the embedding models (cl100k_base)."""
+    return len(get_encoding("cl100k_base").encode(text, disallowed_special=()))
+
+
+def token_batches(texts: List[str], max_items: int, max_tokens: int) -> List[Tuple[int, int]]:
+    """Split texts into contiguous (start, end) batches bounded by item count and total tokens.
+    
+    A text larger than ``max_tokens`` on its own gets a batch of its own.
+    """
+    batches = []
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        text_tokens = count_tokens(text)
+        if i > start and (i - start >= max_items or tokens + text_tokens > max_tokens):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += text_tokens
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
 
 
-async def get_embeddings(texts: List[str], model: str = None) -> List[List[float]]:
-    """Get embeddings for a list of texts."""
+async def _embed_batched(texts: List[str], model: str, **options) -> List[List[float]]:
+    """Embed texts in request-sized batches sent concurrently, results in input order."""
+    if not texts:
+        return []
+    batches = token_batches(texts, settings.embedding_request_max_inputs, settings.embedding_request_max_tokens)
+    service = get_embedding_service()
+    # The service caps how many of these are in flight at once
+    results = await asyncio.gather(*(service.embed(texts[start:end], model, **options) for start, end in batches))
+    return [vector for batch in results for vector in batch]
+
+
+def embedding_options(dimensions: Optional[int] = None) -> Dict[str, Any]:
+    """Extra embeddings.create arguments (reduced Matryoshka dimensions if configured).
+    
+    ``dimensions=0`` requests the model's native size regardless of settings.
+    """
+    if dimensions is None:
+        dimensions = settings.embedding_dimensions
+    return {"dimensions": dimensions} if dimensions else {}
+
+
+def truncate_embedding(vector: List[float], dimensions: int) -> List[float]:
+    """Truncate a Matryoshka embedding to its first dimensions and re-normalize."""
+    truncated = np.asarray(vector[:dimensions], dtype=np.float32)
+    norm = np.linalg.norm(truncated)
+    return (truncated / norm if norm else truncated).tolist()
+
+
+async def get_embeddings(texts: List[str], model: str = None, dimensions: Optional[int] = None) -> List[List[float]]:
+    """Get embeddings for a list of texts.
+    
+    Texts already in the embedding store are served from it; only misses
+    (deduplicated) are sent to the API, split into batches that respect the
+    per-request input and token limits, and then stored.
+    """
     model = model or settings.embedding_model
+    options = embedding_options(dimensions)
     
-    # Use OpenAI client
-    client = openai.OpenAI(api_key=settings.openai_api_key)
+    if _embedding_store is None:
+        return await _embed_batched(texts, model, **options)
     
-    response = client.embeddings.create(
-        model=model,
-        input=texts
-    )
+    keys = [content_key(text, model, options.get("dimensions")) for text in texts]
+    stored = _embedding_store.get_many(keys)
+    missing: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in stored:
+            missing.setdefault(key, text)
     
-    return [item.embedding for item in response.data]
+    if missing:
+        vectors = await _embed_batched(list(missing.values()), model, **options)
+        new_entries = {key: np.asarray(vector, dtype=np.float32).tobytes() for key, vector in zip(missing, vectors)}
+        _embedding_store.set_many(new_entries)
+        stored.update(new_entries)
+    
+    return [np.frombuffer(stored[key], dtype=np.float32).tolist() for key in keys]
 
 
-async def embed_query(query: str, model: str = None) -> List[float]:
-    """Get embedding for a single query."""
+async def embed_query(query: str, model: str = None, dimensions: Optional[int] = None) -> List[float]:
+    """Get embedding for a single query (cached)."""
     model = model or settings.embedding_model
+    options = embedding_options(dimensions)
+    key = query_cache_key(query, model, options.get("dimensions"))
     
-    client = openai.OpenAI(api_key=settings.openai_api_key)
+    embedding = _query_cache.get(key)
+    if embedding is not None:
+        return embedding
     
-    response = client.embeddings.create(
-        model=model,
-        input=[query]
-    )
+    if _query_disk_cache is not None:
+        blob = _query_disk_cache.get(key)
+        if blob is not None:
+            embedding = np.frombuffer(blob, dtype=np.float32).tolist()
+            _query_cache.set(key, embedding)
+            return embedding
     
-    return response.data[0].embedding
+    if settings.embedding_batch_window_ms > 0:
+        # Coalesce with other queries arriving within the batching window
+        embedding = await get_query_batcher().embed(query, model, **options)
+    else:
+        embedding = (await get_embedding_service().embed([query], model, **options))[0]
+    _query_cache.set(key, embedding)
+    if _query_disk_cache is not None:
+        _query_disk_cache.set(key, np.asarray(embedding, dtype=np.float32).tobytes())
+    
+    return embedding
+
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters for the query embedding cache and the embedding store."""
+    stats = {"memory": _query_cache.stats()}
+    if _query_disk_cache is not None:
+        stats["disk"] = _query_disk_cache.stats()
+    if _embedding_store is not None:
+        stats["store"] = _embedding_store.stats()
+    return stats
 
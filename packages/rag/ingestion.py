@@ -1,47 +1,155 @@
 """KB ingestion pipeline."""
 import sys
+import os
+import hashlib
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterable, Callable, Awaitable
 
 # Add parent directories to path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
 
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+from config import settings
 from db import get_database
 from db.models import KBDoc, KBChunk
-from .loaders import load_file
-from .chunkers import chunk_text, chunk_by_headers
+from .loaders import open_document
+from .chunkers import chunk_by_headers, chunk_stream
 from .embeddings import get_embeddings
+from .vector_codec import encode_embedding, encode_float32, FULL_VECTORS_COLLECTION
+from .vector_index import get_vector_index
+from .lexical import get_lexical_index
+from .versioning import bump_kb_version
+from .dedup import get_dedup_index
+from .snapshot import update_snapshot
 import asyncio
 
 
-async def ingest_document(file_path: str, tags: list = None, chunk_size: int = 500, chunk_overlap: int = 50) -> str:
-    """Ingest a single document into the KB."""
-    database = await get_database()
-    
-    # Load file
-    doc_data = await load_file(file_path)
+SUPPORTED_EXTENSIONS = [".pdf", ".html", ".htm", ".md", ".txt"]
+
+# Per-file progress callback: on_file(source, status, chunks=0, doc_id=None, error=None)
+# with status one of added / updated / unchanged / removed / failed
+FileCallback = Callable[..., Awaitable[None]]
+
+FINGERPRINT_FIELDS = ("mtime", "size", "contentHash")
+
+# Whether the server supports multi-document transactions (replica set / mongos);
+# unknown until the first chunk swap is attempted
+_transactions_supported: Optional[bool] = None
+
+
+def file_fingerprint(file_path: str) -> Dict[str, Any]:
+    """Fingerprint a source file: mtime, size and sha256 of its content."""
+    path = Path(file_path)
+    stat = path.stat()
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return {"mtime": stat.st_mtime, "size": stat.st_size, "contentHash": digest.hexdigest()}
+
+
+def _capture_text(sections: Iterable[Dict[str, Any]], parts: List[str], limit: int):
+    """Pass sections through, keeping up to ``limit`` characters of their text for KBDoc.rawText."""
+    size = 0
+    for section in sections:
+        if size < limit:
+            text = section["text"][:limit - size]
+            parts.append(text)
+            size += len(text)
+        yield section
+
+
+def parse_document(file_path: str, chunk_size: int = 500, chunk_overlap: int = 50) -> Dict[str, Any]:
+    """Load, fingerprint and chunk a file (CPU-bound; runs in a worker process).
     
-    # Create KBDoc
-    kb_doc = KBDoc(
-        source=doc_data["source"],
-        title=doc_data["title"],
-        rawText=doc_data["rawText"],
-        tags=tags or []
-    )
+    Pages/sections are streamed into the chunker, so the full text is never
+    built; rawText keeps only the first KB_RAW_TEXT_MAX_CHARS characters.
+    """
+    doc = open_document(file_path)
+    raw_parts: List[str] = []
+    sections = _capture_text(doc["sections"], raw_parts, settings.kb_raw_text_max_chars)
+    return {
+        "source": doc["source"],
+        "title": doc["title"],
+        "fingerprint": file_fingerprint(file_path),
+        "chunks": list(chunk_stream(sections, chunk_size=chunk_size, chunk_overlap=chunk_overlap)),
+        "rawText": "\n\n".join(raw_parts)
+    }
+
+
+async def _mark_duplicates(
+    database,
+    chunks: List[Dict[str, Any]],
+    exclude_ids: Iterable[str] = (),
+    pending_ok: Iterable[str] = ()
+) -> List[Dict[str, Any]]:
+    """Check chunks against the near-duplicate index (DEDUP_MODE).
     
-    # Insert document
-    doc_dict = kb_doc.model_dump(by_alias=True, exclude={"id"})
-    result = await database.kb_docs.insert_one(doc_dict)
-    doc_id = result.inserted_id
+    Distinct chunks are registered and keep their MinHash signature; near
+    duplicates of an existing chunk are dropped ("skip") or kept with
+    ``duplicateOf`` pointing at it and no embedding ("link"), so they take
+    no room in the indexes. Chunks still pending in the index only count as
+    originals when they are registered here or listed in ``pending_ok``,
+    since another ingest's chunks can fail to be written. Returns the
+    chunks to write.
+    """
+    if settings.dedup_mode not in ("skip", "link") or not chunks:
+        return chunks
+    index = get_dedup_index()
+    await index.ensure_fresh(database.kb_chunks, settings.vector_index_refresh_seconds)
+    signatures = await asyncio.to_thread(lambda: [index.signature(c["text"]) for c in chunks])
+    exclude = set(exclude_ids)
+    own = set(pending_ok)
     
-    # Chunk text
-    chunks = chunk_text(doc_data["rawText"], chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    kept = []
+    for chunk, signature in zip(chunks, signatures):
+        if signature is None:
+            # Nothing to compare (no words): always kept as its own chunk
+            kept.append(chunk)
+            continue
+        index.checked += 1
+        match = index.query(signature, exclude, own)
+        if match is None:
+            chunk["minhash"] = signature.tobytes()
+            index.add(str(chunk["_id"]), str(chunk["docId"]), signature, pending=True)
+            own.add(str(chunk["_id"]))
+            kept.append(chunk)
+            continue
+        canonical_id, similarity = match
+        index.record(chunk, canonical_id, similarity)
+        if settings.dedup_mode == "link":
+            chunk["duplicateOf"] = ObjectId(canonical_id)
+            kept.append(chunk)
+    return kept
+
+
+async def embed_chunks(
+    doc_id,
+    chunks: List[Dict[str, Any]],
+    start_index: int = 0,
+    exclude_ids: Iterable[str] = (),
+    pending_ok: Iterable[str] = ()
+):
+    """Embed a document's chunks. Returns (chunk documents, embeddings).
     
-    # Process in batches for embeddings
-    batch_size = 10
+    Near-duplicate chunks are dropped or linked first (see _mark_duplicates);
+    linked chunks aren't embedded and have None in the embeddings list.
+    ``exclude_ids`` are chunks that must not count as originals (a
+    document's own chunks when it is being replaced); ``pending_ok`` are
+    unconfirmed chunks that may (earlier windows of the same document).
+    """
+    database = await get_database()
     all_chunks_data = []
     
-    for i, chunk_data in enumerate(chunks):
+    for i, chunk_data in enumerate(chunks, start=start_index):
         all_chunks_data.append({
+            "_id": ObjectId(),
             "docId": doc_id,
             "chunkIndex": i,
             "text": chunk_data["text"],
@@ -49,50 +157,693 @@ async def ingest_document(file_path: str, tags: list = None, chunk_size: int = 5
             "metadata": {}
         })
     
-    # Get embeddings in batches
-    texts = [c["text"] for c in all_chunks_data]
+    all_chunks_data = await _mark_duplicates(database, all_chunks_data, exclude_ids, pending_ok)
+    
+    # get_embeddings splits these into token-bounded requests
+    texts = [c["text"] for c in all_chunks_data if "duplicateOf" not in c]
     
     print(f"Getting embeddings for {len(texts)} chunks...")
-    embeddings_list = await get_embeddings(texts)
+    try:
+        embeddings = iter(await get_embeddings(texts))
+    except Exception:
+        _forget_chunks(all_chunks_data)
+        raise
     
     # Create KBChunk documents
     kb_chunks = []
-    for chunk_data, embedding in zip(all_chunks_data, embeddings_list):
-        chunk_data["embedding"] = embedding
+    embeddings_list = []
+    for chunk_data in all_chunks_data:
+        embedding = None if "duplicateOf" in chunk_data else next(embeddings)
+        if embedding is not None:
+            chunk_data.update(encode_embedding(embedding, settings.embedding_storage))
         kb_chunks.append(chunk_data)
+        embeddings_list.append(embedding)
     
-    # Insert chunks
-    if kb_chunks:
-        await database.kb_chunks.insert_many(kb_chunks)
-        print(f"Inserted {len(kb_chunks)} chunks for document {doc_id}")
+    return kb_chunks, embeddings_list
+
+
+async def _insert_chunks(database, kb_chunks: List[Dict[str, Any]], embeddings_list: List[Optional[List[float]]], session=None):
+    """Insert chunk documents (and their full-precision vectors for int8 storage)."""
+    await database.kb_chunks.insert_many(kb_chunks, session=session)
+    
+    # int8 chunks keep their full-precision vector aside for rescoring
+    full_vectors = [
+        {"_id": chunk["_id"], "embedding": encode_float32(embedding)}
+        for chunk, embedding in zip(kb_chunks, embeddings_list)
+        if embedding is not None
+    ]
+    if settings.embedding_storage == "int8" and full_vectors:
+        await database[FULL_VECTORS_COLLECTION].insert_many(full_vectors, session=session)
+
+
+def _forget_chunks(kb_chunks: List[Dict[str, Any]]):
+    """Unregister chunks that were checked for duplicates but never written."""
+    get_dedup_index().remove(str(chunk["_id"]) for chunk in kb_chunks)
+
+
+def _update_local_indexes(added: List[Dict[str, Any]] = (), removed_ids: List[str] = (), confirm: bool = True):
+    """Keep this process's indexes in sync (other workers pick changes up on refresh).
+    
+    With ``confirm=False`` added chunks stay pending in the dedup index, so
+    other ingests can't link to them yet.
+    """
+    for index in (get_vector_index(), get_lexical_index()):
+        if removed_ids:
+            index.remove(removed_ids)
+        if added:
+            index.add_chunks(added)
+    dedup_index = get_dedup_index()
+    if removed_ids:
+        dedup_index.remove(removed_ids)
+    if added and confirm:
+        dedup_index.confirm(str(chunk["_id"]) for chunk in added)
+
+
+async def _promote_duplicates(database, removed_ids: List[Any]) -> int:
+    """Give chunks linked to removed canonical chunks a new canonical.
+    
+    The first linked chunk of each group is embedded and becomes canonical;
+    the rest are re-linked to it. Returns the number of chunks promoted.
+    """
+    if not removed_ids:
+        return 0
+    groups: Dict[Any, List[Dict[str, Any]]] = {}
+    async for chunk in database.kb_chunks.find({"duplicateOf": {"$in": removed_ids}}):
+        groups.setdefault(chunk["duplicateOf"], []).append(chunk)
+    if not groups:
+        return 0
+    
+    promoted = [group[0] for group in groups.values()]
+    embeddings_list = await get_embeddings([chunk["text"] for chunk in promoted])
+    dedup_index = get_dedup_index()
+    for chunk, embedding, group in zip(promoted, embeddings_list, groups.values()):
+        signature = dedup_index.signature(chunk["text"])
+        fields = encode_embedding(embedding, settings.embedding_storage)
+        if signature is not None:
+            fields["minhash"] = signature.tobytes()
+        await database.kb_chunks.update_one({"_id": chunk["_id"]}, {"$set": fields, "$unset": {"duplicateOf": ""}})
+        chunk.update(fields)
+        del chunk["duplicateOf"]
+        if dedup_index.loaded and signature is not None:
+            dedup_index.add(str(chunk["_id"]), str(chunk["docId"]), signature)
+        if len(group) > 1:
+            await database.kb_chunks.update_many(
+                {"_id": {"$in": [other["_id"] for other in group[1:]]}},
+                {"$set": {"duplicateOf": chunk["_id"]}}
+            )
+    if settings.embedding_storage == "int8":
+        await database[FULL_VECTORS_COLLECTION].insert_many([
+            {"_id": chunk["_id"], "embedding": encode_float32(embedding)}
+            for chunk, embedding in zip(promoted, embeddings_list)
+        ])
+    
+    _update_local_indexes(added=promoted)
+    print(f"Promoted {len(promoted)} linked duplicate chunks to canonical")
+    return len(promoted)
+
+
+async def ingest_document(
+    file_path: str,
+    tags: list = None,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    fingerprint: Optional[Dict[str, Any]] = None,
+    exclude_ids: Iterable[str] = ()
+) -> str:
+    """Ingest a single document into the KB.
+    
+    The document is streamed: chunks are embedded and inserted in windows of
+    INGEST_WRITE_BATCH_SIZE, so memory stays flat however large the file is.
+    If a window fails the document and the chunks written so far are
+    removed; until the document is complete its chunks stay pending in the
+    dedup index, so no other ingest links to them. The source fingerprint is written last, so a document whose
+    ingestion was interrupted looks changed to sync_directory and gets
+    re-ingested. ``exclude_ids`` are chunks new ones must not be linked to
+    (see embed_chunks).
+    """
+    database = await get_database()
+    
+    # Open and fingerprint off the event loop
+    doc = await asyncio.to_thread(open_document, file_path)
+    if fingerprint is None:
+        fingerprint = await asyncio.to_thread(file_fingerprint, file_path)
+    
+    # Create KBDoc (fingerprint added once every chunk is stored)
+    kb_doc = KBDoc(
+        source=doc["source"],
+        title=doc["title"],
+        rawText="",
+        tags=tags or []
+    )
+    
+    # Insert document
+    doc_dict = kb_doc.model_dump(by_alias=True, exclude={"id"})
+    result = await database.kb_docs.insert_one(doc_dict)
+    doc_id = result.inserted_id
+    
+    raw_parts: List[str] = []
+    sections = _capture_text(doc["sections"], raw_parts, settings.kb_raw_text_max_chars)
+    chunks = chunk_stream(sections, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    window = settings.ingest_write_batch_size
+    total = 0
+    kb_chunks: List[Dict[str, Any]] = []
+    written_ids: List[str] = []
+    
+    try:
+        while True:
+            # Parsing and chunking are CPU-bound: pull the next window in a thread
+            batch = await asyncio.to_thread(lambda: list(itertools.islice(chunks, window)))
+            if not batch:
+                break
+            kb_chunks, embeddings_list = await embed_chunks(
+                doc_id, batch, start_index=total, exclude_ids=exclude_ids, pending_ok=written_ids
+            )
+            if kb_chunks:
+                await _insert_chunks(database, kb_chunks, embeddings_list)
+                _update_local_indexes(added=kb_chunks, confirm=False)
+                written_ids.extend(str(chunk["_id"]) for chunk in kb_chunks)
+            total += len(kb_chunks)
+            kb_chunks = []
+        
+        await database.kb_docs.update_one(
+            {"_id": doc_id},
+            {"$set": {"rawText": "\n\n".join(raw_parts), **fingerprint}}
+        )
+        get_dedup_index().confirm(written_ids)
+    except Exception:
+        # Don't leave a partial document behind
+        _forget_chunks(kb_chunks)
+        try:
+            await remove_documents([doc_id])
+        except Exception as e:
+            print(f"Error removing partially ingested document {doc_id}: {e}")
+        raise
+    
+    if total:
+        print(f"Inserted {total} chunks for document {doc_id}")
+        
+        # Invalidate answers cached against the previous KB content
+        await bump_kb_version()
     
     return str(doc_id)
 
 
-async def ingest_directory(directory: str, **kwargs) -> List[str]:
-    """Ingest all documents in a directory."""
-    path = Path(directory)
-    doc_ids = []
+async def _swap(database, swap: Callable[..., Awaitable[None]]):
+    """Run ``swap(session)`` in a transaction when the server supports one, else ``swap()``."""
+    global _transactions_supported
+    if _transactions_supported is not False:
+        try:
+            async with await database.client.start_session() as session:
+                async with session.start_transaction():
+                    await swap(session)
+            _transactions_supported = True
+            return
+        except OperationFailure as e:
+            # Standalone servers reject transactions (IllegalOperation)
+            if e.code != 20:
+                raise
+            print("MongoDB transactions unavailable, swapping chunks without a transaction")
+            _transactions_supported = False
+    await swap()
+
+
+async def replace_document(
+    doc_id,
+    file_path: str,
+    fingerprint: Dict[str, Any],
+    tags: list = None,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    pool: Optional[ProcessPoolExecutor] = None
+) -> int:
+    """Re-chunk a changed source and swap its chunks in atomically.
+
+    The new chunks are embedded before anything is written. The swap (insert
+    new chunks, delete old ones, update the KBDoc) runs in a transaction when
+    the server supports it; otherwise new chunks are inserted before the old
+    ones are deleted, so the document is never missing from search. Parsing
+    runs in ``pool`` (see ingest_files) or a thread; files over
+    INGEST_STREAM_THRESHOLD_MB are streamed instead (see
+    _replace_streamed). Returns the number of new chunks.
+    """
+    database = await get_database()
+    if os.path.getsize(file_path) > settings.ingest_stream_threshold_mb * 1024 * 1024:
+        return await _replace_streamed(database, doc_id, file_path, fingerprint, tags, chunk_size, chunk_overlap)
     
-    for file_path in path.rglob("*"):
-        if file_path.is_file() and file_path.suffix.lower() in [".pdf", ".html", ".htm", ".md", ".txt"]:
+    loop = asyncio.get_running_loop()
+    doc_data = await loop.run_in_executor(pool, parse_document, file_path, chunk_size, chunk_overlap)
+    old_ids = [doc["_id"] async for doc in database.kb_chunks.find({"docId": doc_id}, {"_id": 1})]
+    # The old version's chunks are about to go: don't link new chunks to them
+    kb_chunks, embeddings_list = await embed_chunks(doc_id, doc_data["chunks"], exclude_ids=[str(i) for i in old_ids])
+    doc_fields = {
+        "title": doc_data["title"],
+        "rawText": doc_data["rawText"],
+        "updatedAt": datetime.utcnow(),
+        **fingerprint
+    }
+    if tags is not None:
+        doc_fields["tags"] = tags
+    
+    async def swap(session=None):
+        if kb_chunks:
+            await _insert_chunks(database, kb_chunks, embeddings_list, session=session)
+        if old_ids:
+            await database.kb_chunks.delete_many({"_id": {"$in": old_ids}}, session=session)
+            await database[FULL_VECTORS_COLLECTION].delete_many({"_id": {"$in": old_ids}}, session=session)
+        await database.kb_docs.update_one({"_id": doc_id}, {"$set": doc_fields}, session=session)
+    
+    try:
+        await _swap(database, swap)
+    except Exception:
+        _forget_chunks(kb_chunks)
+        raise
+    
+    _update_local_indexes(added=kb_chunks, removed_ids=[str(i) for i in old_ids])
+    await _promote_duplicates(database, old_ids)
+    await bump_kb_version()
+    print(f"Replaced {len(old_ids)} chunks with {len(kb_chunks)} for document {doc_id}")
+    return len(kb_chunks)
+
+
+async def _replace_streamed(
+    database,
+    doc_id,
+    file_path: str,
+    fingerprint: Dict[str, Any],
+    tags: Optional[list],
+    chunk_size: int,
+    chunk_overlap: int
+) -> int:
+    """replace_document for very large files: stream into a staging document, then swap.
+    
+    The new version is ingested window by window under a new document id
+    (ingest_document removes it if that fails). The swap re-points its
+    chunks at ``doc_id``, deletes the old chunks and the staging KBDoc. If
+    the process dies before the swap, the next sync keeps the newer
+    (complete) document for the source and removes the old one.
+    """
+    old_ids = [doc["_id"] async for doc in database.kb_chunks.find({"docId": doc_id}, {"_id": 1})]
+    staged_id = ObjectId(await ingest_document(
+        file_path, tags=tags, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+        fingerprint=fingerprint, exclude_ids=[str(i) for i in old_ids]
+    ))
+    staged = await database.kb_docs.find_one({"_id": staged_id}, {"title": 1, "rawText": 1})
+    new_ids = [doc["_id"] async for doc in database.kb_chunks.find({"docId": staged_id}, {"_id": 1})]
+    doc_fields = {
+        "title": staged["title"],
+        "rawText": staged["rawText"],
+        "updatedAt": datetime.utcnow(),
+        **fingerprint
+    }
+    if tags is not None:
+        doc_fields["tags"] = tags
+    
+    async def swap(session=None):
+        await database.kb_chunks.update_many({"docId": staged_id}, {"$set": {"docId": doc_id}}, session=session)
+        if old_ids:
+            await database.kb_chunks.delete_many({"_id": {"$in": old_ids}}, session=session)
+            await database[FULL_VECTORS_COLLECTION].delete_many({"_id": {"$in": old_ids}}, session=session)
+        await database.kb_docs.delete_one({"_id": staged_id}, session=session)
+        # The new fingerprint goes last: until it is set, sync_directory retries the file
+        await database.kb_docs.update_one({"_id": doc_id}, {"$set": doc_fields}, session=session)
+    
+    try:
+        await _swap(database, swap)
+    except Exception:
+        # Without a transaction the chunks may already point at doc_id: remove them by id
+        try:
+            await database.kb_chunks.delete_many({"_id": {"$in": new_ids}})
+            await database[FULL_VECTORS_COLLECTION].delete_many({"_id": {"$in": new_ids}})
+            await database.kb_docs.delete_one({"_id": staged_id})
+            _update_local_indexes(removed_ids=[str(i) for i in new_ids])
+        except Exception as e:
+            print(f"Error removing staged document {staged_id}: {e}")
+        raise
+    
+    _update_local_indexes(removed_ids=[str(i) for i in old_ids])
+    total = 0
+    if get_vector_index().loaded or get_lexical_index().loaded:
+        # Local index entries still name the staging document: re-add them window by window
+        window: List[Dict[str, Any]] = []
+        async for chunk in database.kb_chunks.find({"docId": doc_id}).batch_size(settings.ingest_write_batch_size):
+            window.append(chunk)
+            if len(window) >= settings.ingest_write_batch_size:
+                _update_local_indexes(added=window)
+                total += len(window)
+                window = []
+        _update_local_indexes(added=window)
+        total += len(window)
+    else:
+        total = await database.kb_chunks.count_documents({"docId": doc_id})
+    await _promote_duplicates(database, old_ids)
+    await bump_kb_version()
+    print(f"Replaced {len(old_ids)} chunks with {total} for document {doc_id} (streamed)")
+    return total
+
+
+async def remove_documents(doc_ids: List[Any]) -> int:
+    """Delete documents with their chunks and full-precision vectors. Returns chunks removed."""
+    if not doc_ids:
+        return 0
+    database = await get_database()
+    
+    chunk_ids = [doc["_id"] async for doc in database.kb_chunks.find({"docId": {"$in": doc_ids}}, {"_id": 1})]
+    if chunk_ids:
+        await database.kb_chunks.delete_many({"_id": {"$in": chunk_ids}})
+        await database[FULL_VECTORS_COLLECTION].delete_many({"_id": {"$in": chunk_ids}})
+    await database.kb_docs.delete_many({"_id": {"$in": doc_ids}})
+    
+    _update_local_indexes(removed_ids=[str(i) for i in chunk_ids])
+    await _promote_duplicates(database, chunk_ids)
+    await bump_kb_version()
+    return len(chunk_ids)
+
+
+async def _report(on_file: Optional[FileCallback], source: str, status: str, **info):
+    """Send per-file progress to the caller's callback, if any (never fails ingestion)."""
+    if on_file is None:
+        return
+    try:
+        await on_file(source, status, **info)
+    except Exception as e:
+        print(f"Error reporting progress for {source}: {e}")
+
+
+def source_files(path: Path) -> List[Path]:
+    """Supported files under a directory, in a stable order."""
+    return sorted(
+        file_path for file_path in path.rglob("*")
+        if file_path.is_file() and file_path.suffix.lower() in SUPPORTED_EXTENSIONS
+    )
+
+
+def _parse_pool(num_files: int) -> Optional[ProcessPoolExecutor]:
+    """Worker processes for parse_document (None: parse in a thread)."""
+    num_parsers = min(settings.ingest_workers or os.cpu_count() or 1, num_files)
+    # A process pool only pays for itself with more than one file; spawn avoids
+    # forking the Mongo client's threads
+    if num_parsers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=num_parsers, mp_context=multiprocessing.get_context("spawn"))
+
+
+async def ingest_files(
+    file_paths: Iterable[str],
+    tags: list = None,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+    on_file: Optional[FileCallback] = None,
+    cancelled: Optional[asyncio.Event] = None,
+    pool: Optional[ProcessPoolExecutor] = None
+) -> Dict[str, str]:
+    """Ingest many files through a staged pipeline. Returns {source: doc_id}.
+    
+    parse (process pool) -> embed (concurrent) -> write (bulk insert_many)
+    
+    Stages are connected by bounded queues, so a slow stage holds back the
+    ones before it instead of buffering the whole corpus in memory. Files
+    that fail to parse or embed are logged and skipped. Once ``cancelled``
+    is set no new files are started; files already in flight are finished.
+    Parsing uses ``pool`` when given (the caller shuts it down), otherwise
+    a pool of its own (see _parse_pool).
+    """
+    file_paths = list(file_paths)
+    if not file_paths:
+        return {}
+    database = await get_database()
+    loop = asyncio.get_running_loop()
+    
+    num_parsers = min(settings.ingest_workers or os.cpu_count() or 1, len(file_paths))
+    num_embedders = max(1, settings.ingest_embed_concurrency)
+    parsed_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.ingest_queue_size)
+    write_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.ingest_queue_size)
+    results: Dict[str, str] = {}
+    
+    own_pool = pool is None
+    if own_pool:
+        pool = _parse_pool(len(file_paths))
+    pending_paths = iter(file_paths)
+    
+    async def parse_stage():
+        for file_path in pending_paths:
+            if cancelled is not None and cancelled.is_set():
+                break
             try:
                 print(f"Ingesting {file_path}...")
-                doc_id = await ingest_document(str(file_path), **kwargs)
-                doc_ids.append(doc_id)
+                if os.path.getsize(file_path) > settings.ingest_stream_threshold_mb * 1024 * 1024:
+                    # Very large files are streamed window by window instead of
+                    # being chunked whole in a worker
+                    doc_id = await ingest_document(
+                        str(file_path), tags=tags, chunk_size=chunk_size, chunk_overlap=chunk_overlap
+                    )
+                    results[str(file_path)] = doc_id
+                    await _report(on_file, str(file_path), "added", doc_id=doc_id)
+                    continue
+                doc_data = await loop.run_in_executor(pool, parse_document, str(file_path), chunk_size, chunk_overlap)
             except Exception as e:
                 print(f"Error ingesting {file_path}: {e}")
+                await _report(on_file, str(file_path), "failed", error=str(e))
+                continue
+            await parsed_queue.put(doc_data)
+    
+    async def embed_stage():
+        while (doc_data := await parsed_queue.get()) is not None:
+            try:
+                kb_doc = KBDoc(
+                    source=doc_data["source"],
+                    title=doc_data["title"],
+                    rawText=doc_data["rawText"],
+                    tags=tags or [],
+                    **doc_data["fingerprint"]
+                )
+                doc_dict = kb_doc.model_dump(by_alias=True, exclude={"id"})
+                doc_dict["_id"] = ObjectId()
+                kb_chunks, embeddings_list = await embed_chunks(doc_dict["_id"], doc_data["chunks"])
+            except Exception as e:
+                print(f"Error embedding {doc_data['source']}: {e}")
+                await _report(on_file, doc_data["source"], "failed", error=str(e))
+                continue
+            await write_queue.put((doc_dict, kb_chunks, embeddings_list))
+    
+    async def flush(batch):
+        doc_ids = [doc_dict["_id"] for doc_dict, _, _ in batch]
+        kb_chunks = [chunk for _, chunks, _ in batch for chunk in chunks]
+        embeddings_list = [embedding for _, _, embeddings in batch for embedding in embeddings]
+        try:
+            # Fingerprints are set once the chunks are in (see ingest_document)
+            await database.kb_docs.insert_many([
+                {**doc_dict, **{field: None for field in FINGERPRINT_FIELDS}} for doc_dict, _, _ in batch
+            ])
+            if kb_chunks:
+                await _insert_chunks(database, kb_chunks, embeddings_list)
+            await database.kb_docs.bulk_write([
+                UpdateOne({"_id": doc_dict["_id"]}, {"$set": {field: doc_dict[field] for field in FINGERPRINT_FIELDS}})
+                for doc_dict, _, _ in batch
+            ])
+            _update_local_indexes(added=kb_chunks)
+            print(f"Inserted {len(batch)} documents ({len(kb_chunks)} chunks)")
+        except Exception as e:
+            print(f"Error writing {len(batch)} documents: {e}")
+            _forget_chunks(kb_chunks)
+            try:
+                # Don't leave documents behind without their chunks
+                await database.kb_chunks.delete_many({"docId": {"$in": doc_ids}})
+                await database[FULL_VECTORS_COLLECTION].delete_many({"_id": {"$in": [chunk["_id"] for chunk in kb_chunks]}})
+                await database.kb_docs.delete_many({"_id": {"$in": doc_ids}})
+            except Exception as cleanup_error:
+                print(f"Error removing {len(batch)} partially written documents: {cleanup_error}")
+            for doc_dict, _, _ in batch:
+                await _report(on_file, doc_dict["source"], "failed", error=str(e))
+            return
+        for doc_dict, chunks, _ in batch:
+            results[doc_dict["source"]] = str(doc_dict["_id"])
+            await _report(on_file, doc_dict["source"], "added", chunks=len(chunks), doc_id=str(doc_dict["_id"]))
+    
+    async def write_stage():
+        batch, batch_chunks = [], 0
+        while (item := await write_queue.get()) is not None:
+            batch.append(item)
+            batch_chunks += len(item[1])
+            # Flush when the batch is big enough or nothing else is ready yet
+            if batch_chunks >= settings.ingest_write_batch_size or write_queue.empty():
+                await flush(batch)
+                batch, batch_chunks = [], 0
+        if batch:
+            await flush(batch)
+    
+    async def run_parsers():
+        await asyncio.gather(*(parse_stage() for _ in range(num_parsers)))
+        for _ in range(num_embedders):
+            await parsed_queue.put(None)
+    
+    async def run_embedders():
+        await asyncio.gather(*(embed_stage() for _ in range(num_embedders)))
+        await write_queue.put(None)
+    
+    try:
+        await asyncio.gather(run_parsers(), run_embedders(), write_stage())
+    finally:
+        if own_pool and pool is not None:
+            pool.shutdown(cancel_futures=True)
+    
+    if results:
+        # Invalidate answers cached against the previous KB content
+        await bump_kb_version()
+    return results
+
+
+async def ingest_directory(
+    directory: str,
+    skip: Iterable[str] = (),
+    on_file: Optional[FileCallback] = None,
+    cancelled: Optional[asyncio.Event] = None,
+    **kwargs
+) -> List[str]:
+    """Ingest all documents in a directory (except sources listed in ``skip``)."""
+    path = Path(directory)
+    skip = set(skip)
+    file_paths = [str(file_path) for file_path in source_files(path) if str(file_path) not in skip]
+    results = await ingest_files(file_paths, on_file=on_file, cancelled=cancelled, **kwargs)
+    doc_ids = list(results.values())
+    
+    # Save the updated index so restarts don't have to rebuild it
+    index = get_vector_index()
+    if index.loaded:
+        await index.persist()
+    if doc_ids:
+        await update_snapshot()
     
     return doc_ids
 
 
+async def sync_directory(
+    directory: str,
+    on_file: Optional[FileCallback] = None,
+    cancelled: Optional[asyncio.Event] = None,
+    **kwargs
+) -> Dict[str, Any]:
+    """Incrementally sync a directory into the KB.
+
+    Unchanged files (same mtime and size, or same content hash) are skipped,
+    changed files (and documents without a fingerprint, whose ingestion
+    never completed) get their chunks replaced, new files are ingested and
+    documents whose source file is gone are removed. Returns a diff summary.
+    A cancelled sync stops starting new files and removes nothing.
+    """
+    database = await get_database()
+    path = Path(directory)
+    prefix = str(path).rstrip("/\\") + "/"
+    summary = {
+        "added": [], "updated": [], "unchanged": 0, "removed": [], "errors": [],
+        "chunks_removed": 0, "duplicates": 0, "cancelled": False
+    }
+    duplicates_before = get_dedup_index().duplicates
+    
+    # Existing documents from this directory, grouped by source
+    existing: Dict[str, List[Dict[str, Any]]] = {}
+    projection = {"_id": 1, "source": 1, "contentHash": 1, "mtime": 1, "size": 1, "createdAt": 1}
+    async for doc in database.kb_docs.find({}, projection):
+        source = doc.get("source", "")
+        if source.replace("\\", "/").startswith(prefix.replace("\\", "/")):
+            existing.setdefault(source, []).append(doc)
+    
+    stale_ids = []
+    for source, docs in existing.items():
+        # Earlier non-incremental runs may have left duplicates: keep the newest
+        docs.sort(key=lambda d: d.get("createdAt") or datetime.min, reverse=True)
+        stale_ids.extend(doc["_id"] for doc in docs[1:])
+    
+    seen = set()
+    new_sources = []
+    changed = []
+    for file_path in source_files(path):
+        source = str(file_path)
+        seen.add(source)
+        current = existing.get(source, [None])[0]
+        if current is None:
+            new_sources.append(source)
+            continue
+        if cancelled is not None and cancelled.is_set():
+            continue
+        try:
+            stat = file_path.stat()
+            if current.get("mtime") == stat.st_mtime and current.get("size") == stat.st_size and current.get("contentHash"):
+                summary["unchanged"] += 1
+                await _report(on_file, source, "unchanged")
+                continue
+            
+            fingerprint = await asyncio.to_thread(file_fingerprint, source)
+            if fingerprint["contentHash"] == current.get("contentHash"):
+                # Touched but identical: just record the new mtime
+                await database.kb_docs.update_one({"_id": current["_id"]}, {"$set": fingerprint})
+                summary["unchanged"] += 1
+                await _report(on_file, source, "unchanged")
+                continue
+            changed.append((source, current["_id"], fingerprint))
+        except Exception as e:
+            print(f"Error syncing {source}: {e}")
+            summary["errors"].append(source)
+            await _report(on_file, source, "failed", error=str(e))
+    
+    # Changed and new files share one parser pool
+    pool = _parse_pool(len(changed) + len(new_sources))
+    try:
+        for source, doc_id, fingerprint in changed:
+            if cancelled is not None and cancelled.is_set():
+                break
+            try:
+                print(f"Updating {source}...")
+                chunks = await replace_document(doc_id, source, fingerprint, pool=pool, **kwargs)
+                summary["updated"].append(source)
+                await _report(on_file, source, "updated", chunks=chunks, doc_id=str(doc_id))
+            except Exception as e:
+                print(f"Error syncing {source}: {e}")
+                summary["errors"].append(source)
+                await _report(on_file, source, "failed", error=str(e))
+        
+        # New files go through the parallel pipeline
+        ingested = await ingest_files(new_sources, on_file=on_file, cancelled=cancelled, pool=pool, **kwargs)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    summary["added"] = [source for source in new_sources if source in ingested]
+    summary["cancelled"] = cancelled is not None and cancelled.is_set()
+    summary["duplicates"] = get_dedup_index().duplicates - duplicates_before
+    if not summary["cancelled"]:
+        summary["errors"].extend(source for source in new_sources if source not in ingested)
+        
+        for source, docs in existing.items():
+            if source not in seen:
+                stale_ids.append(docs[0]["_id"])
+                summary["removed"].append(source)
+                await _report(on_file, source, "removed")
+        if stale_ids:
+            summary["chunks_removed"] = await remove_documents(stale_ids)
+    
+    # Save the updated index so restarts don't have to rebuild it
+    index = get_vector_index()
+    if summary["added"] or summary["updated"] or stale_ids:
+        if index.loaded:
+            await index.persist()
+        await update_snapshot()
+    
+    print(
+        f"Synced {directory}: {len(summary['added'])} added, {len(summary['updated'])} updated, "
+        f"{summary['unchanged']} unchanged, {len(summary['removed'])} removed, "
+        f"{summary['duplicates']} near-duplicate chunks"
+    )
+    return summary
+
+
 if __name__ == "__main__":
     # Example usage
     import sys
     if len(sys.argv) < 2:
-        print("Usage: python ingestion.py <file_or_directory>")
+        print("Usage: python ingestion.py <file_or_directory> [--full]")
         sys.exit(1)
     
     path = sys.argv[1]
-    asyncio.run(ingest_directory(path) if Path(path).is_dir() else ingest_document(path))
-
+    if Path(path).is_dir():
+        asyncio.run(ingest_directory(path) if "--full" in sys.argv else sync_directory(path))
+    else:
+        asyncio.run(ingest_document(path))
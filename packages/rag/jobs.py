@@ -0,0 +1,310 @@
+"""Background KB ingestion jobs with progress persisted in MongoDB.
+
+``ingest_jobs`` holds one document per job; ``ingest_job_files`` holds one
+record per source file (status, chunks, error). Any API process can run a
+queued job: the runner claims it atomically, heartbeats while it works and
+checks for cancellation. Jobs whose heartbeat goes stale (the process died
+or was restarted) are put back in the queue and resumed.
+
+A claim is identified by the worker id and the job's attempt count; every
+write a runner makes is filtered on it, so a runner whose job was requeued
+and claimed elsewhere (e.g. after a long pause) stops instead of
+overwriting the new attempt's progress.
+"""
+from typing import Dict, Any, Optional, List
+from datetime import datetime, timedelta
+from pathlib import Path
+import asyncio
+import os
+import socket
+import sys
+
+# Add apps/api to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from db import get_database
+from db.models import IngestJob
+from .ingestion import ingest_directory, sync_directory, source_files
+from .dedup import get_dedup_index
+
+
+def _serialize(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Make a Mongo document JSON-friendly (ObjectIds and datetimes to strings)."""
+    result = {}
+    for key, value in doc.items():
+        if key == "_id":
+            key = "id"
+        if isinstance(value, ObjectId):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        result[key] = value
+    return result
+
+
+class IngestJobRunner:
+    """Queues ingestion jobs and runs them one at a time in a background task."""
+    
+    def __init__(self, poll_seconds: float = 2.0, heartbeat_seconds: float = 10.0, stale_seconds: float = 60.0):
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._cancel_events: Dict[str, asyncio.Event] = {}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    
+    async def start(self):
+        """Start the background worker (resumes jobs interrupted by a restart)."""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+    
+    async def stop(self):
+        """Stop the worker. A job in progress is left running and resumed later."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def submit(self, directory: str, incremental: bool = True, user_id=None) -> str:
+        """Queue an ingestion job. Returns its id."""
+        database = await get_database()
+        job = IngestJob(directory=directory, incremental=incremental, createdBy=user_id)
+        # startedAt is left unset: _claim sets it with $min, and a stored null would win
+        result = await database.ingest_jobs.insert_one(job.model_dump(by_alias=True, exclude={"id", "startedAt"}))
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return str(result.inserted_id)
+    
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a job: queued jobs stop immediately, running ones after their in-flight files."""
+        database = await get_database()
+        oid = ObjectId(job_id)
+        await database.ingest_jobs.update_one(
+            {"_id": oid, "status": "queued"},
+            {"$set": {"status": "cancelled", "cancelRequested": True, "finishedAt": datetime.utcnow()}}
+        )
+        await database.ingest_jobs.update_one(
+            {"_id": oid, "status": "running"},
+            {"$set": {"cancelRequested": True}}
+        )
+        # Fast path when this process is running it; others notice on their next heartbeat
+        if job_id in self._cancel_events:
+            self._cancel_events[job_id].set()
+        return await self.get(job_id)
+    
+    async def get(self, job_id: str, files_limit: int = 100) -> Optional[Dict[str, Any]]:
+        """Job state with per-file progress, throughput and errors."""
+        database = await get_database()
+        oid = ObjectId(job_id)
+        job = await database.ingest_jobs.find_one({"_id": oid})
+        if job is None:
+            return None
+        
+        by_status: Dict[str, int] = {}
+        processed = chunks = 0
+        async for row in database.ingest_job_files.aggregate([
+            {"$match": {"jobId": oid}},
+            {"$group": {"_id": "$status", "files": {"$sum": 1}, "chunks": {"$sum": "$chunks"}}}
+        ]):
+            by_status[row["_id"]] = row["files"]
+            processed += row["files"]
+            chunks += row["chunks"]
+        
+        elapsed = None
+        if job.get("startedAt"):
+            elapsed = ((job.get("finishedAt") or datetime.utcnow()) - job["startedAt"]).total_seconds()
+        total = job.get("totalFiles", 0)
+        
+        files = [
+            _serialize({k: v for k, v in doc.items() if k not in ("_id", "jobId")})
+            async for doc in database.ingest_job_files.find({"jobId": oid}).sort("updatedAt", -1).limit(files_limit)
+        ]
+        errors = [
+            {"source": doc["source"], "error": doc.get("error")}
+            async for doc in database.ingest_job_files.find({"jobId": oid, "status": "failed"}).limit(files_limit)
+        ]
+        
+        return {
+            **_serialize(job),
+            "progress": {
+                "processedFiles": processed,
+                "totalFiles": total,
+                "percent": round(100 * processed / total, 1) if total else None,
+                "byStatus": by_status,
+                "chunks": chunks,
+                "elapsedSeconds": elapsed,
+                "filesPerSecond": round(processed / elapsed, 3) if elapsed else None,
+                "chunksPerSecond": round(chunks / elapsed, 2) if elapsed else None
+            },
+            "files": files,
+            "errors": errors
+        }
+    
+    async def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent jobs, newest first (without per-file detail)."""
+        database = await get_database()
+        return [
+            _serialize(doc)
+            async for doc in database.ingest_jobs.find({}).sort("createdAt", -1).limit(limit)
+        ]
+    
+    async def _loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._requeue_stale()
+                job = await self._claim()
+                if job is not None:
+                    await self._run(job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ingest job worker error: {e}")
+            
+            # Nothing queued: sleep until a job is submitted or the next poll
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _requeue_stale(self):
+        """Put running jobs whose worker stopped heartbeating back in the queue."""
+        database = await get_database()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        result = await database.ingest_jobs.update_many(
+            {"status": "running", "heartbeatAt": {"$lt": cutoff}},
+            {"$set": {"status": "queued"}}
+        )
+        if result.modified_count:
+            print(f"Requeued {result.modified_count} interrupted ingest jobs")
+    
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest queued job."""
+        database = await get_database()
+        now = datetime.utcnow()
+        return await database.ingest_jobs.find_one_and_update(
+            {"status": "queued"},
+            {
+                "$set": {"status": "running", "heartbeatAt": now, "claimedBy": self.worker_id},
+                "$min": {"startedAt": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("createdAt", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    @staticmethod
+    def _claim_filter(job: Dict[str, Any]) -> Dict[str, Any]:
+        """Matches the job only while this attempt still holds it."""
+        return {"_id": job["_id"], "status": "running", "claimedBy": job["claimedBy"], "attempts": job["attempts"]}
+    
+    async def _heartbeat(self, job: Dict[str, Any], cancelled: asyncio.Event, lost: asyncio.Event):
+        database = await get_database()
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            current = await database.ingest_jobs.find_one_and_update(
+                self._claim_filter(job),
+                {"$set": {"heartbeatAt": datetime.utcnow()}},
+                projection={"cancelRequested": 1}
+            )
+            if current is None:
+                # Requeued (our heartbeat went stale) and possibly claimed by another worker
+                print(f"Ingest job {job['_id']} lost its claim, stopping")
+                lost.set()
+                cancelled.set()
+                return
+            if current.get("cancelRequested"):
+                cancelled.set()
+    
+    async def _run(self, job: Dict[str, Any]):
+        database = await get_database()
+        job_id = job["_id"]
+        attempt = job["attempts"]
+        claim = self._claim_filter(job)
+        cancelled = asyncio.Event()
+        lost = asyncio.Event()
+        if job.get("cancelRequested"):
+            cancelled.set()
+        self._cancel_events[str(job_id)] = cancelled
+        print(f"Running ingest job {job_id} ({job['directory']}, attempt {attempt})")
+        
+        async def on_file(source: str, status: str, chunks: int = 0, doc_id: Optional[str] = None, error: Optional[str] = None):
+            if lost.is_set():
+                return
+            try:
+                # A record written by a later attempt doesn't match, and the upsert hits the unique index
+                await database.ingest_job_files.update_one(
+                    {"jobId": job_id, "source": source, "attempt": {"$not": {"$gt": attempt}}},
+                    {"$set": {"status": status, "chunks": chunks, "docId": doc_id, "error": error, "attempt": attempt, "updatedAt": datetime.utcnow()}},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                print(f"Ingest job {job_id} lost its claim, stopping")
+                lost.set()
+                cancelled.set()
+        
+        heartbeat = asyncio.create_task(self._heartbeat(job, cancelled, lost))
+        try:
+            files = await asyncio.to_thread(source_files, Path(job["directory"]))
+            await database.ingest_jobs.update_one(claim, {"$set": {"totalFiles": len(files)}})
+            
+            if job.get("incremental", True):
+                # Files finished before an interruption are simply unchanged now
+                summary = await sync_directory(job["directory"], on_file=on_file, cancelled=cancelled)
+                # Per-file detail is in ingest_job_files; keep counts on the job
+                summary = {key: len(value) if isinstance(value, list) else value for key, value in summary.items()}
+            else:
+                # Full ingest: skip files already ingested by an earlier attempt
+                done = [
+                    doc["source"]
+                    async for doc in database.ingest_job_files.find({"jobId": job_id, "status": "added"}, {"source": 1})
+                ]
+                duplicates_before = get_dedup_index().duplicates
+                doc_ids = await ingest_directory(job["directory"], skip=done, on_file=on_file, cancelled=cancelled)
+                summary = {
+                    "ingested": len(doc_ids) + len(done),
+                    "duplicates": get_dedup_index().duplicates - duplicates_before,
+                    "cancelled": cancelled.is_set()
+                }
+            status = "cancelled" if cancelled.is_set() else "completed"
+            update = {"status": status, "summary": summary}
+        except Exception as e:
+            print(f"Ingest job {job_id} failed: {e}")
+            update = {"status": "failed", "error": str(e)}
+        finally:
+            heartbeat.cancel()
+            self._cancel_events.pop(str(job_id), None)
+        
+        update["finishedAt"] = datetime.utcnow()
+        result = await database.ingest_jobs.update_one(claim, {"$set": update})
+        if result.matched_count == 0:
+            # Another attempt owns the job now; its outcome is the one that counts
+            print(f"Ingest job {job_id} attempt {attempt} ended after losing its claim ({update['status']}), result discarded")
+            return
+        print(f"Ingest job {job_id} {update['status']}")
+
+
+# Global runner instance (one per process)
+_job_runner: Optional[IngestJobRunner] = None
+
+
+def get_ingest_job_runner() -> IngestJobRunner:
+    """Get the process-wide ingestion job runner."""
+    global _job_runner
+    if _job_runner is None:
+        _job_runner = IngestJobRunner(
+            poll_seconds=settings.ingest_job_poll_seconds,
+            heartbeat_seconds=settings.ingest_job_heartbeat_seconds,
+            stale_seconds=settings.ingest_job_stale_seconds
+        )
+    return _job_runner
@@ -0,0 +1,199 @@
+"""BM25 lexical index over KB chunk text."""
+from typing import List, Dict, Any, Optional, Iterable
+from collections import Counter, defaultdict
+import asyncio
+import math
+import re
+import time
+from bson import ObjectId
+
+from .vector_index import chunk_metadata
+from .dedup import CANONICAL_FILTER
+from .versioning import get_kb_version
+
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.:][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i if in is it me my no not of on or
+our please so that the this to was what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; identifiers like INC0012345, IT-123 or 0x80070005 stay whole."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def is_identifier(token: str) -> bool:
+    """Tokens that only make sense as exact matches (error codes, ticket numbers)."""
+    return any(ch.isdigit() for ch in token)
+
+
+class BM25Index:
+    """In-memory inverted index with Okapi BM25 scoring."""
+    
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock: Optional[asyncio.Lock] = None
+        self.clear()
+    
+    def clear(self):
+        """Drop all documents."""
+        self.loaded = False
+        self.last_refresh = 0.0
+        self.kb_version: Optional[int] = None  # KB version the contents are synced to
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)  # term -> {chunk id: tf}
+        self._terms: Dict[str, List[str]] = {}  # chunk id -> distinct terms (for removal)
+        self._lengths: Dict[str, int] = {}
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0
+    
+    def __len__(self) -> int:
+        return len(self._lengths)
+    
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._lengths
+    
+    def add(self, chunk_id: str, text: str, metadata: Optional[Dict[str, Any]] = None):
+        """Index (or re-index) one chunk."""
+        if chunk_id in self._lengths:
+            self.remove([chunk_id])
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        for term, tf in counts.items():
+            self._postings[term][chunk_id] = tf
+        self._terms[chunk_id] = list(counts)
+        self._lengths[chunk_id] = len(tokens)
+        self._meta[chunk_id] = metadata or {}
+        self._total_length += len(tokens)
+    
+    def remove(self, ids: Iterable[str]) -> int:
+        """Remove chunks by id. Returns the number removed."""
+        removed = 0
+        for chunk_id in ids:
+            if chunk_id not in self._lengths:
+                continue
+            for term in self._terms.pop(chunk_id):
+                postings = self._postings[term]
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+            self._total_length -= self._lengths.pop(chunk_id)
+            self._meta.pop(chunk_id, None)
+            removed += 1
+        return removed
+    
+    def search(self, query: str, k: int, allowed_ids: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Return the top-k chunks by BM25 score, best first."""
+        n = len(self._lengths)
+        if n == 0:
+            return []
+        allowed = set(allowed_ids) if allowed_ids is not None else None
+        avg_length = self._total_length / n
+        terms = set(tokenize(query))
+        
+        scores: Dict[str, float] = defaultdict(float)
+        matched: Dict[str, set] = defaultdict(set)
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings.items():
+                if allowed is not None and chunk_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / avg_length)
+                scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+                matched[chunk_id].add(term)
+        
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            {
+                "id": chunk_id,
+                **self._meta[chunk_id],
+                "score": score,
+                "matchedTerms": sorted(matched[chunk_id])
+            }
+            for chunk_id, score in best
+        ]
+    
+    async def load(self, collection, batch_size: int = 1000):
+        """Build the index from every chunk in a collection."""
+        self.clear()
+        self.kb_version = await get_kb_version()
+        # Linked near-duplicates stay out of the index: their canonical chunk stands in for them
+        async for doc in collection.find(CANONICAL_FILTER, {"_id": 1, "docId": 1, "chunkIndex": 1, "metadata": 1, "text": 1}).batch_size(batch_size):
+            self.add(str(doc["_id"]), doc.get("text", ""), chunk_metadata(doc))
+        self.loaded = True
+        self.last_refresh = time.monotonic()
+        print(f"Loaded {len(self)} chunks into lexical index")
+    
+    async def refresh(self, collection):
+        """Incrementally sync with a collection: index new chunks, drop deleted ones."""
+        if not self.loaded:
+            return await self.load(collection)
+        
+        version = await get_kb_version()
+        if version == self.kb_version:
+            # Every KB write bumps the version: nothing changed since the last sync
+            self.last_refresh = time.monotonic()
+            return
+        
+        current = set()
+        async for doc in collection.find(CANONICAL_FILTER, {"_id": 1}):
+            current.add(str(doc["_id"]))
+        
+        removed = self.remove([chunk_id for chunk_id in list(self._lengths) if chunk_id not in current])
+        missing = [chunk_id for chunk_id in current if chunk_id not in self._lengths]
+        if missing:
+            query = {"_id": {"$in": [ObjectId(chunk_id) for chunk_id in missing]}}
+            async for doc in collection.find(query, {"_id": 1, "docId": 1, "chunkIndex": 1, "metadata": 1, "text": 1}):
+                self.add(str(doc["_id"]), doc.get("text", ""), chunk_metadata(doc))
+        
+        self.kb_version = version
+        self.last_refresh = time.monotonic()
+        if missing or removed:
+            print(f"Lexical index refreshed: +{len(missing)} -{removed} ({len(self)} chunks)")
+    
+    async def ensure_fresh(self, collection, max_age: float):
+        """Load on first use, then refresh when older than ``max_age`` seconds."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.loaded or time.monotonic() - self.last_refresh > max_age:
+                await self.refresh(collection)
+    
+    def add_chunks(self, chunks: List[Dict[str, Any]]):
+        """Index freshly inserted chunk documents (no-op until the index is loaded)."""
+        if not self.loaded:
+            return
+        for chunk in chunks:
+            if "_id" in chunk and "duplicateOf" not in chunk:
+                self.add(str(chunk["_id"]), chunk.get("text", ""), chunk_metadata(chunk))
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int, rrf_k: int = 60) -> List[Dict[str, Any]]:
+    """Fuse ranked result lists: score = sum(1 / (rrf_k + rank)) over the lists."""
+    fused: Dict[str, float] = defaultdict(float)
+    first_seen: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            fused[result["id"]] += 1.0 / (rrf_k + rank)
+            first_seen.setdefault(result["id"], result)
+    
+    best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [{**first_seen[chunk_id], "score": score} for chunk_id, score in best]
+
+
+# Global lexical index instance (one per process)
+_lexical_index: Optional[BM25Index] = None
+
+
+def get_lexical_index() -> BM25Index:
+    """Get the process-wide lexical index."""
+    global _lexical_index
+    if _lexical_index is None:
+        _lexical_index = BM25Index()
+    return _lexical_index
@@ -1,13 +1,36 @@
 """Document loaders for KB ingestion."""
 import os
-from typing import List, Dict
+import re
+from typing import List, Dict, Iterator, Optional
 from pathlib import Path
 import PyPDF2
-from bs4 import BeautifulSoup
+from PyPDF2.generic import IndirectObject
+from lxml import etree
 import markdown
 from db.models import KBDoc
 
 
+# HTML elements whose text is never indexed
+HTML_SKIP_TAGS = {"script", "style", "noscript", "template"}
+# Headings that start a new section
+HTML_SECTION_TAGS = {"h1", "h2", "h3"}
+# Elements that break text into separate lines
+HTML_BLOCK_TAGS = {
+    "p", "div", "br", "li", "tr", "table", "section", "article", "header", "footer",
+    "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "ul", "ol", "dt", "dd"
+}
+
+# Page attributes a PDF page inherits from its parent page-tree nodes
+PDF_INHERITED_ATTRIBUTES = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+# Bytes read per step when streaming text and HTML files
+READ_BLOCK_SIZE = 1 << 16
+# libxml2's HTML push parser keeps all the input it was fed: after this many
+# bytes it is replaced by a fresh one, starting at the next block-level tag
+HTML_PARSER_RESTART_BYTES = 4 << 20
+HTML_BLOCK_START = re.compile(rb"<(?:p|div|li|tr|h[1-6]|section|article|table|ul|ol|pre|blockquote)[\s/>]", re.IGNORECASE)
+
+
 async def load_file(file_path: str) -> Dict:
     """Load and extract text from a file."""
     path = Path(file_path)
@@ -29,13 +52,222 @@ async def load_file(file_path: str) -> Dict:
         raise ValueError(f"Unsupported file type: {ext}")
 
 
-async def load_pdf(file_path: str) -> Dict:
-    """Load PDF file."""
+def open_document(file_path: str) -> Dict:
+    """Open a file for streaming: its title and source plus a lazy ``sections`` iterator.
+
+    Sections are ``{"text", "page"}`` records for PDFs, ``{"text", "section"}``
+    for HTML (split at h1-h3) and paragraph blocks for Markdown/text, so
+    callers never need the whole document text in memory.
+    """
+    path = Path(file_path)
+    
+    if not path.exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+    
+    ext = path.suffix.lower()
+    
+    if ext == ".pdf":
+        title, sections = path.stem, iter_pdf_pages(file_path)
+    elif ext in [".html", ".htm"]:
+        title, sections = html_title(file_path) or path.stem, iter_html_sections(file_path)
+    elif ext in [".md", ".markdown"]:
+        title, sections = markdown_title(file_path) or path.stem, iter_text_blocks(file_path)
+    elif ext == ".txt":
+        title, sections = path.stem, iter_text_blocks(file_path)
+    else:
+        raise ValueError(f"Unsupported file type: {ext}")
+    
+    return {"title": title, "source": file_path, "sections": sections}
+
+
+def _iter_pdf_page_objects(reader: PyPDF2.PdfReader, node=None, inherited: Optional[Dict] = None, reference=None):
+    """Walk the page tree lazily (``reader.pages`` flattens every page up front)."""
+    if node is None:
+        node = reader.trailer["/Root"].get_object()["/Pages"].get_object()
+        inherited = {}
+    if node.get("/Type", "/Pages") == "/Pages":
+        inherited = {**inherited, **{key: value for key, value in node.items() if key in PDF_INHERITED_ATTRIBUTES}}
+        for kid in node["/Kids"]:
+            reference = kid if isinstance(kid, IndirectObject) else None
+            yield from _iter_pdf_page_objects(reader, kid.get_object(), inherited, reference)
+    else:
+        page = PyPDF2.PageObject(reader, reference)
+        page.update({**inherited, **node})
+        yield page
+
+
+def iter_pdf_pages(file_path: str) -> Iterator[Dict]:
+    """Yield the text of a PDF one page at a time."""
     with open(file_path, "rb") as f:
         reader = PyPDF2.PdfReader(f)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
+        for number, page in enumerate(_iter_pdf_page_objects(reader), start=1):
+            yield {"text": page.extract_text() or "", "page": number}
+            # Drop parsed objects (content streams, fonts) so memory doesn't grow
+            # with page count; objects still needed are re-read from the file.
+            # resolved_objects is a private cache of PyPDF2 3.0.1 (pinned in
+            # apps/api/requirements.txt): skip the trim if a release drops it
+            if hasattr(reader, "resolved_objects"):
+                reader.resolved_objects.clear()
+
+
+class _HTMLSectionTarget:
+    """lxml parser target that collects visible text into heading-delimited sections."""
+    
+    def __init__(self):
+        self.sections: List[Dict] = []
+        self.parts: List[str] = []
+        self.heading: Optional[str] = None
+        self.title: Optional[str] = None
+        self.in_body = False
+        self._skip = 0
+        self._title_parts: Optional[List[str]] = None
+        self._heading_parts: Optional[List[str]] = None
+    
+    def _flush(self):
+        # Block tags leave runs of newlines; keep at most one blank line (a paragraph break)
+        text = re.sub(r"\n{3,}", "\n\n", re.sub(r"[ \t]*\n[ \t]*", "\n", "".join(self.parts))).strip()
+        if text:
+            self.sections.append({"text": text, "section": self.heading})
+        self.parts = []
+    
+    def start(self, tag, attrib):
+        tag = tag.lower() if isinstance(tag, str) else ""
+        if tag == "body":
+            self.in_body = True
+        if tag in HTML_SKIP_TAGS:
+            self._skip += 1
+        elif tag == "title" and self.title is None:
+            self._title_parts = []
+        elif tag in HTML_SECTION_TAGS:
+            self._flush()
+            self._heading_parts = []
+        if tag in HTML_BLOCK_TAGS:
+            self.parts.append("\n")
+    
+    def end(self, tag):
+        tag = tag.lower() if isinstance(tag, str) else ""
+        if tag in HTML_SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag == "title" and self._title_parts is not None:
+            self.title = " ".join("".join(self._title_parts).split()) or None
+            self._title_parts = None
+        elif tag in HTML_SECTION_TAGS and self._heading_parts is not None:
+            self.heading = " ".join("".join(self._heading_parts).split()) or None
+            self._heading_parts = None
+        if tag in HTML_BLOCK_TAGS:
+            self.parts.append("\n")
+    
+    def data(self, data):
+        if self._skip:
+            return
+        if self._title_parts is not None:
+            self._title_parts.append(data)
+            return
+        if self._heading_parts is not None:
+            self._heading_parts.append(data)
+        self.parts.append(data)
+    
+    def comment(self, text):
+        pass
+    
+    def close(self):
+        self._flush()
+
+
+def _open_comment_after(data: bytes, in_comment: bool, previous: bytes = b"") -> bool:
+    """Whether an HTML comment is still open at the end of ``data``.
+    
+    ``previous`` is the end of the data before it, so markers split across
+    reads are found; markers entirely within it were already counted.
+    """
+    text = previous[-3:] + data
+    carried = len(text) - len(data)
+    position = 0
+    while True:
+        marker = b"-->" if in_comment else b"<!--"
+        found = text.find(marker, position)
+        if found == -1:
+            return in_comment
+        position = found + len(marker)
+        if position > carried:
+            in_comment = not in_comment
+
+
+def iter_html_sections(file_path: str) -> Iterator[Dict]:
+    """Yield the visible text of an HTML file section by section (streamed through lxml).
+    
+    Every HTML_PARSER_RESTART_BYTES the parser is closed at a block-level tag
+    and a new one continues with the same target, so memory stays bounded.
+    """
+    target = _HTMLSectionTarget()
+    parser = etree.HTMLParser(target=target, encoding="utf-8")
+    fed = 0
+    in_comment = False
+    previous = b""
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+            match = HTML_BLOCK_START.search(block) if fed >= HTML_PARSER_RESTART_BYTES else None
+            if match is not None:
+                head, block = block[:match.start()], block[match.start():]
+                parser.feed(head)
+                in_comment = _open_comment_after(head, in_comment, previous)
+                previous = previous[-3:] + head
+                # Only restart where no state is lost: outside comments, skipped
+                # elements, the title and headings
+                if not (in_comment or target._skip or target._title_parts is not None or target._heading_parts is not None):
+                    parser.close()
+                    parser = etree.HTMLParser(target=target, encoding="utf-8")
+                    fed = 0
+            parser.feed(block)
+            fed += len(block)
+            in_comment = _open_comment_after(block, in_comment, previous)
+            previous = block
+            if target.sections:
+                yield from target.sections
+                target.sections = []
+    parser.close()
+    yield from target.sections
+
+
+def html_title(file_path: str) -> Optional[str]:
+    """Read the <title> of an HTML file, stopping at the start of the body."""
+    target = _HTMLSectionTarget()
+    parser = etree.HTMLParser(target=target, encoding="utf-8")
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+            parser.feed(block)
+            if target.title is not None or target.in_body:
+                break
+    return target.title
+
+
+def markdown_title(file_path: str) -> Optional[str]:
+    """Title from the first H1 in the first 10 lines of a Markdown file."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        for _, line in zip(range(10), f):
+            if line.startswith("# "):
+                return line[2:].strip()
+    return None
+
+
+def iter_text_blocks(file_path: str, block_chars: int = READ_BLOCK_SIZE) -> Iterator[Dict]:
+    """Yield a text file in blocks of roughly ``block_chars``, split at blank lines."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        lines: List[str] = []
+        size = 0
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if size >= block_chars and not line.strip():
+                yield {"text": "".join(lines)}
+                lines, size = [], 0
+        if lines:
+            yield {"text": "".join(lines)}
+
+
+async def load_pdf(file_path: str) -> Dict:
+    """Load PDF file."""
+    text = "\n".join(page["text"] for page in iter_pdf_pages(file_path))
     
     return {
         "rawText": text,
@@ -46,15 +278,8 @@ async def load_pdf(file_path: str) -> Dict:
 
 async def load_html(file_path: str) -> Dict:
     """Load HTML file."""
-    with open(file_path, "r", encoding="utf-8") as f:
-        soup = BeautifulSoup(f.read(), "html.parser")
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-        
-        text = soup.get_text()
-        title = soup.title.string if soup.title else Path(file_path).stem
+    text = "\n\n".join(section["text"] for section in iter_html_sections(file_path))
+    title = html_title(file_path) or Path(file_path).stem
     
     return {
         "rawText": text,
@@ -96,4 +321,3 @@ async def load_text(file_path: str) -> Dict:
         "title": Path(file_path).stem,
         "source": file_path
     }
-
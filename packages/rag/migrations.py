@@ -0,0 +1,176 @@
+"""One-shot migrations for stored KB chunk embeddings."""
+from typing import Dict
+import sys
+from pathlib import Path
+
+# Add apps/api to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from pymongo import UpdateOne, ReplaceOne
+from db import get_database
+from .vector_codec import (
+    STORAGE_FORMATS,
+    EMBEDDING_FIELDS,
+    FULL_VECTORS_COLLECTION,
+    encode_embedding,
+    encode_float32,
+    decode_embedding,
+    storage_format_of
+)
+from .embeddings import get_embeddings, truncate_embedding
+from .versioning import bump_kb_version
+from .snapshot import update_snapshot
+import asyncio
+
+
+async def migrate_embedding_storage(target_format: str, batch_size: int = 500) -> Dict[str, int]:
+    """Rewrite every kb_chunks embedding in ``target_format``.
+
+    Chunks already in the target format are skipped, so the migration can be
+    re-run after an interruption. Converting away from int8 uses the
+    full-precision copy in kb_chunk_vectors when one exists.
+    """
+    if target_format not in STORAGE_FORMATS:
+        raise ValueError(f"Unknown embedding storage format: {target_format}")
+    
+    database = await get_database()
+    chunks = database.kb_chunks
+    full_vectors = database[FULL_VECTORS_COLLECTION]
+    summary = {"migrated": 0, "skipped": 0}
+    
+    async def flush(batch):
+        chunk_ops, vector_ops = [], []
+        int8_ids = [doc["_id"] for doc in batch if storage_format_of(doc) == "int8"]
+        originals = {}
+        if int8_ids:
+            async for doc in full_vectors.find({"_id": {"$in": int8_ids}}):
+                originals[doc["_id"]] = decode_embedding(doc)
+        
+        for doc in batch:
+            vector = originals.get(doc["_id"])
+            if vector is None:
+                vector = decode_embedding(doc)
+            fields = encode_embedding(vector, target_format)
+            update = {"$set": fields}
+            if target_format != "int8":
+                update["$unset"] = {"embeddingScale": "", "embeddingOffset": ""}
+            chunk_ops.append(UpdateOne({"_id": doc["_id"]}, update))
+            if target_format == "int8":
+                vector_ops.append(ReplaceOne({"_id": doc["_id"]}, {"_id": doc["_id"], "embedding": encode_float32(vector)}, upsert=True))
+        
+        # Write full-precision copies first so a crash never leaves int8 chunks without them
+        if vector_ops:
+            await full_vectors.bulk_write(vector_ops, ordered=False)
+        await chunks.bulk_write(chunk_ops, ordered=False)
+        if target_format != "int8":
+            await full_vectors.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+    
+    batch = []
+    async for doc in chunks.find({}, {"_id": 1, **EMBEDDING_FIELDS}):
+        current = storage_format_of(doc)
+        if current is None or current == target_format:
+            summary["skipped"] += 1
+            continue
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await flush(batch)
+            summary["migrated"] += len(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+        summary["migrated"] += len(batch)
+    
+    if summary["migrated"]:
+        await bump_kb_version()
+        # Workers remap the new snapshot instead of keeping the old vectors
+        await update_snapshot()
+    print(f"Embedding storage migration to {target_format}: {summary}")
+    return summary
+
+
+async def migrate_embedding_dimensions(dimensions: int, mode: str = "truncate", batch_size: int = 100) -> Dict[str, int]:
+    """Reduce every kb_chunks embedding to ``dimensions``, keeping its storage format.
+    
+    ``truncate`` keeps the leading dimensions and re-normalizes, which is valid
+    for Matryoshka-trained models (text-embedding-3-*). ``reembed`` requests
+    new embeddings of the target size from the API. Chunks already at the
+    target size are skipped. Set EMBEDDING_DIMENSIONS to the same value (and
+    numDimensions on the Atlas index, if used) so queries match.
+    """
+    if mode not in ("truncate", "reembed"):
+        raise ValueError(f"Unknown migration mode: {mode}")
+    
+    database = await get_database()
+    chunks = database.kb_chunks
+    full_vectors = database[FULL_VECTORS_COLLECTION]
+    summary = {"migrated": 0, "skipped": 0}
+    
+    async def flush(batch):
+        if mode == "reembed":
+            vectors = await get_embeddings([doc.get("text", "") for doc in batch], dimensions=dimensions)
+        else:
+            # Truncate the full-precision copy when chunks are stored as int8
+            originals = {}
+            int8_ids = [doc["_id"] for doc in batch if storage_format_of(doc) == "int8"]
+            if int8_ids:
+                async for doc in full_vectors.find({"_id": {"$in": int8_ids}}):
+                    originals[doc["_id"]] = decode_embedding(doc)
+            vectors = []
+            for doc in batch:
+                vector = originals.get(doc["_id"])
+                if vector is None:
+                    vector = decode_embedding(doc)
+                vectors.append(truncate_embedding(vector, dimensions))
+        
+        chunk_ops, vector_ops = [], []
+        for doc, vector in zip(batch, vectors):
+            storage_format = storage_format_of(doc)
+            chunk_ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": encode_embedding(vector, storage_format)}))
+            if storage_format == "int8":
+                vector_ops.append(ReplaceOne({"_id": doc["_id"]}, {"_id": doc["_id"], "embedding": encode_float32(vector)}, upsert=True))
+        if vector_ops:
+            await full_vectors.bulk_write(vector_ops, ordered=False)
+        await chunks.bulk_write(chunk_ops, ordered=False)
+    
+    projection = {"_id": 1, **EMBEDDING_FIELDS}
+    if mode == "reembed":
+        projection["text"] = 1
+    
+    batch = []
+    async for doc in chunks.find({}, projection):
+        vector = decode_embedding(doc)
+        if vector is None or len(vector) == dimensions:
+            summary["skipped"] += 1
+            continue
+        if len(vector) < dimensions and mode == "truncate":
+            raise ValueError(f"Chunk {doc['_id']} has {len(vector)} dimensions, cannot truncate to {dimensions}")
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await flush(batch)
+            summary["migrated"] += len(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+        summary["migrated"] += len(batch)
+    
+    if summary["migrated"]:
+        await bump_kb_version()
+        # Workers remap the new snapshot instead of keeping the old vectors
+        await update_snapshot()
+    print(f"Embedding dimension migration to {dimensions} ({mode}): {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    # Usage:
+    #   python -m packages.rag.migrations storage <array|float32|int8>
+    #   python -m packages.rag.migrations dimensions <dims> [truncate|reembed]
+    if len(sys.argv) >= 3 and sys.argv[1] == "storage":
+        asyncio.run(migrate_embedding_storage(sys.argv[2]))
+    elif len(sys.argv) >= 3 and sys.argv[1] == "dimensions":
+        mode = sys.argv[3] if len(sys.argv) > 3 else "truncate"
+        asyncio.run(migrate_embedding_dimensions(int(sys.argv[2]), mode))
+    else:
+        print("Usage: python -m packages.rag.migrations storage <array|float32|int8>")
+        print("       python -m packages.rag.migrations dimensions <dims> [truncate|reembed]")
+        sys.exit(1)
@@ -1,4 +1,4 @@
-"""Vector retrieval using MongoDB Atlas Vector Search."""
+"""Vector retrieval using MongoDB Atlas Vector Search or an in-process index."""
 from typing import List, Dict, Any, Optional
 from bson import ObjectId
 import sys
@@ -8,25 +8,92 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
 
 from db import get_database
+from config import settings
 from .embeddings import embed_query
-import config
+from .vector_index import get_vector_index
+from .vector_codec import FULL_VECTORS_COLLECTION, decode_embedding
+from .lexical import get_lexical_index, reciprocal_rank_fusion, tokenize, is_identifier
+import numpy as np
 
 
 class VectorRetriever:
-    """Retriever for MongoDB Atlas Vector Search."""
+    """Retriever for KB chunks: vector, lexical (BM25) or hybrid."""
     
     def __init__(self, collection_name: str = "kb_chunks", index_name: str = "kb_chunks_vec"):
         self.collection_name = collection_name
         self.index_name = index_name
     
     async def retrieve(self, query: str, k: int = 6, filter_dict: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        """Retrieve top-k chunks for a query."""
+        """Retrieve top-k chunks for a query using the configured retrieval mode."""
+        mode = settings.retrieval_mode
+        if mode == "vector":
+            return await self._vector_retrieve(query, k, filter_dict)
+        
+        database = await get_database()
+        collection = database[self.collection_name]
+        num_candidates = max(k, settings.hybrid_num_candidates)
+        
+        lexical_hits = await self._lexical_retrieve(collection, query, num_candidates, filter_dict)
+        
+        # Exact identifier matches (error codes, ticket numbers) don't need an embedding
+        if mode == "lexical" or self._lexical_is_decisive(query, lexical_hits):
+            return await self._hydrate(collection, lexical_hits[:k])
+        
+        try:
+            vector_hits = await self._vector_retrieve(query, num_candidates, filter_dict)
+        except Exception as e:
+            if not lexical_hits:
+                raise
+            print(f"Vector retrieval failed: {e}, using lexical results only")
+            vector_hits = []
+        
+        fused = reciprocal_rank_fusion([vector_hits, lexical_hits], k, settings.rrf_k)
+        return await self._hydrate(collection, fused)
+    
+    async def _lexical_retrieve(self, collection, query: str, k: int, filter_dict: Optional[Dict] = None) -> List[Dict[str, Any]]:
+        """BM25 retrieval from the in-process lexical index."""
+        index = get_lexical_index()
+        await index.ensure_fresh(collection, settings.vector_index_refresh_seconds)
+        
+        allowed_ids = None
+        if filter_dict:
+            allowed_ids = [str(doc["_id"]) async for doc in collection.find(filter_dict, {"_id": 1})]
+        
+        return index.search(query, k, allowed_ids)
+    
+    async def retrieve_exact(self, query: str, k: int = 6, filter_dict: Optional[Dict] = None) -> Optional[List[Dict[str, Any]]]:
+        """Lexical results when they settle the query on their own, otherwise None.
+        
+        Queries without identifier-like tokens return None without searching,
+        so this is cheap to try before anything that needs the query embedding.
+        """
+        if settings.retrieval_mode == "vector" or not settings.lexical_short_circuit or not _identifiers(query):
+            return None
+        database = await get_database()
+        collection = database[self.collection_name]
+        lexical_hits = await self._lexical_retrieve(collection, query, k, filter_dict)
+        if not self._lexical_is_decisive(query, lexical_hits):
+            return None
+        return await self._hydrate(collection, lexical_hits[:k])
+    
+    def _lexical_is_decisive(self, query: str, lexical_hits: List[Dict[str, Any]]) -> bool:
+        """True when the top lexical hit contains every identifier-like token of the query."""
+        if not settings.lexical_short_circuit or not lexical_hits:
+            return False
+        identifiers = _identifiers(query)
+        return bool(identifiers) and identifiers <= set(lexical_hits[0]["matchedTerms"])
+    
+    async def _vector_retrieve(self, query: str, k: int, filter_dict: Optional[Dict] = None) -> List[Dict[str, Any]]:
+        """Vector retrieval via Atlas Vector Search or the in-process index."""
         database = await get_database()
         collection = database[self.collection_name]
         
         # Get query embedding
         query_vector = await embed_query(query)
         
+        if settings.vector_backend != "atlas":
+            return await self._local_retrieve(query_vector, k, filter_dict)
+        
         # Build aggregation pipeline for vector search
         pipeline = [
             {
@@ -68,52 +135,81 @@ class VectorRetriever:
             # Fallback: simple cosine similarity on client side
             # This is less efficient but works if Vector Search isn't enabled
             print(f"Vector search failed: {e}, using fallback")
-            return await self._fallback_retrieve(query_vector, k, filter_dict)
+            return await self._local_retrieve(query_vector, k, filter_dict)
     
-    async def _fallback_retrieve(self, query_vector: List[float], k: int, filter_dict: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        """Fallback retrieval using cosine similarity."""
-        import numpy as np
-        from db import get_database
-        
+    async def _local_retrieve(self, query_vector: List[float], k: int, filter_dict: Optional[Dict] = None) -> List[Dict[str, Any]]:
+        """Retrieval using the in-process vector index (flat or IVF)."""
         database = await get_database()
         collection = database[self.collection_name]
         
-        # Fetch all chunks (or filtered subset)
-        query = filter_dict or {}
-        chunks = []
-        
-        async for doc in collection.find(query):
-            chunks.append({
-                "id": str(doc["_id"]),
-                "docId": str(doc["docId"]),
-                "chunkIndex": doc.get("chunkIndex", 0),
-                "text": doc["text"],
-                "metadata": doc.get("metadata", {}),
-                "embedding": doc.get("embedding", [])
-            })
-        
-        # Compute cosine similarity
-        query_vec = np.array(query_vector)
-        similarities = []
-        
-        for chunk in chunks:
-            if not chunk["embedding"]:
-                continue
-            chunk_vec = np.array(chunk["embedding"])
-            similarity = np.dot(query_vec, chunk_vec) / (np.linalg.norm(query_vec) * np.linalg.norm(chunk_vec))
-            similarities.append((chunk, similarity))
-        
-        # Sort by similarity and return top-k
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        
-        return [
-            {
-                **chunk,
-                "score": float(score),
-                "embedding": []  # Remove embedding from response
-            }
-            for chunk, score in similarities[:k]
-        ]
+        index = get_vector_index()
+        await index.ensure_fresh(collection, settings.vector_index_refresh_seconds, expected_dim=len(query_vector))
+        
+        # Restrict to the filtered subset (ids only, no embeddings over the wire)
+        allowed_ids = None
+        if filter_dict:
+            allowed_ids = [str(doc["_id"]) async for doc in collection.find(filter_dict, {"_id": 1})]
+        
+        if settings.embedding_storage == "int8":
+            # Over-fetch on the quantized vectors, then rescore at full precision
+            hits = index.search(query_vector, k * settings.rescore_factor, allowed_ids)
+            hits = await self._rescore(database, query_vector, hits, k)
+        else:
+            hits = index.search(query_vector, k, allowed_ids)
+        return await self._hydrate(collection, hits)
+    
+    async def _rescore(self, database, query_vector: List[float], hits: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        """Re-rank candidates by cosine similarity against their full-precision vectors."""
+        if not hits:
+            return hits
+        
+        full_vectors = {}
+        async for doc in database[FULL_VECTORS_COLLECTION].find({"_id": {"$in": [ObjectId(h["id"]) for h in hits]}}):
+            full_vectors[str(doc["_id"])] = decode_embedding(doc)
+        
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        for hit in hits:
+            vector = full_vectors.get(hit["id"])
+            if vector is not None:
+                hit["score"] = float(vector @ query / (np.linalg.norm(vector) or 1.0))
+        
+        hits.sort(key=lambda h: h["score"], reverse=True)
+        return hits[:k]
+    
+    async def _hydrate(self, collection, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fetch chunk text for index hits that lack it, preserving rank order."""
+        missing = [ObjectId(h["id"]) for h in hits if "text" not in h]
+        
+        texts = {}
+        if missing:
+            async for doc in collection.find({"_id": {"$in": missing}}, {"text": 1}):
+                texts[str(doc["_id"])] = doc.get("text", "")
+        
+        results = []
+        for hit in hits:
+            if "text" not in hit:
+                if hit["id"] not in texts:
+                    continue  # deleted since the index was refreshed
+                hit = {**hit, "text": texts[hit["id"]]}
+            hit.pop("matchedTerms", None)
+            results.append(hit)
+        return results
+
+
+async def warm_indexes(collection_name: str = "kb_chunks"):
+    """Build the in-process indexes up front so the first query doesn't pay for it."""
+    database = await get_database()
+    collection = database[collection_name]
+    
+    if settings.retrieval_mode != "vector":
+        await get_lexical_index().ensure_fresh(collection, settings.vector_index_refresh_seconds)
+    if settings.vector_backend != "atlas":
+        await get_vector_index().ensure_fresh(collection, settings.vector_index_refresh_seconds)
+
+
+def _identifiers(query: str) -> set:
+    return {t for t in tokenize(query) if is_identifier(t)}
 
 
 # Global retriever instance
@@ -135,3 +231,15 @@ async def retrieve_kb(query: str, k: int = 6) -> List[Dict[str, Any]]:
         # Return empty list to trigger LLM fallback
         return []
 
+
+async def retrieve_kb_exact(query: str, k: int = 6) -> Optional[List[Dict[str, Any]]]:
+    """KB chunks for identifier queries the lexical index settles (None otherwise)."""
+    global _retriever
+    try:
+        if _retriever is None:
+            _retriever = VectorRetriever()
+        
+        return await _retriever.retrieve_exact(query, k)
+    except Exception as e:
+        print(f"Error in retrieve_kb_exact: {e}")
+        return None
@@ -0,0 +1,152 @@
+"""Memory-mapped embedding snapshots for warm-starting in-process vector indexes.
+
+A snapshot directory holds:
+
+    vectors-v<version>-<pid>.npy   float32 (rows, dim), unit-normalized
+    vectors-v<version>-<pid>.json  sidecar: chunk ids and metadata by row
+    snapshot.json                  manifest naming the current pair
+
+Ingestion writes a new pair after each run and swaps the manifest
+atomically. Readers open the matrix with ``numpy.memmap``, so every worker
+on the host shares the same page cache instead of streaming all embeddings
+out of MongoDB into a private copy.
+"""
+from typing import Dict, Any, Optional
+from datetime import datetime
+from pathlib import Path
+import json
+import os
+import sys
+import numpy as np
+
+# Add apps/api to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from config import settings
+from db import get_database
+from .vector_codec import decode_embedding
+from .vector_index import INDEX_PROJECTION, chunk_metadata
+from .dedup import CANONICAL_FILTER
+from .versioning import get_kb_version
+
+
+MANIFEST_NAME = "snapshot.json"
+
+
+def read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+    """The current manifest, or None when no snapshot has been written."""
+    try:
+        with open(Path(directory) / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def open_snapshot(directory: str) -> Optional[Dict[str, Any]]:
+    """Open the current snapshot: version, model, dim, ids, meta and a memory-mapped ``matrix``.
+
+    The matrix is mapped copy-on-write: pages stay shared between processes
+    until one of them modifies a row.
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    directory = Path(directory)
+    with open(directory / manifest["sidecar"], "r", encoding="utf-8") as f:
+        sidecar = json.load(f)
+    matrix = np.load(directory / manifest["vectors"], mmap_mode="c")
+    return {
+        "version": sidecar["version"],
+        "model": sidecar["model"],
+        "dim": sidecar["dim"],
+        "ids": sidecar["ids"],
+        "meta": sidecar["meta"],
+        "matrix": matrix[:len(sidecar["ids"])]
+    }
+
+
+async def write_snapshot(collection, directory: str, batch_size: int = 1000) -> Optional[Dict[str, Any]]:
+    """Write every embedded chunk of ``collection`` to a new snapshot. Returns its manifest.
+
+    The snapshot is stamped with the KB version read before streaming starts;
+    readers whose KB version differs catch up through an incremental refresh.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    version = await get_kb_version()
+    upper = await collection.count_documents(CANONICAL_FILTER)
+    stem = f"vectors-v{version}-{os.getpid()}"
+    vectors_path = directory / f"{stem}.npy"
+    sidecar_path = directory / f"{stem}.json"
+    # Never write into a file another process may have mapped: write aside, then rename
+    tmp_vectors = directory / f"{stem}.npy.tmp"
+    
+    matrix = None
+    ids, meta = [], []
+    async for doc in collection.find(CANONICAL_FILTER, INDEX_PROJECTION).batch_size(batch_size):
+        embedding = decode_embedding(doc)
+        if embedding is None:
+            continue
+        if matrix is None:
+            matrix = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=np.float32, shape=(upper, len(embedding)))
+        if len(ids) >= upper:
+            break  # inserted after counting; readers pick these up on refresh
+        if len(embedding) != matrix.shape[1]:
+            continue  # mid-migration to another dimensionality
+        norm = np.linalg.norm(embedding)
+        matrix[len(ids)] = embedding / norm if norm else embedding
+        ids.append(str(doc["_id"]))
+        meta.append(chunk_metadata(doc))
+    if matrix is None:
+        return None
+    dim = matrix.shape[1]
+    matrix.flush()
+    del matrix
+    
+    tmp_sidecar = directory / f"{stem}.json.tmp"
+    with open(tmp_sidecar, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "model": settings.embedding_model, "dim": dim, "ids": ids, "meta": meta}, f)
+    manifest = {
+        "version": version,
+        "vectors": vectors_path.name,
+        "sidecar": sidecar_path.name,
+        "count": len(ids),
+        "createdAt": datetime.utcnow().isoformat()
+    }
+    current = read_manifest(str(directory))
+    if current is not None and current["version"] > version:
+        # A newer snapshot landed while this one was being written
+        tmp_vectors.unlink()
+        tmp_sidecar.unlink()
+        return current
+    tmp_vectors.replace(vectors_path)
+    tmp_sidecar.replace(sidecar_path)
+    tmp_manifest = directory / f"{MANIFEST_NAME}.{os.getpid()}.tmp"
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    tmp_manifest.replace(directory / MANIFEST_NAME)
+    
+    # Drop older snapshots (processes that still map them keep their pages until they remap)
+    for path in directory.glob("vectors-v*"):
+        try:
+            if int(path.name.split("-")[1][1:]) < version:
+                path.unlink()
+        except (ValueError, OSError):
+            pass
+    
+    print(f"Wrote KB snapshot v{version}: {len(ids)} chunks x {dim} dims")
+    return manifest
+
+
+async def update_snapshot():
+    """Rewrite the snapshot after the KB changed (only used by the in-process backends)."""
+    if not settings.vector_snapshot_path or settings.vector_backend == "atlas":
+        return
+    try:
+        manifest = read_manifest(settings.vector_snapshot_path)
+        if manifest is not None and manifest["version"] >= await get_kb_version():
+            return
+        database = await get_database()
+        await write_snapshot(database.kb_chunks, settings.vector_snapshot_path)
+    except Exception as e:
+        print(f"Error writing KB snapshot: {e}")
@@ -0,0 +1,84 @@
+"""Storage formats for chunk embeddings in MongoDB.
+
+``array``   - BSON array of doubles (original format, ~14 bytes per dimension)
+``float32`` - packed float32 BSON vector (BinData subtype 9, 4 bytes per dimension)
+``int8``    - packed int8 vector plus per-vector ``embeddingScale``/``embeddingOffset``
+              (1 byte per dimension); the float32 original goes to
+              ``kb_chunk_vectors`` and is only read to rescore top candidates
+"""
+from typing import List, Dict, Any, Optional, Union
+import numpy as np
+from bson.binary import Binary, BinaryVectorDtype
+
+
+STORAGE_FORMATS = ("array", "float32", "int8")
+
+# Collection holding full-precision vectors when kb_chunks stores int8
+FULL_VECTORS_COLLECTION = "kb_chunk_vectors"
+
+
+def encode_float32(vector: Union[List[float], np.ndarray]) -> Binary:
+    """Pack a vector as a float32 BSON vector."""
+    return Binary.from_vector(np.asarray(vector, dtype=np.float32).tolist(), BinaryVectorDtype.FLOAT32)
+
+
+def quantize_int8(vector: Union[List[float], np.ndarray]):
+    """Affine int8 quantization: x ~= q * scale + offset, q in [-127, 127]."""
+    vector = np.asarray(vector, dtype=np.float32)
+    low, high = float(vector.min()), float(vector.max())
+    offset = (high + low) / 2
+    scale = (high - low) / 254 or 1.0
+    quantized = np.clip(np.rint((vector - offset) / scale), -127, 127).astype(np.int8)
+    return quantized, scale, offset
+
+
+def encode_embedding(vector: Union[List[float], np.ndarray], storage_format: str) -> Dict[str, Any]:
+    """Fields to store on a kb_chunks document for an embedding."""
+    if storage_format == "array":
+        return {"embedding": [float(x) for x in vector]}
+    if storage_format == "float32":
+        return {"embedding": encode_float32(vector)}
+    if storage_format == "int8":
+        quantized, scale, offset = quantize_int8(vector)
+        return {
+            "embedding": Binary.from_vector(quantized.tolist(), BinaryVectorDtype.INT8),
+            "embeddingScale": scale,
+            "embeddingOffset": offset
+        }
+    raise ValueError(f"Unknown embedding storage format: {storage_format}")
+
+
+def _as_vector(embedding: bytes):
+    """Unpack a BSON vector (BinData subtype 9)."""
+    if not isinstance(embedding, Binary):
+        embedding = Binary(embedding, subtype=9)
+    return embedding.as_vector()
+
+
+def decode_embedding(doc: Dict[str, Any]) -> Optional[np.ndarray]:
+    """Decode the ``embedding`` field of a chunk document to float32, whatever its format."""
+    embedding = doc.get("embedding")
+    if embedding is None or len(embedding) == 0:
+        return None
+    if isinstance(embedding, list):
+        return np.asarray(embedding, dtype=np.float32)
+    
+    vector = _as_vector(embedding)
+    values = np.asarray(vector.data, dtype=np.float32)
+    if vector.dtype == BinaryVectorDtype.INT8:
+        values = values * doc.get("embeddingScale", 1.0) + doc.get("embeddingOffset", 0.0)
+    return values
+
+
+def storage_format_of(doc: Dict[str, Any]) -> Optional[str]:
+    """Detect the storage format of a chunk document's embedding."""
+    embedding = doc.get("embedding")
+    if embedding is None or len(embedding) == 0:
+        return None
+    if isinstance(embedding, list):
+        return "array"
+    return "int8" if _as_vector(embedding).dtype == BinaryVectorDtype.INT8 else "float32"
+
+
+# Fields needed to decode an embedding in any format
+EMBEDDING_FIELDS = {"embedding": 1, "embeddingScale": 1, "embeddingOffset": 1}
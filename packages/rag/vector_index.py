@@ -0,0 +1,437 @@
+"""Process-resident vector index for KB chunks."""
+from typing import List, Dict, Any, Optional, Iterable, Callable
+from abc import ABC, abstractmethod
+import asyncio
+import time
+from pathlib import Path
+import numpy as np
+from bson import ObjectId
+import sys
+
+# Add apps/api to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from config import settings
+from .vector_codec import EMBEDDING_FIELDS, decode_embedding
+from .dedup import CANONICAL_FILTER
+from .versioning import get_kb_version
+
+
+# Fields needed to build the index (text is hydrated from MongoDB for the top-k only)
+INDEX_PROJECTION = {"_id": 1, "docId": 1, "chunkIndex": 1, "metadata": 1, **EMBEDDING_FIELDS}
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows of a matrix in place (zero rows are left as zero)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return positions of the k highest scores, best first."""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class VectorIndex(ABC):
+    """Base class for process-resident chunk indexes.
+    
+    Subclasses implement the vector storage (``add``, ``remove``, ``search``,
+    ``ids``); this class keeps them in sync with a MongoDB collection and
+    optionally persists them to ``path``.
+    """
+    
+    # Whether the index can start from (and remap) the shared embedding snapshot
+    maps_snapshot = False
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock: Optional[asyncio.Lock] = None
+        self.clear()
+    
+    def clear(self):
+        """Drop all vectors and sync state."""
+        self.loaded = False
+        self.last_refresh = 0.0
+        self.kb_version: Optional[int] = None  # KB version the contents are synced to
+        self._skipped: set = set()  # chunks stored without an embedding
+        self._reset()
+    
+    @abstractmethod
+    def _reset(self):
+        """Drop the stored vectors."""
+    
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+    
+    @abstractmethod
+    def __contains__(self, chunk_id: str) -> bool:
+        ...
+    
+    @abstractmethod
+    def ids(self) -> List[str]:
+        """Return the ids of all indexed chunks."""
+    
+    @abstractmethod
+    def add(self, ids: List[str], vectors: np.ndarray, metadata: Optional[List[Dict[str, Any]]] = None):
+        """Add (or replace) vectors with their side-table metadata."""
+    
+    @abstractmethod
+    def remove(self, ids: Iterable[str]) -> int:
+        """Remove vectors by chunk id. Returns the number removed."""
+    
+    @abstractmethod
+    def search(self, query_vector: List[float], k: int, allowed_ids: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Return the top-k entries by cosine similarity, best first."""
+    
+    def _prepare_save(self) -> Optional[Callable[[str], None]]:
+        """Copy the contents for saving; returns a writer taking the path (None if unsupported)."""
+        return None
+    
+    def save(self, path: str) -> bool:
+        """Persist the index to disk. Returns False if the index type doesn't support it."""
+        write = self._prepare_save()
+        if write is None:
+            return False
+        write(path)
+        return True
+    
+    def read(self, path: str) -> bool:
+        """Replace the contents with a persisted copy. Returns False if there is none."""
+        return False
+    
+    def exists(self) -> bool:
+        """Whether a persisted copy is available at ``path``."""
+        return bool(self.path) and Path(self.path).exists()
+    
+    async def ensure_fresh(self, collection, max_age: float, expected_dim: Optional[int] = None):
+        """Load on first use (or on a dimension change), then refresh when older than ``max_age`` seconds."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.loaded or (expected_dim and self.dim and self.dim != expected_dim):
+                # First use, or stored embeddings were migrated to another dimensionality
+                await self.load(collection, expected_dim=expected_dim)
+            elif time.monotonic() - self.last_refresh > max_age:
+                await self.refresh(collection)
+    
+    async def load(self, collection, batch_size: int = 1000, expected_dim: Optional[int] = None):
+        """Load the index, from disk if persisted, otherwise from the collection."""
+        self.clear()
+        if self.exists():
+            try:
+                if not self.read(self.path):
+                    raise ValueError("index type does not support persistence")
+                if expected_dim and self.dim and self.dim != expected_dim:
+                    raise ValueError(f"persisted dimension {self.dim} != {expected_dim}")
+                self.loaded = True
+                print(f"Loaded {len(self)} chunks into vector index from {self.path}")
+                # Catch up with anything ingested since the index was saved
+                return await self.refresh(collection, batch_size)
+            except Exception as e:
+                print(f"Error reading vector index from {self.path}: {e}, rebuilding")
+                self.clear()
+        
+        if self._map_snapshot(expected_dim):
+            if self.kb_version == await get_kb_version():
+                self.last_refresh = time.monotonic()
+                return
+            # Catch up with changes made after the snapshot was written
+            return await self.refresh(collection, batch_size)
+        
+        self.kb_version = await get_kb_version()
+        await self._fetch(collection, CANONICAL_FILTER, batch_size)
+        self.loaded = True
+        self.last_refresh = time.monotonic()
+        print(f"Loaded {len(self)} chunks into vector index")
+        if self.path:
+            await self.persist()
+    
+    def _map_snapshot(self, expected_dim: Optional[int] = None) -> bool:
+        """Take the contents from the shared snapshot, if there is a usable one."""
+        if not self.maps_snapshot or not settings.vector_snapshot_path:
+            return False
+        from .snapshot import open_snapshot
+        try:
+            snapshot = open_snapshot(settings.vector_snapshot_path)
+        except Exception as e:
+            print(f"Error opening KB snapshot: {e}")
+            return False
+        if snapshot is None or snapshot["model"] != settings.embedding_model:
+            return False
+        if expected_dim and snapshot["dim"] != expected_dim:
+            return False
+        
+        self.clear()
+        if not self._adopt_snapshot(snapshot):
+            return False
+        self.kb_version = snapshot["version"]
+        self.loaded = True
+        print(f"Mapped {len(self)} chunks into vector index from snapshot v{snapshot['version']}")
+        return True
+    
+    def _adopt_snapshot(self, snapshot: Dict[str, Any]) -> bool:
+        """Use a snapshot's ids, metadata and memory-mapped matrix as the index contents."""
+        return False
+    
+    async def persist(self):
+        """Save to ``path`` if configured, logging instead of raising.
+        
+        The contents are copied on the event loop and written from a worker thread.
+        """
+        if not self.path:
+            return
+        try:
+            write = self._prepare_save()
+            if write is not None:
+                await asyncio.to_thread(write, self.path)
+        except Exception as e:
+            print(f"Error saving vector index to {self.path}: {e}")
+    
+    async def refresh(self, collection, batch_size: int = 1000):
+        """Incrementally sync with a collection: fetch new chunks, drop deleted ones."""
+        if not self.loaded:
+            return await self.load(collection, batch_size)
+        
+        if self.maps_snapshot and settings.vector_snapshot_path:
+            from .snapshot import read_manifest
+            manifest = read_manifest(settings.vector_snapshot_path)
+            if manifest is not None and self.kb_version is not None and manifest["version"] > self.kb_version:
+                # Another process wrote a newer snapshot: remap it instead of fetching the changes
+                return await self.load(collection, batch_size, expected_dim=self.dim)
+        
+        version = await get_kb_version()
+        if version == self.kb_version:
+            # Every KB write bumps the version: nothing changed since the last sync
+            self.last_refresh = time.monotonic()
+            return
+        
+        # Linked near-duplicates have no embedding; they're only fetched once promoted
+        current = set()
+        async for doc in collection.find(CANONICAL_FILTER, {"_id": 1}):
+            current.add(str(doc["_id"]))
+        
+        removed = self.remove([chunk_id for chunk_id in self.ids() if chunk_id not in current])
+        self._skipped &= current
+        missing = [chunk_id for chunk_id in current if chunk_id not in self and chunk_id not in self._skipped]
+        added = 0
+        if missing:
+            for i in range(0, len(missing), batch_size):
+                batch = [ObjectId(chunk_id) for chunk_id in missing[i:i + batch_size]]
+                added += await self._fetch(collection, {"_id": {"$in": batch}}, batch_size)
+        
+        self.kb_version = version
+        self.last_refresh = time.monotonic()
+        if added or removed:
+            print(f"Vector index refreshed: +{added} -{removed} ({len(self)} chunks)")
+            await self.persist()
+    
+    async def _fetch(self, collection, query: Dict, batch_size: int) -> int:
+        """Stream matching chunks into the index in batches."""
+        total = 0
+        ids, vectors, metadata = [], [], []
+        async for doc in collection.find(query, INDEX_PROJECTION):
+            embedding = decode_embedding(doc)
+            if embedding is None:
+                self._skipped.add(str(doc["_id"]))
+                continue
+            ids.append(str(doc["_id"]))
+            vectors.append(embedding)
+            metadata.append(chunk_metadata(doc))
+            if len(ids) >= batch_size:
+                self.add(ids, np.asarray(vectors, dtype=np.float32), metadata)
+                total += len(ids)
+                ids, vectors, metadata = [], [], []
+        if ids:
+            self.add(ids, np.asarray(vectors, dtype=np.float32), metadata)
+            total += len(ids)
+        return total
+    
+    def add_chunks(self, chunks: List[Dict[str, Any]]):
+        """Add freshly inserted chunk documents (no-op until the index is loaded)."""
+        if not self.loaded:
+            return
+        chunks = [c for c in chunks if "_id" in c]
+        vectors = [decode_embedding(c) for c in chunks]
+        keep = [i for i, v in enumerate(vectors) if v is not None]
+        if keep:
+            self.add(
+                [str(chunks[i]["_id"]) for i in keep],
+                np.stack([vectors[i] for i in keep]),
+                [chunk_metadata(chunks[i]) for i in keep]
+            )
+
+
+class FlatVectorIndex(VectorIndex):
+    """Exact cosine index over a contiguous, pre-normalized float32 matrix.
+
+    Rows are kept packed in ``[0, size)``; removals swap the last row into the
+    freed slot so a search is always a single matrix-vector product.
+    Loaded from a snapshot, the matrix is a copy-on-write memory map shared
+    with other workers until this process adds or removes rows.
+    """
+    
+    maps_snapshot = True
+    
+    def __init__(self, initial_capacity: int = 1024, path: Optional[str] = None):
+        self.initial_capacity = initial_capacity
+        super().__init__(path)
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._row_by_id
+    
+    def ids(self) -> List[str]:
+        """Return the ids of all indexed chunks."""
+        return list(self._ids)
+    
+    def _reserve(self, extra: int):
+        """Grow the backing matrix so it can hold ``extra`` more rows."""
+        needed = self.size + extra
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(self.initial_capacity, capacity)
+        while new_capacity < needed:
+            new_capacity *= 2
+        matrix = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        if self._matrix is not None and self.size:
+            matrix[:self.size] = self._matrix[:self.size]
+        self._matrix = matrix
+    
+    def add(self, ids: List[str], vectors: np.ndarray, metadata: Optional[List[Dict[str, Any]]] = None):
+        """Add (or replace) vectors with their side-table metadata."""
+        if not ids:
+            return
+        vectors = normalize_rows(np.array(vectors, dtype=np.float32, ndmin=2))
+        metadata = metadata or [{} for _ in ids]
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+        
+        # Replace existing rows in place, append the rest
+        new_rows = []
+        for i, chunk_id in enumerate(ids):
+            row = self._row_by_id.get(chunk_id)
+            if row is None:
+                new_rows.append(i)
+            else:
+                self._matrix[row] = vectors[i]
+                self._meta[row] = metadata[i]
+        
+        if new_rows:
+            self._reserve(len(new_rows))
+            start = self.size
+            self._matrix[start:start + len(new_rows)] = vectors[new_rows]
+            for offset, i in enumerate(new_rows):
+                self._ids.append(ids[i])
+                self._meta.append(metadata[i])
+                self._row_by_id[ids[i]] = start + offset
+            self.size += len(new_rows)
+    
+    def remove(self, ids: Iterable[str]) -> int:
+        """Remove vectors by chunk id. Returns the number removed."""
+        removed = 0
+        for chunk_id in ids:
+            row = self._row_by_id.pop(chunk_id, None)
+            if row is None:
+                continue
+            last = self.size - 1
+            if row != last:
+                # Move the last row into the freed slot to keep the matrix packed
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = self._ids[last]
+                self._meta[row] = self._meta[last]
+                self._row_by_id[self._ids[row]] = row
+            self._ids.pop()
+            self._meta.pop()
+            self.size -= 1
+            removed += 1
+        return removed
+    
+    def _reset(self):
+        self.dim: Optional[int] = None
+        self.size = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._meta: List[Dict[str, Any]] = []
+        self._row_by_id: Dict[str, int] = {}
+    
+    def _adopt_snapshot(self, snapshot: Dict[str, Any]) -> bool:
+        self.dim = snapshot["dim"]
+        self._matrix = snapshot["matrix"]  # full: the first add() copies it into private memory
+        self._ids = list(snapshot["ids"])
+        self._meta = snapshot["meta"]
+        self._row_by_id = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self.size = len(self._ids)
+        return True
+    
+    def rows_for(self, ids: Iterable[str]) -> np.ndarray:
+        """Map chunk ids to matrix rows (unknown ids are ignored)."""
+        return np.array([self._row_by_id[i] for i in ids if i in self._row_by_id], dtype=np.int64)
+    
+    def search(self, query_vector: List[float], k: int, allowed_ids: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Return the top-k entries by cosine similarity, best first."""
+        if self.size == 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+        
+        if allowed_ids is None:
+            scores = self._matrix[:self.size] @ query
+            rows = top_k(scores, k)
+            row_scores = scores[rows]
+        else:
+            candidate_rows = self.rows_for(allowed_ids)
+            scores = self._matrix[candidate_rows] @ query
+            best = top_k(scores, k)
+            rows = candidate_rows[best]
+            row_scores = scores[best]
+        
+        return [
+            {"id": self._ids[row], **self._meta[row], "score": float(score)}
+            for row, score in zip(rows, row_scores)
+        ]
+    
+
+def chunk_metadata(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Side-table entry kept for each indexed chunk."""
+    return {
+        "docId": str(doc["docId"]),
+        "chunkIndex": doc.get("chunkIndex", 0),
+        "metadata": doc.get("metadata", {})
+    }
+
+
+# Global index instance (one per process)
+_vector_index: Optional[VectorIndex] = None
+
+
+def get_vector_index() -> VectorIndex:
+    """Get the process-wide vector index for the configured backend."""
+    global _vector_index
+    if _vector_index is None:
+        if settings.vector_backend == "ivf":
+            from .ann import IVFFlatIndex
+            _vector_index = IVFFlatIndex(
+                nlist=settings.ivf_nlist,
+                nprobe=settings.ivf_nprobe,
+                path=settings.vector_index_path
+            )
+        else:
+            _vector_index = FlatVectorIndex()
+    return _vector_index
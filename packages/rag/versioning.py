@@ -0,0 +1,47 @@
+"""KB version stamp used to invalidate caches and snapshots after ingestion."""
+from datetime import datetime
+import sys
+import time
+from pathlib import Path
+
+# Add apps/api to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "apps" / "api"))
+
+from db import get_database
+from config import settings
+from pymongo import ReturnDocument
+
+
+KB_VERSION_ID = "kb_version"
+
+# Last version seen by this process and when it was read
+_cached_version = None
+_cached_at = 0.0
+
+
+async def get_kb_version() -> int:
+    """Get the current KB version (re-read at most every kb_version_check_seconds)."""
+    global _cached_version, _cached_at
+    if _cached_version is not None and time.monotonic() - _cached_at < settings.kb_version_check_seconds:
+        return _cached_version
+    
+    database = await get_database()
+    doc = await database.kb_meta.find_one({"_id": KB_VERSION_ID})
+    _cached_version = doc["version"] if doc else 0
+    _cached_at = time.monotonic()
+    return _cached_version
+
+
+async def bump_kb_version() -> int:
+    """Increment the KB version after the KB content changed."""
+    global _cached_version, _cached_at
+    database = await get_database()
+    doc = await database.kb_meta.find_one_and_update(
+        {"_id": KB_VERSION_ID},
+        {"$inc": {"version": 1}, "$set": {"updatedAt": datetime.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    _cached_version = doc["version"]
+    _cached_at = time.monotonic()
+    return _cached_version
@@ -0,0 +1,91 @@
+"""Shared test setup: import paths, settings defaults and an async MongoDB stand-in."""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "apps" / "api"))
+
+# Settings are read at import time; tests never reach these services
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: long-running checks (deselect with -m \"not slow\")")
+
+
+class AsyncCursor:
+    """Async iteration over a mongomock cursor (the subset of motor's cursor the code uses)."""
+    
+    def __init__(self, cursor):
+        self._cursor = cursor
+    
+    def batch_size(self, size: int):
+        return self
+    
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+    
+    def limit(self, count: int):
+        self._cursor = self._cursor.limit(count)
+        return self
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        try:
+            return next(self._cursor)
+        except StopIteration:
+            raise StopAsyncIteration
+    
+    async def to_list(self, length=None):
+        return list(self._cursor)
+
+
+class AsyncCollection:
+    """motor-style collection over a mongomock one: every method is awaitable except find."""
+    
+    def __init__(self, collection):
+        self._collection = collection
+    
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+    
+    def aggregate(self, *args, **kwargs):
+        return AsyncCursor(self._collection.aggregate(*args, **kwargs))
+    
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+        
+        async def call(*args, **kwargs):
+            kwargs.pop("session", None)
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncDatabase:
+    """motor-style database over a mongomock one."""
+    
+    def __init__(self, database):
+        self._database = database
+    
+    def __getitem__(self, name: str) -> AsyncCollection:
+        return AsyncCollection(self._database[name])
+    
+    def __getattr__(self, name: str) -> AsyncCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+@pytest.fixture
+def mock_db():
+    """An empty in-memory database with motor's async interface."""
+    mongomock = pytest.importorskip("mongomock")
+    return AsyncDatabase(mongomock.MongoClient().db)
@@ -0,0 +1,55 @@
+"""Audit spill files: which leftovers a starting sink adopts."""
+import os
+import socket
+
+import pytest
+
+import packages.orchestrator.audit as audit
+from packages.orchestrator.audit import AuditSink
+
+HOST = socket.gethostname()
+DEAD, ALIVE = 999001, 999002
+
+
+@pytest.fixture
+def sink(tmp_path, monkeypatch):
+    monkeypatch.setattr(audit, "_process_alive", lambda pid: pid != DEAD)
+    return AuditSink(overflow="spill", spill_path=str(tmp_path / "audit_spill.jsonl"))
+
+
+def write(path, *events):
+    path.write_text("".join(f'{{"event": "{event}"}}\n' for event in events), encoding="utf-8")
+
+
+def test_adopts_dead_processes_and_interrupted_claims(sink, tmp_path):
+    write(tmp_path / "audit_spill.jsonl", "legacy shared")
+    write(tmp_path / f"audit_spill.{DEAD}.jsonl", "legacy pid")
+    write(tmp_path / f"audit_spill.{HOST}-{DEAD}.jsonl", "dead")
+    write(tmp_path / f"audit_spill.{HOST}-{DEAD}.jsonl.adopting", "claimed by a dead adopter")
+    write(tmp_path / f"audit_spill.{HOST}-{DEAD}.jsonl.remaining", "partial copy")
+    write(tmp_path / f"audit_spill.{HOST}-{ALIVE}.jsonl", "alive")
+    write(tmp_path / f"audit_spill.other-host-{DEAD}.jsonl", "other host")
+    
+    sink._adopt_spills()
+    
+    adopted = (tmp_path / f"audit_spill.{HOST}-{os.getpid()}.jsonl").read_text(encoding="utf-8")
+    for event in ("legacy shared", "legacy pid", "dead", "claimed by a dead adopter"):
+        assert event in adopted
+    for event in ("partial copy", "alive", "other host"):
+        assert event not in adopted
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([
+        f"audit_spill.{HOST}-{os.getpid()}.jsonl",
+        f"audit_spill.{HOST}-{ALIVE}.jsonl",
+        f"audit_spill.other-host-{DEAD}.jsonl",
+    ])
+
+
+def test_claim_left_by_a_previous_run_with_our_pid(sink, tmp_path):
+    own = tmp_path / f"audit_spill.{HOST}-{os.getpid()}.jsonl"
+    write(own, "ours")
+    write(tmp_path / f"{own.name}.adopting", "left mid-adoption")
+    
+    sink._adopt_spills()
+    
+    assert own.read_text(encoding="utf-8").splitlines() == ['{"event": "ours"}', '{"event": "left mid-adoption"}']
+    assert [p.name for p in tmp_path.iterdir()] == [own.name]
@@ -0,0 +1,58 @@
+"""In-memory LRU cache: eviction order and TTL expiry."""
+import pytest
+
+import packages.rag.cache as cache_module
+from packages.rag.cache import LRUCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = LRUCache(max_size=10, ttl_seconds=60)
+    cache.set("a", 1)
+    clock.now += 59
+    assert cache.get("a") == 1
+    clock.now += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0  # expired entries are dropped on access
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_set_refreshes_ttl(clock):
+    cache = LRUCache(ttl_seconds=60)
+    cache.set("a", 1)
+    clock.now += 50
+    cache.set("a", 2)
+    clock.now += 50
+    assert cache.get("a") == 2
+
+
+def test_no_ttl_never_expires(clock):
+    cache = LRUCache()
+    cache.set("a", 1)
+    clock.now += 10 ** 9
+    assert cache.get("a") == 1
@@ -0,0 +1,67 @@
+"""chunk_text output on fixed inputs: chunk sizes, break points and overlap."""
+import pytest
+
+from packages.rag.benchmarks import synthetic_document
+from packages.rag.chunkers import chunk_text, get_encoding
+
+PARAGRAPHS = [
+    "To reset your password, open the self-service portal and choose Forgot password.",
+    "Enter the verification code sent to your registered phone, then pick a new password.",
+    "Passwords must be at least 14 characters and cannot reuse any of the last 10.",
+]
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text))
+
+
+def test_empty_text_has_no_chunks():
+    assert chunk_text("") == []
+
+
+def test_short_text_is_one_chunk():
+    text = "\n\n".join(PARAGRAPHS)
+    assert chunk_text(text + "\n") == [{"text": text, "tokens": count_tokens(text + "\n")}]
+
+
+def test_cut_at_last_paragraph_break():
+    text = "\n\n".join(PARAGRAPHS)
+    chunks = chunk_text(text, chunk_size=count_tokens(text) - 2, chunk_overlap=5)
+    
+    assert [c["text"] for c in chunks][0] == "\n\n".join(PARAGRAPHS[:2])
+    assert len(chunks) == 2
+    assert chunks[1]["text"].endswith(PARAGRAPHS[2])
+    # The second chunk repeats the tail of the first
+    assert len(chunks[1]["text"]) > len(PARAGRAPHS[2])
+    assert PARAGRAPHS[1].endswith(chunks[1]["text"][:-len(PARAGRAPHS[2])].strip())
+
+
+def test_cut_at_sentence_end_without_paragraph_breaks():
+    text = " ".join(PARAGRAPHS * 4)
+    chunks = chunk_text(text, chunk_size=count_tokens(PARAGRAPHS[0]) * 3, chunk_overlap=0)
+    
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk["text"].endswith(".")
+    assert " ".join(c["text"] for c in chunks) == text
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(500, 50), (128, 16), (64, 0)])
+def test_chunks_respect_size_and_overlap(chunk_size, chunk_overlap):
+    text = synthetic_document(0.05)
+    chunks = chunk_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    
+    assert all(0 < c["tokens"] <= chunk_size for c in chunks)
+    # Natural breaks only: never below half size except for the final chunk
+    assert all(c["tokens"] >= chunk_size // 2 for c in chunks[:-1])
+    assert chunks[-1]["text"] == text[-len(chunks[-1]["text"]):]
+    if chunk_overlap:
+        # Each chunk starts inside the tail of the one before
+        for previous, chunk in zip(chunks, chunks[1:]):
+            assert chunk["text"][:10] in previous["text"][-10 * chunk_overlap:]
+    else:
+        # Without overlap the chunks partition the text
+        assert "".join("".join(c["text"].split()) for c in chunks) == "".join(text.split())
+    
+    # Output is deterministic
+    assert chunk_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap) == chunks
@@ -0,0 +1,63 @@
+"""Context packing: adjacent-chunk merging and the token budget."""
+from packages.rag.context import ContextPacker, count_tokens, merge_adjacent, text_overlap
+
+
+def chunk(chunk_id, doc_id, index, text):
+    return {"id": chunk_id, "docId": doc_id, "chunkIndex": index, "text": text}
+
+
+def test_text_overlap():
+    assert text_overlap("alpha beta gamma delta epsilon", "gamma delta epsilon zeta eta theta") == len("gamma delta epsilon")
+    assert text_overlap("alpha beta gamma delta", "unrelated text that is long") == 0
+    assert text_overlap("short", "short") == 0  # below min_chars
+
+
+def test_merge_adjacent_joins_consecutive_chunks_without_overlap():
+    first = "Restart the VPN client. Then sign in again with your badge."
+    second = "sign in again with your badge. If it still fails, open a ticket."
+    passages = merge_adjacent([chunk("c2", "d", 2, second), chunk("c1", "d", 1, first)])
+    assert len(passages) == 1
+    passage = passages[0]
+    assert passage["ids"] == ["c1", "c2"]
+    assert passage["chunkIndex"] == 1
+    assert passage["text"] == "Restart the VPN client. Then sign in again with your badge. If it still fails, open a ticket."
+    assert passage["saved_chars"] == len("sign in again with your badge.")
+
+
+def test_merge_adjacent_keeps_gaps_and_documents_apart_in_rank_order():
+    chunks = [
+        chunk("x5", "x", 5, "fifth chunk of x"),
+        chunk("y1", "y", 1, "first chunk of y"),
+        chunk("x3", "x", 3, "third chunk of x"),
+        chunk("y2", "y", 2, "second chunk of y"),
+    ]
+    passages = merge_adjacent(chunks)
+    assert [p["ids"] for p in passages] == [["x5"], ["y1", "y2"], ["x3"]]
+    # No overlap between y1 and y2: joined on a newline
+    assert passages[1]["text"] == "first chunk of y\nsecond chunk of y"
+
+
+def test_packer_fits_everything_under_budget():
+    packer = ContextPacker(budget_tokens=10_000)
+    packed = packer.pack([chunk("a", "d1", 0, "one"), chunk("b", "d2", 0, "two")])
+    assert [s["ids"] for s in packed["snippets"]] == [["a"], ["b"]]
+    assert packed["dropped"] == 0
+    assert packed["tokens"] == sum(count_tokens(t) for t in ("one", "two")) + 2 * 8
+
+
+def test_packer_trims_then_drops():
+    sentence = "This sentence is about printers. "
+    text = sentence * 40
+    long_tokens = count_tokens(text)
+    budget = long_tokens + 8 + long_tokens // 2
+    # Trimming back to a sentence end leaves less than this for the third passage
+    packer = ContextPacker(budget_tokens=budget, min_snippet_tokens=3 * count_tokens(sentence))
+    packed = packer.pack([chunk(c, c, 0, text) for c in ("a", "b", "c")])
+    snippets = packed["snippets"]
+    assert [s["ids"] for s in snippets] == [["a"], ["b"]]
+    assert "trimmed" not in snippets[0]
+    assert snippets[1]["trimmed"] and snippets[1]["text"].endswith(".")
+    assert packed["dropped"] == 1
+    assert packed["tokens"] <= budget
+    stats = packer.stats()
+    assert stats["trimmed"] == 1 and stats["dropped"] == 1 and stats["requests"] == 1
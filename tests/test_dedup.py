@@ -0,0 +1,68 @@
+"""Near-duplicate index: signatures, wordless chunks and loading legacy chunks."""
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+import packages.rag.ingestion as ingestion
+import packages.rag.versioning as versioning
+from packages.rag.dedup import MinHashLSH
+
+ARTICLE = "To connect to the VPN open the client, choose the nearest gateway and sign in with your company account."
+
+
+@pytest.fixture
+def db(mock_db, monkeypatch):
+    async def get_database():
+        return mock_db
+    
+    monkeypatch.setattr(versioning, "get_database", get_database)
+    monkeypatch.setattr(versioning, "_cached_version", None)
+    return mock_db
+
+
+def test_wordless_text_has_no_signature():
+    index = MinHashLSH()
+    assert index.signature("---- | ---- | ----") is None
+    assert index.signature(ARTICLE).shape == (index.num_perm,)
+
+
+def test_wordless_chunks_are_never_duplicates(db, monkeypatch):
+    index = MinHashLSH()
+    monkeypatch.setattr(ingestion, "get_dedup_index", lambda: index)
+    monkeypatch.setattr(ingestion.settings, "dedup_mode", "link")
+    doc_id = ObjectId()
+    chunks = [
+        {"_id": ObjectId(), "docId": doc_id, "chunkIndex": i, "text": text}
+        for i, text in enumerate([ARTICLE, "| --- | --- |", ARTICLE, "| --- | --- |"])
+    ]
+    
+    kept = asyncio.run(ingestion._mark_duplicates(db, chunks))
+    
+    assert len(kept) == 4
+    assert "minhash" in kept[0] and "duplicateOf" not in kept[0]
+    assert kept[2]["duplicateOf"] == kept[0]["_id"]
+    for chunk in (kept[1], kept[3]):
+        assert "minhash" not in chunk and "duplicateOf" not in chunk
+    assert (index.checked, index.duplicates, len(index)) == (2, 1, 1)
+
+
+def test_load_signs_legacy_chunks_and_skips_wordless(db):
+    index = MinHashLSH()
+    signed, legacy, wordless = ObjectId(), ObjectId(), ObjectId()
+    
+    async def scenario():
+        await db.kb_chunks.insert_many([
+            {"_id": signed, "docId": ObjectId(), "text": ARTICLE, "minhash": index.signature(ARTICLE).tobytes()},
+            {"_id": legacy, "docId": ObjectId(), "text": ARTICLE + " Then check the tray icon."},
+            {"_id": wordless, "docId": ObjectId(), "text": "* * *"},
+        ])
+        await index.load(db.kb_chunks, batch_size=2)
+        await versioning.bump_kb_version()
+        await index.refresh(db.kb_chunks)
+    
+    asyncio.run(scenario())
+    assert str(signed) in index and str(legacy) in index
+    assert str(wordless) not in index
+    assert len(index) == 2
+    assert index.query(index.signature(ARTICLE))[0] == str(signed)
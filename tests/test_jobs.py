@@ -0,0 +1,88 @@
+"""Ingest job claims: a runner whose job was taken over stops writing."""
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+import packages.rag.jobs as jobs
+
+
+@pytest.fixture
+def db(mock_db, monkeypatch):
+    async def get_database():
+        return mock_db
+    
+    monkeypatch.setattr(jobs, "get_database", get_database)
+    asyncio.run(mock_db.ingest_job_files.create_index([("jobId", 1), ("source", 1)], unique=True))
+    return mock_db
+
+
+def runner(worker_id: str) -> jobs.IngestJobRunner:
+    job_runner = jobs.IngestJobRunner(heartbeat_seconds=0)
+    job_runner.worker_id = worker_id
+    return job_runner
+
+
+async def take_over(db, job_id: ObjectId, worker_id: str = "other:2"):
+    """What happens elsewhere while the first worker stalls: requeue, then a new claim."""
+    await db.ingest_jobs.update_one({"_id": job_id}, {"$set": {"status": "queued"}})
+    return await runner(worker_id)._claim()
+
+
+def test_claim_records_worker_and_attempt(db):
+    async def scenario():
+        job_id = ObjectId(await runner("first:1").submit("/kb"))
+        job = await runner("first:1")._claim()
+        again = await take_over(db, job_id)
+        return job, again
+    
+    job, again = asyncio.run(scenario())
+    assert (job["claimedBy"], job["attempts"]) == ("first:1", 1)
+    assert (again["claimedBy"], again["attempts"]) == ("other:2", 2)
+
+
+def test_heartbeat_stops_after_takeover(db):
+    async def scenario():
+        first = runner("first:1")
+        job_id = ObjectId(await first.submit("/kb"))
+        job = await first._claim()
+        new = await take_over(db, job_id)
+        cancelled, lost = asyncio.Event(), asyncio.Event()
+        await asyncio.wait_for(first._heartbeat(job, cancelled, lost), timeout=5)
+        return new, cancelled, lost, await db.ingest_jobs.find_one({"_id": job_id})
+    
+    new, cancelled, lost, stored = asyncio.run(scenario())
+    assert lost.is_set() and cancelled.is_set()
+    assert stored["heartbeatAt"] == new["heartbeatAt"]
+
+
+def test_superseded_run_does_not_overwrite_progress(db, monkeypatch):
+    first = runner("first:1")
+    job_id = ObjectId(asyncio.run(first.submit("/kb")))
+    
+    async def sync_directory(directory, on_file=None, cancelled=None):
+        await on_file("a.md", "added", chunks=3)
+        # The worker stalls; its job is requeued and resumed elsewhere
+        job = await take_over(db, job_id)
+        await db.ingest_job_files.update_one(
+            {"jobId": job_id, "source": "b.md"},
+            {"$set": {"status": "updated", "chunks": 5, "attempt": job["attempts"]}},
+            upsert=True
+        )
+        await on_file("b.md", "failed", error="stale")
+        assert cancelled.is_set()
+        return {"added": ["a.md"], "updated": [], "cancelled": cancelled.is_set()}
+    
+    monkeypatch.setattr(jobs, "sync_directory", sync_directory)
+    monkeypatch.setattr(jobs, "source_files", lambda directory: [])
+    
+    async def scenario():
+        await first._run(await first._claim())
+        files = {doc["source"]: doc async for doc in db.ingest_job_files.find({"jobId": job_id})}
+        return files, await db.ingest_jobs.find_one({"_id": job_id})
+    
+    files, job = asyncio.run(scenario())
+    assert files["a.md"]["attempt"] == 1
+    assert (files["b.md"]["status"], files["b.md"]["attempt"]) == ("updated", 2)
+    assert (job["status"], job["claimedBy"]) == ("running", "other:2")
+    assert job["finishedAt"] is None
@@ -0,0 +1,69 @@
+"""BM25 lexical index and reciprocal rank fusion."""
+import pytest
+
+from packages.rag.lexical import BM25Index, is_identifier, reciprocal_rank_fusion, tokenize
+
+
+@pytest.fixture
+def index():
+    index = BM25Index()
+    index.add("vpn", "The VPN client disconnects when the laptop sleeps", {"docId": "d1"})
+    index.add("printer", "Printer shows error 0x80070005 after the driver update", {"docId": "d2"})
+    index.add("password", "Reset your password from the self-service portal", {"docId": "d3"})
+    index.add("ticket", "Ticket INC0012345 tracks the printer outage on floor 3", {"docId": "d4"})
+    return index
+
+
+def test_tokenize_keeps_identifiers_whole():
+    assert tokenize("Error 0x80070005 on IT-123, see INC0012345.") == ["error", "0x80070005", "it-123", "see", "inc0012345"]
+    assert is_identifier("0x80070005")
+    assert not is_identifier("printer")
+
+
+def test_search_ranks_matching_chunk_first(index):
+    results = index.search("vpn disconnects", k=2)
+    assert results[0]["id"] == "vpn"
+    assert results[0]["docId"] == "d1"
+    assert results[0]["matchedTerms"] == ["disconnects", "vpn"]
+    assert len(results) == 1  # nothing else shares a term
+
+
+def test_rarer_terms_weigh_more(index):
+    # "printer" appears in two chunks, the error code in one
+    results = index.search("printer 0x80070005", k=4)
+    assert [r["id"] for r in results] == ["printer", "ticket"]
+    assert results[0]["score"] > results[1]["score"]
+
+
+def test_allowed_ids_filter(index):
+    results = index.search("printer", k=4, allowed_ids=["ticket"])
+    assert [r["id"] for r in results] == ["ticket"]
+
+
+def test_remove_and_readd(index):
+    assert index.remove(["printer", "missing"]) == 1
+    assert "printer" not in index
+    assert [r["id"] for r in index.search("0x80070005", k=4)] == []
+    index.add("ticket", "VPN ticket", {})  # re-adding replaces the old text
+    assert len(index) == 3
+    assert index.search("outage", k=4) == []
+    assert {r["id"] for r in index.search("vpn", k=4)} == {"vpn", "ticket"}
+
+
+def test_empty_index():
+    assert BM25Index().search("anything", k=3) == []
+
+
+def test_reciprocal_rank_fusion_scores():
+    vector = [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    lexical = [{"id": "b"}, {"id": "d"}]
+    fused = reciprocal_rank_fusion([vector, lexical], k=3, rrf_k=60)
+    assert [r["id"] for r in fused] == ["b", "a", "d"]
+    assert fused[0]["score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[1]["score"] == pytest.approx(1 / 61)
+    assert fused[2]["score"] == pytest.approx(1 / 62)
+
+
+def test_reciprocal_rank_fusion_keeps_first_seen_fields():
+    fused = reciprocal_rank_fusion([[{"id": "a", "src": "vector"}], [{"id": "a", "src": "lexical"}]], k=1)
+    assert fused[0]["src"] == "vector"
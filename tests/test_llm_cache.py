@@ -0,0 +1,105 @@
+"""Chat-model response cache: hits, opt-in sites and coalescing of identical calls."""
+import asyncio
+
+import pytest
+from langchain.schema import AIMessage, HumanMessage
+
+from packages.orchestrator.llm_cache import CachedLLM
+
+
+class FakeLLM:
+    model_name = "fake"
+    temperature = 0
+    
+    def __init__(self, delay: float = 0.05, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+    
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return AIMessage(content=f"answer {self.calls}: {messages[-1].content}")
+
+
+def test_repeat_calls_are_served_from_cache():
+    llm = FakeLLM(delay=0)
+    cached = CachedLLM(llm, sites=["classify"])
+    
+    async def run():
+        first = await cached.ainvoke([HumanMessage(content="vpn")], site="classify")
+        second = await cached.ainvoke([HumanMessage(content="vpn")], site="classify")
+        other = await cached.ainvoke([HumanMessage(content="printer")], site="classify")
+        return first, second, other
+    
+    first, second, other = asyncio.run(run())
+    assert first.content == second.content == "answer 1: vpn"
+    assert other.content == "answer 2: printer"
+    assert llm.calls == 2
+    assert cached.stats()["sites"]["classify"]["hits"] == 1
+
+
+def test_sites_not_opted_in_bypass_the_cache():
+    llm = FakeLLM(delay=0)
+    cached = CachedLLM(llm, sites=["classify"])
+    
+    async def run():
+        for site in (None, "synthesize", None):
+            await cached.ainvoke([HumanMessage(content="vpn")], site=site)
+    
+    asyncio.run(run())
+    assert llm.calls == 3
+    assert cached.stats()["sites"] == {}
+
+
+def test_concurrent_identical_calls_share_one_request():
+    llm = FakeLLM(delay=0.05)
+    cached = CachedLLM(llm, sites=["classify"])
+    
+    async def run():
+        return await asyncio.gather(*[
+            cached.ainvoke([HumanMessage(content="vpn")], site="classify") for _ in range(5)
+        ])
+    
+    responses = asyncio.run(run())
+    assert llm.calls == 1
+    assert {r.content for r in responses} == {"answer 1: vpn"}
+    stats = cached.stats()["sites"]["classify"]
+    assert stats["misses"] == 1 and stats["coalesced"] == 4
+    assert not cached._inflight
+
+
+def test_waiters_see_the_leaders_error_and_nothing_is_cached():
+    llm = FakeLLM(delay=0.05, fail=True)
+    cached = CachedLLM(llm, sites=["classify"])
+    
+    async def run():
+        return await asyncio.gather(*[
+            cached.ainvoke([HumanMessage(content="vpn")], site="classify") for _ in range(3)
+        ], return_exceptions=True)
+    
+    results = asyncio.run(run())
+    assert llm.calls == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(cached._memory) == 0
+
+
+def test_cancelled_leader_lets_a_waiter_retry():
+    llm = FakeLLM(delay=0.05)
+    cached = CachedLLM(llm, sites=["classify"])
+    
+    async def run():
+        leader = asyncio.create_task(cached.ainvoke([HumanMessage(content="vpn")], site="classify"))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(cached.ainvoke([HumanMessage(content="vpn")], site="classify"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await waiter
+    
+    response = asyncio.run(run())
+    assert response.content == "answer 2: vpn"
+    assert llm.calls == 2
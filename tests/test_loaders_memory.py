@@ -0,0 +1,18 @@
+"""Memory ceiling of streaming ingestion: peak RSS growth must not follow file size."""
+import sys
+
+import pytest
+
+from packages.rag.benchmarks import check_memory_ceiling
+
+MAX_GROWTH_MB = 32.0
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="peak RSS reset needs /proc")
+def test_pdf_and_html_ingestion_stay_under_memory_ceiling():
+    rows = check_memory_ceiling(max_growth_mb=MAX_GROWTH_MB, pdf_pages=(100, 800), html_mb=(5, 50))
+    
+    for row in rows:
+        assert row["chunks"] > 0
+        assert row["ok"], f"{row['file']}: RSS grew {row['rss_growth_mb']} MB (ceiling {MAX_GROWTH_MB} MB)"
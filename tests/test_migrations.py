@@ -0,0 +1,87 @@
+"""Embedding storage migration run against an in-memory collection."""
+import asyncio
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+import packages.rag.migrations as migrations
+import packages.rag.versioning as versioning
+from packages.rag.vector_codec import FULL_VECTORS_COLLECTION, decode_embedding, storage_format_of
+
+
+@pytest.fixture
+def db(mock_db, monkeypatch):
+    async def get_database():
+        return mock_db
+    
+    async def update_snapshot():
+        pass
+    
+    monkeypatch.setattr(migrations, "get_database", get_database)
+    monkeypatch.setattr(versioning, "get_database", get_database)
+    monkeypatch.setattr(versioning, "_cached_version", None)
+    monkeypatch.setattr(migrations, "update_snapshot", update_snapshot)
+    return mock_db
+
+
+@pytest.fixture
+def originals(db):
+    rng = np.random.default_rng(0)
+    vectors = {ObjectId(): rng.normal(size=64).astype(np.float32) for _ in range(5)}
+    
+    async def seed():
+        for chunk_id, vector in vectors.items():
+            await db.kb_chunks.insert_one({"_id": chunk_id, "text": "chunk", "embedding": [float(x) for x in vector]})
+        await db.kb_chunks.insert_one({"_id": ObjectId(), "text": "linked duplicate"})
+    
+    asyncio.run(seed())
+    return vectors
+
+
+async def chunks_by_id(db):
+    return {doc["_id"]: doc async for doc in db.kb_chunks.find({})}
+
+
+def test_migrate_to_int8_and_back(db, originals):
+    summary = asyncio.run(migrations.migrate_embedding_storage("int8", batch_size=2))
+    assert summary == {"migrated": 5, "skipped": 1}
+    
+    chunks = asyncio.run(chunks_by_id(db))
+    full = asyncio.run(db[FULL_VECTORS_COLLECTION].count_documents({}))
+    assert full == 5
+    for chunk_id, vector in originals.items():
+        doc = chunks[chunk_id]
+        assert storage_format_of(doc) == "int8"
+        assert np.max(np.abs(decode_embedding(doc) - vector)) <= doc["embeddingScale"] / 2 + 1e-6
+    version = asyncio.run(db.kb_meta.find_one({"_id": versioning.KB_VERSION_ID}))["version"]
+    assert version == 1
+    
+    # Re-running is a no-op
+    assert asyncio.run(migrations.migrate_embedding_storage("int8")) == {"migrated": 0, "skipped": 6}
+    
+    # Converting back restores the exact float32 originals and drops the full-precision copies
+    assert asyncio.run(migrations.migrate_embedding_storage("float32"))["migrated"] == 5
+    chunks = asyncio.run(chunks_by_id(db))
+    for chunk_id, vector in originals.items():
+        doc = chunks[chunk_id]
+        assert storage_format_of(doc) == "float32"
+        assert "embeddingScale" not in doc
+        np.testing.assert_array_equal(decode_embedding(doc), vector)
+    assert asyncio.run(db[FULL_VECTORS_COLLECTION].count_documents({})) == 0
+
+
+def test_unknown_target_format(db):
+    with pytest.raises(ValueError):
+        asyncio.run(migrations.migrate_embedding_storage("float16"))
+
+
+def test_truncate_dimensions(db, originals):
+    summary = asyncio.run(migrations.migrate_embedding_dimensions(16))
+    assert summary == {"migrated": 5, "skipped": 1}
+    chunks = asyncio.run(chunks_by_id(db))
+    for chunk_id, vector in originals.items():
+        truncated = decode_embedding(chunks[chunk_id])
+        assert truncated.shape == (16,)
+        assert np.linalg.norm(truncated) == pytest.approx(1.0, abs=1e-5)
+        np.testing.assert_allclose(truncated, vector[:16] / np.linalg.norm(vector[:16]), rtol=1e-5)
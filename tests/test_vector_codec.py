@@ -0,0 +1,74 @@
+"""Embedding storage formats: encode/decode round-trips and int8 quantization."""
+import numpy as np
+import pytest
+
+from packages.rag.vector_codec import (
+    decode_embedding,
+    encode_embedding,
+    quantize_int8,
+    storage_format_of
+)
+
+
+@pytest.fixture
+def vector():
+    return np.random.default_rng(0).normal(size=256).astype(np.float32)
+
+
+def test_array_round_trip(vector):
+    doc = encode_embedding(vector, "array")
+    assert isinstance(doc["embedding"], list)
+    assert storage_format_of(doc) == "array"
+    np.testing.assert_array_equal(decode_embedding(doc), vector)
+
+
+def test_float32_round_trip_is_exact(vector):
+    doc = encode_embedding(vector, "float32")
+    assert storage_format_of(doc) == "float32"
+    decoded = decode_embedding(doc)
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, vector)
+
+
+def test_float32_round_trip_from_raw_bytes(vector):
+    # Documents read back through the driver may carry plain bytes
+    doc = {"embedding": bytes(encode_embedding(vector, "float32")["embedding"])}
+    np.testing.assert_array_equal(decode_embedding(doc), vector)
+
+
+def test_int8_round_trip_within_half_a_step(vector):
+    doc = encode_embedding(vector, "int8")
+    assert storage_format_of(doc) == "int8"
+    assert len(bytes(doc["embedding"])) == len(vector) + 2  # dtype + padding header
+    decoded = decode_embedding(doc)
+    assert np.max(np.abs(decoded - vector)) <= doc["embeddingScale"] / 2 + 1e-6
+    cosine = decoded @ vector / (np.linalg.norm(decoded) * np.linalg.norm(vector))
+    assert cosine > 0.999
+
+
+def test_quantize_int8_scale_and_offset():
+    quantized, scale, offset = quantize_int8([-1.0, 0.0, 1.0, 3.0])
+    assert offset == pytest.approx(1.0)
+    assert scale == pytest.approx(4.0 / 254)
+    # The extremes map to the ends of the int8 range
+    assert quantized.dtype == np.int8
+    assert quantized[0] == -127 and quantized[-1] == 127
+    np.testing.assert_allclose(quantized * scale + offset, [-1.0, 0.0, 1.0, 3.0], atol=scale / 2)
+
+
+def test_quantize_int8_constant_vector():
+    quantized, scale, offset = quantize_int8([0.5, 0.5, 0.5])
+    assert scale == 1.0
+    assert offset == pytest.approx(0.5)
+    assert not quantized.any()
+
+
+def test_missing_embedding_decodes_to_none():
+    assert decode_embedding({}) is None
+    assert decode_embedding({"embedding": []}) is None
+    assert storage_format_of({"embedding": None}) is None
+
+
+def test_unknown_format_rejected(vector):
+    with pytest.raises(ValueError):
+        encode_embedding(vector, "float16")
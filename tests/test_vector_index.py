@@ -0,0 +1,84 @@
+"""In-process flat vector index: packed storage, swap-remove and search."""
+import numpy as np
+import pytest
+
+from packages.rag.vector_index import FlatVectorIndex, VectorIndex, top_k
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def index():
+    index = FlatVectorIndex(initial_capacity=2)
+    vectors = np.eye(4, dtype=np.float32)
+    index.add(["a", "b", "c", "d"], vectors, [{"docId": f"doc-{i}"} for i in "abcd"])
+    return index
+
+
+def assert_packed(index):
+    """Rows [0, size) hold exactly the indexed ids, in row order."""
+    assert len(index._ids) == index.size == len(index._row_by_id)
+    for row, chunk_id in enumerate(index._ids):
+        assert index._row_by_id[chunk_id] == row
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        VectorIndex()
+
+
+def test_grows_past_initial_capacity(index):
+    assert len(index) == 4
+    assert index._matrix.shape[0] >= 4
+    assert_packed(index)
+
+
+def test_remove_swaps_last_row_into_the_gap(index):
+    assert index.remove(["b"]) == 1
+    assert_packed(index)
+    assert index.ids() == ["a", "d", "c"]
+    # The moved row still carries its own vector and metadata
+    result = index.search(unit(0, 0, 0, 1), k=1)[0]
+    assert result["id"] == "d" and result["docId"] == "doc-d"
+    assert result["score"] == pytest.approx(1.0)
+
+
+def test_remove_last_and_unknown_ids(index):
+    assert index.remove(["d", "zzz", "d"]) == 1
+    assert index.ids() == ["a", "b", "c"]
+    assert_packed(index)
+    assert index.remove(["a", "b", "c"]) == 3
+    assert len(index) == 0
+    assert index.search(unit(1, 0, 0, 0), k=3) == []
+
+
+def test_add_replaces_existing_rows_in_place(index):
+    index.add(["a"], [unit(0, 1, 1, 0)], [{"docId": "new"}])
+    assert len(index) == 4
+    assert index.ids()[0] == "a"
+    results = index.search(unit(0, 1, 1, 0), k=3)
+    assert results[0]["id"] == "a" and results[0]["docId"] == "new"
+
+
+def test_search_orders_by_cosine_and_filters(index):
+    results = index.search([3.0, 2.0, 1.0, 0.0], k=3)
+    assert [r["id"] for r in results] == ["a", "b", "c"]
+    assert results[0]["score"] > results[1]["score"] > results[2]["score"]
+    filtered = index.search([3.0, 2.0, 1.0, 0.0], k=3, allowed_ids=["c", "d", "unknown"])
+    assert [r["id"] for r in filtered] == ["c", "d"]
+
+
+def test_zero_query_and_dimension_mismatch(index):
+    assert index.search([0.0, 0.0, 0.0, 0.0], k=2) == []
+    with pytest.raises(ValueError):
+        index.add(["e"], np.ones((1, 3), dtype=np.float32))
+
+
+def test_top_k():
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+    assert top_k(scores, 2).tolist() == [1, 3]
+    assert top_k(scores, 10).tolist() == [1, 3, 2, 0]
+    assert top_k(scores, 0).size == 0